@@ -12,6 +12,26 @@ from typing import Dict, List, Optional, Tuple
 from .config import HISTORY_DIR, TAIEX_PATH
 from .database import SentimentDB
 from .llm_client import get_reflector_client
+from src.utils.price_store import open_store
+
+_STORE = None
+
+
+def _load_ohlcv(ticker: str) -> Optional[pd.DataFrame]:
+    """讀取個股完整 K 棒 (Date 為 index)，個股走欄式資料庫，TAIEX 讀 CSV"""
+    global _STORE
+    if ticker != "TAIEX":
+        if _STORE is None:
+            _STORE = open_store(sync=True, history_dir=HISTORY_DIR, verbose=False)
+        if _STORE is not None:
+            return _STORE.load_stock(ticker)
+    
+    file_path = TAIEX_PATH if ticker == "TAIEX" else os.path.join(HISTORY_DIR, f"{ticker}.csv")
+    if not os.path.exists(file_path):
+        return None
+    df = pd.read_csv(file_path)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df.set_index('Date').sort_index()
 
 
 # ==================== K 棒型態分析 ====================
@@ -200,18 +220,10 @@ def detect_rsi_divergence(closes: pd.Series, rsi_series: pd.Series, lookback: in
 
 def read_stock_csv(ticker: str, date: str) -> Optional[Dict]:
     """讀取個股 K 棒資料"""
-    if ticker == "TAIEX":
-        file_path = TAIEX_PATH
-    else:
-        file_path = os.path.join(HISTORY_DIR, f"{ticker}.csv")
-    
-    if not os.path.exists(file_path):
-        return None
-    
     try:
-        df = pd.read_csv(file_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df = df.set_index('Date').sort_index()
+        df = _load_ohlcv(ticker)
+        if df is None:
+            return None
         
         target_date = pd.to_datetime(date)
         
@@ -233,18 +245,10 @@ def read_stock_csv(ticker: str, date: str) -> Optional[Dict]:
 
 def get_closes_series(ticker: str, end_date: str, periods: int = 20) -> pd.Series:
     """取得收盤價序列 (用於 RSI 計算)"""
-    if ticker == "TAIEX":
-        file_path = TAIEX_PATH
-    else:
-        file_path = os.path.join(HISTORY_DIR, f"{ticker}.csv")
-    
-    if not os.path.exists(file_path):
-        return pd.Series()
-    
     try:
-        df = pd.read_csv(file_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        df = df.set_index('Date').sort_index()
+        df = _load_ohlcv(ticker)
+        if df is None:
+            return pd.Series()
         
         end_dt = pd.to_datetime(end_date)
         df = df[df.index <= end_dt]
@@ -32,13 +32,21 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 # 設定路徑
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CACHE_FILE = os.path.join(BASE_DIR, "cache", "market_matrix.pkl")
+CACHE_DIR = os.path.join(BASE_DIR, "cache", "market_matrix")
+WEEKLY_CACHE_DIR = os.path.join(BASE_DIR, "cache", "market_matrix_weekly")
 DATA_FOLDER = os.path.join(BASE_DIR, "data_core", "history")
 META_FOLDER = os.path.join(BASE_DIR, "data_core", "market_meta")
 
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from utils.price_store import open_store, sync_store
+from utils.matrix_cache import load_matrix_cache
+from utils.indicators import iso_week_starts, week_end_rows, resample_weekly
+
 # 全域變數
 DF_MANSFIELD_PR = None
 DF_IBD_PR = None
+WEEKLY_MATRIX = None
 STOCK_NAME_TO_ID = {} 
 STOCK_ID_TO_NAME = {} 
 
@@ -110,32 +118,22 @@ def build_stock_name_map():
         print(f"❌ 建立索引失敗: {e}")
 
 def initialize_market_matrix():
-    global DF_MANSFIELD_PR, DF_IBD_PR
+    global DF_MANSFIELD_PR, DF_IBD_PR, WEEKLY_MATRIX
     
     build_stock_name_map()
     
-    # 讀取 Cache
-    # 讀取 Cache
-    # 嘗試兩個位置: 1. 當前目錄 (src) 2. 上一層 (舊容錯)
-    possible_paths = [
-        os.path.join(BASE_DIR, "cache", "market_matrix.pkl"),
-        os.path.join(BASE_DIR, "market_matrix.pkl"),
-        os.path.join(BASE_DIR, "..", "market_matrix.pkl")
-    ]
+    # 周線快取 (optimize_matrix 產生，週線圖直接查表)
+    WEEKLY_MATRIX = load_matrix_cache(WEEKLY_CACHE_DIR)
     
-    cache_file = None
-    for p in possible_paths:
-        if os.path.exists(p):
-            cache_file = p
-            break
-            
-    if cache_file:
+    # 讀取 Cache (只 memory-map 用到的兩個 PR 指標)
+    data = load_matrix_cache(CACHE_DIR)
+    if data is not None:
         try:
-            import pickle
-            with open(cache_file, 'rb') as f:
-                data = pickle.load(f)
-                DF_MANSFIELD_PR = data.get('mansfield_pr')
-                DF_IBD_PR = data.get('ibd_pr')
+            DF_MANSFIELD_PR = data.get('mansfield_pr')
+            DF_IBD_PR = data.get('ibd_pr')
+            status = data.validate(keys=['mansfield_pr', 'ibd_pr'])
+            if not status:
+                print(f"⚠️ 快取與資料不同步 ({status.summary()})，PR 排名可能過期")
             print("✅ 快取載入成功！")
             return
         except: pass
@@ -144,41 +142,106 @@ def initialize_market_matrix():
 
 # --- 資料讀取與計算 ---
 
+_PRICE_STORE = None
+
+
+def get_price_store():
+    """取得欄式價量資料庫 (CSV 有更新時自動重新同步)"""
+    global _PRICE_STORE
+    if _PRICE_STORE is None:
+        _PRICE_STORE = open_store(sync=True, history_dir=DATA_FOLDER)
+        return _PRICE_STORE
+    # 先同步有變動的 CSV (沒有變動時只是一輪 stat)，再以 generation 判斷是否重新開啟
+    try:
+        sync_store(DATA_FOLDER, verbose=False)
+    except Exception as e:
+        print(f"⚠️ 價量資料庫同步失敗: {e}")
+    if _PRICE_STORE.is_stale():
+        _PRICE_STORE = open_store(sync=False, history_dir=DATA_FOLDER)
+    return _PRICE_STORE
+
+
+def weekly_from_cache(data_id, daily_index):
+    """
+    從周線快取取出單檔週線 OHLCV (daily_index：該股票日線的日期)；
+    快取沒有此股票、尚未更新到最後一個交易日
+    或此股票的 CSV 在建置後有變動 (manifest 不符) 時回傳 None
+
+    只保留實際有交易的週 (days > 0)，index 改為該股票每週最後一個交易日，與 resample_iso_weekly 相同
+    """
+    global WEEKLY_MATRIX
+    last_date = daily_index[-1]
+    for attempt in range(2):
+        data = WEEKLY_MATRIX
+        if (data is not None and 'days' in data and data_id in data.codes and len(data.dates)
+                and data.dates[-1] >= last_date
+                and data.validate(keys=[], codes=[data_id], inputs=False)):
+            df = pd.DataFrame({
+                'Open': data['open'][data_id], 'High': data['bar_high'][data_id],
+                'Low': data['bar_low'][data_id], 'Close': data['close'][data_id],
+                'Volume': data['volume'][data_id],
+            }).astype('float64')
+            df.index.name = 'Date'
+            # 保留到 last_date 所在的那一週，去掉整週停牌 (前向填充) 的週
+            df = df.iloc[:df.index.searchsorted(last_date) + 1]
+            days = data['days'][data_id].iloc[:len(df)].to_numpy()
+            df = df[days > 0]
+            starts = iso_week_starts(daily_index)
+            if len(starts) != len(df):
+                return None
+            df.index = daily_index[week_end_rows(starts, len(daily_index))]
+            return df.dropna()
+        if attempt == 0:
+            # 快取可能已被 optimize_matrix 更新，重新開啟一次
+            WEEKLY_MATRIX = load_matrix_cache(WEEKLY_CACHE_DIR)
+    return None
+
+
+def resample_iso_weekly(df):
+    """單檔日線轉週線 (ISO 周次，與周線快取相同的分組；index 為每週最後一個交易日)"""
+    starts = iso_week_starts(df.index)
+    values = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values[:, 3:4])
+    out = pd.DataFrame({
+        col: resample_weekly(values[:, [i]], starts, how=how, valid=valid)[:, 0]
+        for i, (col, how) in enumerate([('Open', 'first'), ('High', 'max'), ('Low', 'min'),
+                                         ('Close', 'last'), ('Volume', 'sum')])
+    }, index=df.index[week_end_rows(starts, len(df))])
+    return out.dropna()
+
+
 def fetch_local_data(data_id, time_frame='D'):
     """
-    從本地 CSV 讀取資料
+    從本地價量資料庫讀取資料 (Meta 資料如 TAIEX 仍讀 CSV)
     time_frame: 'D' (日線) or 'W' (週線)
     """
 
-    local_path = os.path.join(DATA_FOLDER, f"{data_id}.csv")
-    if not os.path.exists(local_path):
-        # 嘗試從 Meta 資料夾找 (例如 TAIEX)
-        local_path = os.path.join(META_FOLDER, f"{data_id}.csv")
-        if not os.path.exists(local_path):
-            return None
-
     try:
-        df = pd.read_csv(local_path)
-        df['Date'] = pd.to_datetime(df['Date'])
-        # 確保格式
-        expected_cols = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
-        if not all(c in df.columns for c in expected_cols): return None
-        
-        df = df.set_index('Date').sort_index()
-        df = df[~df.index.duplicated(keep='last')] # 去重
+        store = get_price_store()
+        if store is not None and data_id in store:
+            df = store.load_stock(data_id)
+        else:
+            # 嘗試從 Meta 資料夾找 (例如 TAIEX)
+            local_path = os.path.join(META_FOLDER, f"{data_id}.csv")
+            if not os.path.exists(local_path):
+                return None
+            df = pd.read_csv(local_path)
+            df['Date'] = pd.to_datetime(df['Date'])
+            # 確保格式
+            expected_cols = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+            if not all(c in df.columns for c in expected_cols): return None
+
+            df = df.set_index('Date').sort_index()
+            df = df[~df.index.duplicated(keep='last')] # 去重
+        if df is None or df.empty:
+            return None
 
         # ★ 週線處理 ★
         if time_frame == 'W':
-            # Resample to Weekly (Ending Friday)
-            df_weekly = df.resample('W-FRI').agg({
-                'Open': 'first',
-                'High': 'max',
-                'Low': 'min',
-                'Close': 'last',
-                'Volume': 'sum'
-            })
-            # 移除當週還沒開盤的空資料 (若有)
-            df_weekly = df_weekly.dropna()
+            # 優先查周線快取 (ISO 周次)，快取沒有或過期時才現場聚合
+            df_weekly = weekly_from_cache(data_id, df.index)
+            if df_weekly is None or df_weekly.empty:
+                df_weekly = resample_iso_weekly(df)
             return df_weekly
         
         return df
@@ -28,8 +28,12 @@ sys.path.insert(0, UTILS_DIR)
 sys.path.insert(0, SRC_DIR)
 
 # 導入模組
-from utils.data_loader import load_stock_data, load_sector_cmoney_data, load_sector_member_mapping
+from utils.data_loader import (
+    load_stock_data, load_sector_cmoney_data, load_sector_member_mapping,
+    latest_trading_day, list_cmoney_dates
+)
 from utils.cmoney_scorer import process_cmoney_rankings
+from utils.tag_manager import TagIndex
 from utils.cmoney_html import generate_institutional_report_html, generate_fund_margin_report_html
 
 # Telegram
@@ -111,6 +115,81 @@ def send_telegram_report(image_path: str, caption: str = "") -> bool:
         return False
 
 
+def score_cmoney_day(stock_df: pd.DataFrame, cmoney_df: pd.DataFrame, sector_mapping, params: dict = None) -> dict:
+    """
+    單日 8 維度評分 (純計算，不爬蟲、不讀檔、不產生報表)
+
+    Args:
+        stock_df: 個股快照 (load_stock_data)
+        cmoney_df: CMoney 族群資料 (load_sector_cmoney_data)
+        sector_mapping: 族群成員映射 {sector_name: [codes]} 或 TagIndex
+        params: 覆寫評分參數 (見 cmoney_scorer.DEFAULT_PARAMS)
+
+    Returns:
+        dict: 同 process_cmoney_rankings
+    """
+    if isinstance(sector_mapping, TagIndex):
+        sector_mapping = sector_mapping.to_mapping()
+    return process_cmoney_rankings(cmoney_df, sector_mapping, stock_df, params=params)
+
+
+def replay_cmoney_strategy(dates=None, start: str = None, end: str = None, sector_mapping=None,
+                           stock_frames: dict = None, cmoney_frames: dict = None, params: dict = None) -> dict:
+    """
+    歷史回放：同一程序內對多個日期評分 (不爬蟲；價量資料庫、族群映射只載入一次)
+
+    Args:
+        dates: 日期列表 (YYYY-MM-DD)；None 表示 start ~ end 之間所有已有 CMoney 資料的日期
+        start, end: 日期區間 (含頭含尾)
+        sector_mapping: 預先載入的族群映射或 TagIndex (None 則讀取 cmoney_all_tags)
+        stock_frames / cmoney_frames: 預先載入的 {date: DataFrame}，缺少的日期才讀取
+        params: 覆寫評分參數 (見 cmoney_scorer.DEFAULT_PARAMS)
+
+    Returns:
+        dict: {date: process_cmoney_rankings 結果}；缺個股或 CMoney 資料的日期略過
+    """
+    if dates is None:
+        dates = list_cmoney_dates(start, end)
+    if sector_mapping is None:
+        sector_mapping = load_sector_member_mapping()
+    if isinstance(sector_mapping, TagIndex):
+        sector_mapping = sector_mapping.to_mapping()
+    stock_frames = stock_frames or {}
+    cmoney_frames = cmoney_frames or {}
+    available = set(list_cmoney_dates())
+
+    replay = {}
+    for date_str in dates:
+        stock_df = stock_frames.get(date_str)
+        if stock_df is None:
+            stock_df = load_stock_data(date_str, top_n=150, verbose=False)
+        cmoney_df = cmoney_frames.get(date_str)
+        if cmoney_df is None and date_str in available:
+            cmoney_df = load_sector_cmoney_data(date_str, verbose=False)
+        if stock_df.empty or cmoney_df is None or cmoney_df.empty:
+            print(f"⚠️ {date_str} 缺少個股或 CMoney 資料，略過")
+            continue
+        replay[date_str] = score_cmoney_day(stock_df, cmoney_df, sector_mapping, params=params)
+    return replay
+
+
+def rankings_frame(replay: dict) -> pd.DataFrame:
+    """把回放結果攤平成一列一個 (日期, 維度, 族群) 的表格，方便比較不同參數"""
+    rows = []
+    for date_str, results in replay.items():
+        for group, dims in results.items():
+            for dim, items in dims.items():
+                for item in items:
+                    score = item['score']
+                    rows.append({
+                        'date': date_str, 'group': group, 'dimension': dim, 'sector': item['sector'],
+                        'rank': score['rank'], 'top100_ratio': score['top100_ratio'],
+                        'base_score': score['base_score'], 'final_score': score['final_score'],
+                        'top3': ' '.join(s['code'] for s in item['top3']),
+                    })
+    return pd.DataFrame(rows)
+
+
 def run_cmoney_strategy(date_str: str = None, send_telegram: bool = True) -> dict:
     """
     執行 CMoney 雙圖報表策略
@@ -127,20 +206,12 @@ def run_cmoney_strategy(date_str: str = None, send_telegram: bool = True) -> dic
     print("=" * 50)
     
     if date_str is None:
-        # 自動偵測最新有效交易日（避免 Pipeline 寫入的非交易日假資料）
+        # 自動偵測最新有效交易日（避免 Pipeline 寫入的非交易日假資料，由價量資料庫判斷）
         try:
-            ref_csv = os.path.join(SRC_DIR, "data_core", "history", "2330.csv")
-            ref_df = pd.read_csv(ref_csv)
-            ref_df['Date'] = pd.to_datetime(ref_df['Date'])
-            ref_df = ref_df.sort_values('Date')
-            # 找最後一個「收盤價與前日不同」的日期 = 真正的交易日
-            ref_df['prev_close'] = ref_df['Close'].shift(1)
-            valid = ref_df[ref_df['Close'] != ref_df['prev_close']]
-            if not valid.empty:
-                date_str = valid.iloc[-1]['Date'].strftime('%Y-%m-%d')
-                print(f"📅 自動偵測最新有效交易日: {date_str}")
-            else:
-                date_str = ref_df.iloc[-1]['Date'].strftime('%Y-%m-%d')
+            date_str = latest_trading_day()
+            if date_str is None:
+                raise ValueError("找不到參考股票 2330")
+            print(f"📅 自動偵測最新有效交易日: {date_str}")
         except Exception as e:
             date_str = datetime.now().strftime('%Y-%m-%d')
             print(f"⚠️ 無法自動偵測交易日 ({e})，使用今天: {date_str}")
@@ -186,7 +257,7 @@ def run_cmoney_strategy(date_str: str = None, send_telegram: bool = True) -> dic
     
     # 5. 計算 8 維度評分
     print("\n📊 計算 8 維度評分...")
-    results = process_cmoney_rankings(cmoney_df, sector_mapping, stock_df)
+    results = score_cmoney_day(stock_df, cmoney_df, sector_mapping)
     
     # 輸出統計
     inst = results.get('institutional', {})
@@ -245,9 +316,26 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='CMoney 雙圖報表策略')
     parser.add_argument('--date', type=str, default=None, help='分析日期 (YYYY-MM-DD)')
     parser.add_argument('--no-telegram', action='store_true', help='不發送 Telegram')
+    parser.add_argument('--replay', nargs=2, metavar=('START', 'END'), default=None,
+                        help='歷史回放 (不爬蟲、不產生圖片)，結果寫入 output/cmoney_replay_START_END.csv')
     
     args = parser.parse_args()
     
+    if args.replay:
+        import time
+        t0 = time.time()
+        replay = replay_cmoney_strategy(start=args.replay[0], end=args.replay[1])
+        if not replay:
+            print("❌ 區間內沒有可回放的日期")
+            sys.exit(1)
+        output_dir = os.path.join(SCRIPT_DIR, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        first, last = min(replay).replace('-', ''), max(replay).replace('-', '')
+        out_path = os.path.join(output_dir, f"cmoney_replay_{first}_{last}.csv")
+        rankings_frame(replay).to_csv(out_path, index=False, encoding='utf-8-sig')
+        print(f"✅ 回放 {len(replay)} 個交易日 ({time.time() - t0:.2f}s)，結果: {out_path}")
+        sys.exit(0)
+    
     result = run_cmoney_strategy(
         date_str=args.date,
         send_telegram=not args.no_telegram
@@ -25,6 +25,15 @@ import pandas as pd
 BASE_SCORE = 100  # 滿分
 RANK_DECAY = 5    # 每名遞減分數
 MAX_RANK = 20     # 最大排名
+TOP_N = 20        # 每個維度取前 N 個族群
+
+# 預設評分參數 (回放調參時以 params 覆寫部分鍵值)
+DEFAULT_PARAMS = {
+    'base_score': BASE_SCORE,
+    'rank_decay': RANK_DECAY,
+    'max_rank': MAX_RANK,
+    'top_n': TOP_N,
+}
 
 
 def get_sector_stocks(sector_name: str, sector_mapping: dict) -> list:
@@ -50,14 +59,15 @@ def get_sector_stocks(sector_name: str, sector_mapping: dict) -> list:
     return []
 
 
-def calculate_rank_score(rank: int) -> float:
+def calculate_rank_score(rank: int, params: dict = None) -> float:
     """計算排名基礎分數"""
+    p = DEFAULT_PARAMS if params is None else {**DEFAULT_PARAMS, **params}
     if rank < 1:
         rank = 1
-    if rank > MAX_RANK:
-        rank = MAX_RANK
+    if rank > p['max_rank']:
+        rank = p['max_rank']
     
-    return BASE_SCORE - (rank - 1) * RANK_DECAY
+    return p['base_score'] - (rank - 1) * p['rank_decay']
 
 
 def calculate_top100_ratio(sector_stocks: list, top100_stocks: list) -> float:
@@ -102,9 +112,9 @@ def get_top3_gainers(sector_stocks: list, stock_df: pd.DataFrame) -> list:
     return result
 
 
-def score_dimension(rank: int, top100_ratio: float, dimension: str) -> dict:
+def score_dimension(rank: int, top100_ratio: float, dimension: str, params: dict = None) -> dict:
     """通用評分函數"""
-    base_score = calculate_rank_score(rank)
+    base_score = calculate_rank_score(rank, params)
     final_score = base_score * top100_ratio
     
     return {
@@ -116,10 +126,14 @@ def score_dimension(rank: int, top100_ratio: float, dimension: str) -> dict:
     }
 
 
-def process_cmoney_rankings(cmoney_df: pd.DataFrame, sector_mapping: dict, stock_df: pd.DataFrame) -> dict:
+def process_cmoney_rankings(cmoney_df: pd.DataFrame, sector_mapping: dict, stock_df: pd.DataFrame,
+                            params: dict = None) -> dict:
     """
     處理 CMoney 資料並計算 8 維度評分（分為法人走向和資金融資券）
     
+    Args:
+        params: 覆寫評分參數 (見 DEFAULT_PARAMS)，回放調參用
+    
     Returns:
         dict: {
             'institutional': {
@@ -143,6 +157,7 @@ def process_cmoney_rankings(cmoney_df: pd.DataFrame, sector_mapping: dict, stock
         }
     
     top100_stocks = stock_df[stock_df['is_top100']]['code'].astype(str).tolist() if not stock_df.empty else []
+    top_n = (params or {}).get('top_n', TOP_N)
     
     results = {
         'institutional': {'inst_total': [], 'foreign': [], 'trust': [], 'dealer': []},
@@ -158,14 +173,14 @@ def process_cmoney_rankings(cmoney_df: pd.DataFrame, sector_mapping: dict, stock
         # 轉換為數值
         dim_df[sort_col] = pd.to_numeric(dim_df[sort_col].astype(str).str.replace(',', ''), errors='coerce')
         dim_df = dim_df[dim_df[sort_col].notna() & (dim_df[sort_col] != 0)]
-        dim_df = dim_df.sort_values(sort_col, ascending=ascending).head(20)
+        dim_df = dim_df.sort_values(sort_col, ascending=ascending).head(top_n)
         
         dim_results = []
         for rank, (_, row) in enumerate(dim_df.iterrows(), 1):
             sector_name = row['SectorName']
             sector_stocks = get_sector_stocks(sector_name, sector_mapping)
             top100_ratio = calculate_top100_ratio(sector_stocks, top100_stocks)
-            score = score_dimension(rank, top100_ratio, dim_name)
+            score = score_dimension(rank, top100_ratio, dim_name, params)
             top3 = get_top3_gainers(sector_stocks, stock_df)
             
             dim_results.append({
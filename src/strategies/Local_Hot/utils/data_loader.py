@@ -4,6 +4,7 @@
 """
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -13,10 +14,99 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 SECTOR_DIR = os.path.dirname(SCRIPT_DIR)
 STRATEGIES_DIR = os.path.dirname(SECTOR_DIR)
 SRC_DIR = os.path.dirname(STRATEGIES_DIR)
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
 DATA_CORE_DIR = os.path.join(SRC_DIR, "data_core")
 HISTORY_DIR = os.path.join(DATA_CORE_DIR, "history")
 MARKET_META_DIR = os.path.join(DATA_CORE_DIR, "market_meta")
 
+# 本策略的 utils 與 src/utils 同名，改由專案根目錄匯入共用模組
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+from src.utils.price_store import open_store
+from src.utils.sector_archive import open_archive, sync_archive
+
+_STORE = None
+_ARCHIVE = None
+_NAME_MAP = None
+
+
+def get_price_store():
+    """取得欄式價量資料庫 (同一程序只開啟一次)"""
+    global _STORE
+    if _STORE is None:
+        _STORE = open_store(sync=True, history_dir=HISTORY_DIR)
+    return _STORE
+
+
+def get_sector_archive():
+    """
+    取得 CMoney 族群資金動能歷史庫
+
+    每次呼叫都先同步 market_meta (只 stat 檔案)，爬蟲在同一程序中寫入的新 CSV 也會被讀到
+    """
+    global _ARCHIVE
+    if _ARCHIVE is not None:
+        try:
+            sync_archive(MARKET_META_DIR)
+        except Exception as e:
+            print(f"⚠️ 族群資金動能歷史庫同步失敗: {e}")
+        if not _ARCHIVE.is_stale():
+            return _ARCHIVE
+    _ARCHIVE = open_archive(sync=True, meta_dir=MARKET_META_DIR)
+    return _ARCHIVE
+
+
+def get_name_map():
+    """股票代碼 → 名稱 (master_stock_tags.csv，同一程序只讀一次)"""
+    global _NAME_MAP
+    if _NAME_MAP is None:
+        tags_file = os.path.join(MARKET_META_DIR, "master_stock_tags.csv")
+        name_map = {}
+        if os.path.exists(tags_file):
+            tags_df = pd.read_csv(tags_file, encoding='utf-8-sig')
+            tags_df['Code'] = tags_df['Code'].astype(str)
+            name_map = dict(zip(tags_df['Code'], tags_df['Name']))
+        _NAME_MAP = name_map
+    return _NAME_MAP
+
+
+def latest_trading_day(ref_code="2330"):
+    """
+    最新有效交易日 (避免 Pipeline 寫入的非交易日假資料)：
+    參考股票最後一個「收盤價與前日不同」的日期
+
+    Returns:
+        str: YYYY-MM-DD；沒有參考股票資料時回傳 None
+    """
+    store = get_price_store()
+    if store is None or ref_code not in store:
+        return None
+    close = store.load_stock(ref_code)['Close']
+    valid = close[close != close.shift(1)]
+    last = valid.index[-1] if not valid.empty else close.index[-1]
+    return last.strftime('%Y-%m-%d')
+
+
+def list_cmoney_dates(start=None, end=None):
+    """
+    已有 CMoney 族群資料的日期 (由舊到新)
+
+    Args:
+        start, end: 日期區間 (含頭含尾，YYYY-MM-DD 或 YYYY/MM/DD)
+
+    Returns:
+        list: ['YYYY-MM-DD', ...]
+    """
+    archive = get_sector_archive()
+    if archive is None:
+        return []
+    dates = [d.strftime('%Y-%m-%d') for d in archive.dates]
+    if start:
+        dates = [d for d in dates if d >= start.replace('/', '-')]
+    if end:
+        dates = [d for d in dates if d <= end.replace('/', '-')]
+    return dates
+
 
 def get_trading_dates(end_date, lookback=10):
     """
@@ -29,33 +119,31 @@ def get_trading_dates(end_date, lookback=10):
     Returns:
         list: 日期列表（由舊到新）
     """
-    ref_file = os.path.join(HISTORY_DIR, "2330.csv")
-    if not os.path.exists(ref_file):
-        print(f"⚠️ 找不到參考檔案: {ref_file}")
+    store = get_price_store()
+    if store is None or "2330" not in store:
+        print("⚠️ 找不到參考股票資料: 2330")
         return []
     
     try:
-        df = pd.read_csv(ref_file)
-        df['Date'] = pd.to_datetime(df['Date'])
-        
         if isinstance(end_date, str):
             end_date = pd.to_datetime(end_date.replace('/', '-'))
         
-        df = df[df['Date'] <= end_date].sort_values('Date')
-        dates = df['Date'].tail(lookback).dt.strftime('%Y-%m-%d').tolist()
+        df = store.load_stock("2330", end=end_date)
+        dates = df.index[-lookback:].strftime('%Y-%m-%d').tolist()
         return dates
     except Exception as e:
         print(f"⚠️ 取得交易日曆錯誤: {e}")
         return []
 
 
-def load_stock_data(date_str, top_n=150):
+def load_stock_data(date_str, top_n=150, verbose=True):
     """
     載入指定日期的個股行情資料並計算基礎指標
     
     Args:
         date_str: 交易日期，格式 "YYYY/MM/DD" 或 "YYYY-MM-DD"
         top_n: 取成交金額前 N 名
+        verbose: 是否印出載入訊息 (回放多個日期時關閉)
         
     Returns:
         pd.DataFrame: 個股快照資料
@@ -69,85 +157,36 @@ def load_stock_data(date_str, top_n=150):
         print("⚠️ 交易日資料不足")
         return pd.DataFrame()
     
-    # 掃描所有股票檔案
-    results = []
-    stock_files = [f for f in os.listdir(HISTORY_DIR) if f.endswith('.csv') and f[:-4].isdigit()]
-    
-    for filename in stock_files:
-        code = filename[:-4]
-        filepath = os.path.join(HISTORY_DIR, filename)
-        
-        try:
-            df = pd.read_csv(filepath)
-            if df.empty or len(df) < 2:
-                continue
-            
-            df['Date'] = pd.to_datetime(df['Date'])
-            df = df.sort_values('Date')
-            
-            # 取得目標日資料
-            row = df[df['Date'] == target_date]
-            if row.empty:
-                continue
-            
-            row = row.iloc[-1]
-            
-            # 取得前一日資料
-            prev_df = df[df['Date'] < target_date].tail(1)
-            if prev_df.empty:
-                continue
-            yesterday = prev_df.iloc[-1]
-            
-            # 計算 5 日均量
-            recent = df[df['Date'] <= target_date].tail(6)
-            if len(recent) >= 2:
-                avg_volume_5d = recent['Volume'].iloc[:-1].mean()  # 不含今日
-            else:
-                avg_volume_5d = row['Volume']
-            
-            # 計算指標
-            close = float(row['Close'])
-            high = float(row['High'])
-            low = float(row['Low'])
-            volume = float(row['Volume'])
-            yesterday_close = float(yesterday['Close'])
-            
-            # 成交金額（估算：收盤價 * 成交量）
-            amount = close * volume
-            
-            # 漲跌幅
-            change_pct = ((close - yesterday_close) / yesterday_close) * 100 if yesterday_close > 0 else 0
-            
-            # 量比
-            volume_ratio = volume / avg_volume_5d if avg_volume_5d > 0 else 1.0
-            
-            # 收盤強度
-            close_strength = close / high if high > 0 else 0
-            
-            results.append({
-                'code': code,
-                'close': close,
-                'high': high,
-                'low': low,
-                'volume': volume,
-                'amount': amount,
-                'yesterday_close': yesterday_close,
-                'change': change_pct,
-                'change_pct': change_pct / 100,
-                'avg_volume_5d': avg_volume_5d,
-                'volume_ratio': volume_ratio,
-                'close_strength': close_strength,
-                'is_up': change_pct > 0,
-                'is_strong_close': close_strength >= 0.90
-            })
-            
-        except Exception as e:
-            continue
+    store = get_price_store()
+    if store is None:
+        print("⚠️ 無法開啟價量資料庫")
+        return pd.DataFrame()
     
-    if not results:
+    # 全市場單日快照 (一次向量化切片：當日列、前一列、5 日均量)
+    stock_codes = [c for c in store.codes if c.isdigit()]
+    snap = store.snapshot(target_date, codes=stock_codes, avg_window=5)
+    if snap.empty:
         return pd.DataFrame()
     
-    df_result = pd.DataFrame(results)
+    change_pct = snap['change'].to_numpy()
+    close_strength = snap['close_strength'].to_numpy()
+    df_result = pd.DataFrame({
+        'code': snap.index.to_numpy(),
+        'close': snap['close'].to_numpy(),
+        'high': snap['high'].to_numpy(),
+        'low': snap['low'].to_numpy(),
+        'volume': snap['volume'].to_numpy(),
+        # 成交金額（估算：收盤價 * 成交量）
+        'amount': (snap['close'] * snap['volume']).to_numpy(),
+        'yesterday_close': snap['prev_close'].to_numpy(),
+        'change': change_pct,
+        'change_pct': change_pct / 100,
+        'avg_volume_5d': snap['avg_volume'].to_numpy(),
+        'volume_ratio': snap['volume_ratio'].to_numpy(),
+        'close_strength': close_strength,
+        'is_up': change_pct > 0,
+        'is_strong_close': close_strength >= 0.90
+    })
     
     # 按成交金額排序，取前 top_n 名
     df_result = df_result.sort_values('amount', ascending=False).head(top_n).reset_index(drop=True)
@@ -158,69 +197,61 @@ def load_stock_data(date_str, top_n=150):
     
     # 載入股票名稱
     try:
-        tags_file = os.path.join(MARKET_META_DIR, "master_stock_tags.csv")
-        if os.path.exists(tags_file):
-            tags_df = pd.read_csv(tags_file, encoding='utf-8-sig')
-            tags_df['Code'] = tags_df['Code'].astype(str)
-            name_map = dict(zip(tags_df['Code'], tags_df['Name']))
+        name_map = get_name_map()
+        if name_map:
             df_result['name'] = df_result['code'].map(name_map).fillna('')
-            print(f"   股票名稱載入: {df_result['name'].notna().sum()} 支")
+            if verbose:
+                print(f"   股票名稱載入: {df_result['name'].notna().sum()} 支")
     except Exception as e:
         df_result['name'] = ''
         print(f"⚠️ 載入股票名稱失敗: {e}")
     
-    print(f"📊 載入 {len(df_result)} 支股票資料 (Top {top_n} by 成交金額)")
-    print(f"   其中 Top 100: {df_result['is_top100'].sum()} 支")
+    if verbose:
+        print(f"📊 載入 {len(df_result)} 支股票資料 (Top {top_n} by 成交金額)")
+        print(f"   其中 Top 100: {df_result['is_top100'].sum()} 支")
     return df_result
 
 
-def load_sector_cmoney_data(date_str=None):
+def load_sector_cmoney_data(date_str=None, verbose=True):
     """
     載入 CMoney 族群總表資料
     
     Args:
         date_str: 指定日期，None 則自動抓最新檔案
+        verbose: 是否印出載入訊息
         
     Returns:
         pd.DataFrame: CMoney 族群資料
     """
-    # 掃描檔案
-    files = [f for f in os.listdir(MARKET_META_DIR) 
-             if f.startswith("sector_momentum_") and f.endswith(".csv")]
-    
-    if not files:
+    archive = get_sector_archive()
+    if archive is None or not len(archive.dates):
         print("❌ 找不到 CMoney 族群資料檔案")
         return pd.DataFrame()
     
-    # 按日期排序，取最新
-    files.sort(reverse=True)
-    
-    if date_str:
-        # 嘗試匹配指定日期
-        date_key = date_str.replace('/', '').replace('-', '')
-        matched = [f for f in files if date_key in f]
-        if matched:
-            target_file = matched[0]
-        else:
-            target_file = files[0]
-    else:
-        target_file = files[0]
+    # 指定日期不存在時使用最新一日
+    target_date = archive.last_date
+    if date_str and date_str.replace('/', '-') in archive:
+        target_date = pd.Timestamp(date_str.replace('/', '-'))
     
-    filepath = os.path.join(MARKET_META_DIR, target_file)
-    print(f"📂 載入 CMoney 資料: {target_file}")
+    if verbose:
+        print(f"📂 載入 CMoney 資料: {target_date.strftime('%Y-%m-%d')} (族群資金動能歷史庫)")
     
     try:
-        df = pd.read_csv(filepath, encoding='utf-8-sig')
+        df = archive.load_day(target_date)
+        if df.empty:
+            print(f"❌ 載入 CMoney 資料錯誤: {target_date.strftime('%Y-%m-%d')} 無資料")
+            return pd.DataFrame()
         
         # 過濾集團關鍵字
         df = df[~df['SectorName'].str.contains('集團', na=False)]
         
-        # 標準化欄位
+        # 標準化欄位 (歷史庫已是數值，缺值補 0)
         for col in ['FundFlow', 'TurnoverChange', 'MarginChange', 'ShortChange', 'PriceChange']:
             if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+                df[col] = df[col].fillna(0)
         
-        print(f"   族群數: {len(df)}")
+        if verbose:
+            print(f"   族群數: {len(df)}")
         return df
         
     except Exception as e:
@@ -7,36 +7,24 @@ import pandas as pd
 import numpy as np
 
 
-def calculate_sector_metrics(sector_name, member_codes, stock_df, cmoney_row=None):
-    """
-    計算單一族群的完整統計指標
-    
-    Args:
-        sector_name: 族群名稱
-        member_codes: 成員股票代碼列表
-        stock_df: 個股快照資料（來自 load_stock_data）
-        cmoney_row: CMoney 該族群的資料 (pd.Series, 可選)
-        
-    Returns:
-        dict: SectorMetrics 結構
-    """
-    # 篩選成員股（進榜的）
-    member_df = stock_df[stock_df['code'].isin(member_codes)]
-    
-    total_stocks = len(member_codes)
-    active_stocks = len(member_df)
-    active_ratio = active_stocks / total_stocks if total_stocks > 0 else 0
-    
-    # 計算 Top 50 數量
-    top50_count = int(member_df['is_top50'].sum()) if 'is_top50' in member_df.columns else 0
-    
-    # 預設值
-    metrics = {
+# 量比門檻 (爆量)
+SURGE_VOLUME_RATIO = 1.5
+
+# 成員股列表的欄位與缺欄時的預設值 (None 表示必要欄位)
+MEMBER_FIELDS = {
+    'code': None, 'name': '', 'close': None, 'change': None, 'volume_ratio': None,
+    'is_up': None, 'is_strong_close': None, 'is_top50': False, 'amount_rank': 999,
+}
+
+
+def _empty_metrics(sector_name, total_stocks):
+    """族群指標的預設值 (沒有進榜股票時)"""
+    return {
         'sector_name': sector_name,
         'total_stocks': total_stocks,
-        'active_stocks': active_stocks,
-        'active_ratio': active_ratio,
-        'top50_count': top50_count,
+        'active_stocks': 0,
+        'active_ratio': 0,
+        'top50_count': 0,
         
         # 漲跌同步性
         'up_count': 0,
@@ -66,64 +54,163 @@ def calculate_sector_metrics(sector_name, member_codes, stock_df, cmoney_row=Non
         # 成員股列表
         'member_stocks': []
     }
-    
-    if active_stocks == 0:
-        # 即使沒有進榜股票，仍需填入 CMoney 數據
+
+
+def _fill_cmoney(metrics, cmoney_row):
+    """填入 CMoney 資金數據 (cmoney_row 為 Series 或 dict)"""
+    metrics['fund_flow'] = float(cmoney_row.get('FundFlow', 0) or 0)
+    metrics['turnover_change'] = float(cmoney_row.get('TurnoverChange', 0) or 0)
+    metrics['margin_change'] = float(cmoney_row.get('MarginChange', 0) or 0)
+    metrics['short_change'] = float(cmoney_row.get('ShortChange', 0) or 0)
+    metrics['cmoney_price_change'] = float(cmoney_row.get('PriceChange', 0) or 0)
+
+
+def build_membership(sector_mapping, stock_df):
+    """
+    族群 × 進榜個股的稀疏成員矩陣 (COO：每個非零元素為一組 (族群編號, stock_df 列號))
+
+    Args:
+        sector_mapping: {sector_name: [codes]}
+        stock_df: 個股快照資料
+
+    Returns:
+        (names, totals, sector_ids, rows)：族群名稱、各族群成員數 (含未進榜)、
+        依族群編號再依 stock_df 順序排列的成員對
+    """
+    names, totals, pair_sector, pair_code = [], [], [], []
+    for sector_name, member_codes in sector_mapping.items():
+        sid = len(names)
+        names.append(sector_name)
+        totals.append(len(member_codes))
+        unique_codes = list(dict.fromkeys(member_codes))
+        pair_code.extend(unique_codes)
+        pair_sector.extend([sid] * len(unique_codes))
+
+    pairs = pd.DataFrame({'sid': np.asarray(pair_sector, dtype=np.int64), 'code': pd.Series(pair_code, dtype=object)})
+    rows = pd.DataFrame({'code': stock_df['code'].to_numpy(dtype=object), 'row': np.arange(len(stock_df))})
+    pairs = pairs.merge(rows, on='code', how='inner')
+    sector_ids = pairs['sid'].to_numpy()
+    row_ids = pairs['row'].to_numpy()
+    order = np.lexsort((row_ids, sector_ids))
+    return names, np.asarray(totals), sector_ids[order], row_ids[order]
+
+
+def compute_sector_metrics(stock_df, sector_mapping, cmoney_index=None):
+    """
+    一次計算所有族群的統計指標 (成員矩陣 + bincount / groupby，不逐族群篩選 stock_df)
+
+    Args:
+        stock_df: 個股快照資料（來自 load_stock_data）
+        sector_mapping: 族群成員映射 {sector_name: [codes]}
+        cmoney_index: {sector_name: CMoney 該族群的資料 (Series 或 dict)}，可選
+
+    Returns:
+        list: SectorMetrics 結構 (與 sector_mapping 同順序)
+    """
+    names, totals, sid, rows = build_membership(sector_mapping, stock_df)
+    n = len(names)
+    cmoney_index = cmoney_index or {}
+
+    # 各族群的計數 (成員矩陣 × 個股布林欄位)
+    def count(values):
+        return np.bincount(sid, weights=np.asarray(values, dtype=np.float64)[rows], minlength=n).astype(np.int64)
+
+    active = np.bincount(sid, minlength=n)
+    top50 = count(stock_df['is_top50']) if 'is_top50' in stock_df.columns else np.zeros(n, dtype=np.int64)
+    up = count(stock_df['is_up'])
+    surge = count(stock_df['volume_ratio'].to_numpy() > SURGE_VOLUME_RATIO)
+    strong_close = count(stock_df['is_strong_close'])
+
+    # 漲幅 / 量比的中位數、平均、極值：一次 groupby
+    member_values = pd.DataFrame({
+        'change': stock_df['change'].to_numpy(dtype=np.float64)[rows],
+        'volume_ratio': stock_df['volume_ratio'].to_numpy(dtype=np.float64)[rows],
+    })
+    stats = member_values.groupby(sid).agg(
+        median_change=('change', 'median'), avg_change=('change', 'mean'),
+        max_change=('change', 'max'), min_change=('change', 'min'),
+        avg_volume_ratio=('volume_ratio', 'mean'),
+    ).reindex(range(n))
+
+    # 成員股列表：依族群、漲幅由高到低 (同漲幅依 stock_df 順序) 一次排序後切段
+    records = _member_records(stock_df)
+    change = member_values['change'].to_numpy()
+    order = np.lexsort((rows, -change, sid))
+    bounds = np.concatenate([[0], np.cumsum(active)])
+
+    results = []
+    for i, sector_name in enumerate(names):
+        total = int(totals[i])
+        metrics = _empty_metrics(sector_name, total)
+        n_active = int(active[i])
+        metrics['active_stocks'] = n_active
+        metrics['active_ratio'] = n_active / total if total > 0 else 0
+        metrics['top50_count'] = int(top50[i])
+        cmoney_row = cmoney_index.get(sector_name)
+        if n_active == 0:
+            # 即使沒有進榜股票，仍需填入 CMoney 數據
+            if cmoney_row is not None:
+                _fill_cmoney(metrics, cmoney_row)
+            results.append(metrics)
+            continue
+
+        # 漲跌同步性
+        row = stats.iloc[i]
+        metrics['up_count'] = int(up[i])
+        metrics['up_ratio'] = int(up[i]) / n_active
+        metrics['down_count'] = n_active - int(up[i])
+        metrics['median_change'] = float(row['median_change'])
+        metrics['avg_change'] = float(row['avg_change'])
+        metrics['max_change'] = float(row['max_change'])
+        metrics['min_change'] = float(row['min_change'])
+
+        # 量能動能
+        metrics['avg_volume_ratio'] = float(row['avg_volume_ratio'])
+        metrics['surge_count'] = int(surge[i])
+        metrics['surge_ratio'] = int(surge[i]) / n_active
+
+        # 價格位置
+        metrics['strong_close_count'] = int(strong_close[i])
+        metrics['strong_close_ratio'] = int(strong_close[i]) / n_active
+
+        # CMoney 資金數據
         if cmoney_row is not None:
-            metrics['fund_flow'] = float(cmoney_row.get('FundFlow', 0) or 0)
-            metrics['turnover_change'] = float(cmoney_row.get('TurnoverChange', 0) or 0)
-            metrics['margin_change'] = float(cmoney_row.get('MarginChange', 0) or 0)
-            metrics['short_change'] = float(cmoney_row.get('ShortChange', 0) or 0)
-            metrics['cmoney_price_change'] = float(cmoney_row.get('PriceChange', 0) or 0)
-        return metrics
-    
-    # 漲跌同步性
-    up_count = int(member_df['is_up'].sum())
-    metrics['up_count'] = up_count
-    metrics['up_ratio'] = up_count / active_stocks
-    metrics['down_count'] = active_stocks - up_count
-    metrics['median_change'] = float(member_df['change'].median())
-    metrics['avg_change'] = float(member_df['change'].mean())
-    metrics['max_change'] = float(member_df['change'].max())
-    metrics['min_change'] = float(member_df['change'].min())
-    
-    # 量能動能
-    metrics['avg_volume_ratio'] = float(member_df['volume_ratio'].mean())
-    surge_count = int((member_df['volume_ratio'] > 1.5).sum())
-    metrics['surge_count'] = surge_count
-    metrics['surge_ratio'] = surge_count / active_stocks
-    
-    # 價格位置
-    strong_close_count = int(member_df['is_strong_close'].sum())
-    metrics['strong_close_count'] = strong_close_count
-    metrics['strong_close_ratio'] = strong_close_count / active_stocks
-    
-    # CMoney 資金數據
-    if cmoney_row is not None:
-        metrics['fund_flow'] = float(cmoney_row.get('FundFlow', 0) or 0)
-        metrics['turnover_change'] = float(cmoney_row.get('TurnoverChange', 0) or 0)
-        metrics['margin_change'] = float(cmoney_row.get('MarginChange', 0) or 0)
-        metrics['short_change'] = float(cmoney_row.get('ShortChange', 0) or 0)
-        metrics['cmoney_price_change'] = float(cmoney_row.get('PriceChange', 0) or 0)
-    
-    # 成員股列表（按漲幅排序）
-    member_sorted = member_df.sort_values('change', ascending=False)
-    member_list = []
-    for _, row in member_sorted.iterrows():
-        member_list.append({
-            'code': row['code'],
-            'name': row.get('name', ''),
-            'close': row['close'],
-            'change': row['change'],
-            'volume_ratio': row['volume_ratio'],
-            'is_up': row['is_up'],
-            'is_strong_close': row['is_strong_close'],
-            'is_top50': row.get('is_top50', False),
-            'amount_rank': row.get('amount_rank', 999)
-        })
-    metrics['member_stocks'] = member_list
+            _fill_cmoney(metrics, cmoney_row)
+
+        # 成員股列表（按漲幅排序）
+        metrics['member_stocks'] = [dict(records[r]) for r in rows[order[bounds[i]:bounds[i + 1]]]]
+        results.append(metrics)
+    return results
+
+
+def _member_records(stock_df):
+    """每檔個股的成員股資料 (dict 列表，對應 stock_df 列號)"""
+    columns = {}
+    for field, default in MEMBER_FIELDS.items():
+        if field in stock_df.columns:
+            columns[field] = stock_df[field].to_numpy()
+        elif default is None:
+            raise KeyError(field)
+        else:
+            columns[field] = np.full(len(stock_df), default, dtype=object)
+    return pd.DataFrame(columns).to_dict('records')
+
+
+def calculate_sector_metrics(sector_name, member_codes, stock_df, cmoney_row=None):
+    """
+    計算單一族群的完整統計指標 (批次計算請用 compute_sector_metrics)
     
-    return metrics
+    Args:
+        sector_name: 族群名稱
+        member_codes: 成員股票代碼列表
+        stock_df: 個股快照資料（來自 load_stock_data）
+        cmoney_row: CMoney 該族群的資料 (pd.Series, 可選)
+        
+    Returns:
+        dict: SectorMetrics 結構
+    """
+    cmoney_index = {sector_name: cmoney_row} if cmoney_row is not None else None
+    return compute_sector_metrics(stock_df, {sector_name: list(member_codes)}, cmoney_index)[0]
 
 
 def analyze_all_sectors(stock_df, cmoney_df=None, sector_mapping=None):
@@ -138,36 +225,21 @@ def analyze_all_sectors(stock_df, cmoney_df=None, sector_mapping=None):
     Returns:
         list: [SectorMetrics, ...]
     """
-    results = []
-    
     if sector_mapping is None or not sector_mapping:
         print("⚠️ 族群映射為空，無法分析")
-        return results
+        return []
     
-    # 建立 CMoney 名稱索引
+    # 建立 CMoney 名稱索引 (同名族群以最後一筆為準)
     cmoney_index = {}
     if cmoney_df is not None and not cmoney_df.empty:
-        for _, row in cmoney_df.iterrows():
+        for row in cmoney_df.to_dict('records'):
             name = str(row.get('SectorName', '')).strip()
             if name:
                 cmoney_index[name] = row
     
-    # 遍歷 sector_mapping
-    for sector_name, member_codes in sector_mapping.items():
-        if not member_codes:
-            continue
-        
-        # 查找對應的 CMoney 資料
-        cmoney_row = cmoney_index.get(sector_name, None)
-        
-        # 計算指標
-        metrics = calculate_sector_metrics(
-            sector_name, 
-            member_codes, 
-            stock_df, 
-            cmoney_row=cmoney_row
-        )
-        results.append(metrics)
+    # 所有族群一次計算 (略過沒有成員的族群)
+    mapping = {name: codes for name, codes in sector_mapping.items() if codes}
+    results = compute_sector_metrics(stock_df, mapping, cmoney_index)
     
     print(f"📊 分析完成: {len(results)} 個族群")
     if cmoney_index:
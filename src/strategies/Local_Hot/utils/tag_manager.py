@@ -5,6 +5,7 @@
 """
 
 import os
+import numpy as np
 import pandas as pd
 
 # 路徑設定
@@ -89,6 +90,129 @@ def load_master_tags():
         return {}
 
 
+# 動態分類：股票漲幅與族群中位數的最大允許差異 (%)
+MAX_DIFF = 3.0
+
+
+class TagIndex:
+    """
+    標籤倒排索引 (整數編碼，建立一次重複使用)
+
+    標籤 / 股票各自編號，標籤 → 成員、股票 → 標籤兩個方向都存成 CSR 陣列：
+        tag_ptr[i]:tag_ptr[i + 1]   為第 i 個標籤的成員在 tag_members 中的範圍
+        code_ptr[j]:code_ptr[j + 1] 為第 j 檔股票的標籤在 code_tags 中的範圍
+    成員 / 標籤順序與原始映射的出現順序相同。
+
+    set_snapshot(stock_df) 以一次 groupby 算出每個標籤的中位數漲幅，
+    之後每檔股票的最佳歸屬只需查候選標籤 (O(候選數))。
+
+    用法：
+        index = TagIndex(cmoney_tags).set_snapshot(stock_df)
+        tag = index.best_fit('6806', 2.5, ['綠能', '電池'])
+    """
+
+    def __init__(self, code_to_tags):
+        self.codes = list(code_to_tags)
+        self.code_id = {c: j for j, c in enumerate(self.codes)}
+        self.tags = []
+        self.tag_id = {}
+        pair_tag, pair_code = [], []
+        for code, tags in code_to_tags.items():
+            j = self.code_id[code]
+            for tag in dict.fromkeys(tags):
+                if tag not in self.tag_id:
+                    self.tag_id[tag] = len(self.tags)
+                    self.tags.append(tag)
+                pair_tag.append(self.tag_id[tag])
+                pair_code.append(j)
+        pair_tag = np.asarray(pair_tag, dtype=np.int32)
+        pair_code = np.asarray(pair_code, dtype=np.int32)
+
+        # 股票 → 標籤 (pairs 已依股票順序排列)
+        self.code_tags = pair_tag
+        self.code_ptr = np.searchsorted(pair_code, np.arange(len(self.codes) + 1)).astype(np.int64)
+        # 標籤 → 成員 (穩定排序，保留出現順序)
+        order = np.argsort(pair_tag, kind='stable')
+        self.tag_members = pair_code[order]
+        self.tag_ptr = np.searchsorted(pair_tag[order], np.arange(len(self.tags) + 1)).astype(np.int64)
+
+        self.median = None
+        self._values = None
+
+    def __contains__(self, tag):
+        return tag in self.tag_id
+
+    def members(self, tag):
+        """標籤的成員股票代碼"""
+        i = self.tag_id[tag]
+        return [self.codes[j] for j in self.tag_members[self.tag_ptr[i]:self.tag_ptr[i + 1]]]
+
+    def tags_of(self, code):
+        """股票的標籤"""
+        j = self.code_id.get(code)
+        if j is None:
+            return []
+        return [self.tags[i] for i in self.code_tags[self.code_ptr[j]:self.code_ptr[j + 1]]]
+
+    def to_mapping(self):
+        """{tag: [stock_codes]} (與逐筆建立的反向映射相同順序)"""
+        return {tag: self.members(tag) for tag in self.tags}
+
+    def set_snapshot(self, stock_df, column='change'):
+        """
+        依當日個股資料計算每個標籤的中位數 (成員都不在 stock_df 中的標籤為 0.0)
+
+        Returns:
+            self
+        """
+        values = stock_df.drop_duplicates('code').set_index('code')[column]
+        self._values = values
+        sizes = np.diff(self.tag_ptr)
+        pos = values.index.get_indexer([self.codes[j] for j in self.tag_members])
+        hit = pos >= 0
+        tag_of_pair = np.repeat(np.arange(len(self.tags)), sizes)
+        grouped = pd.Series(values.to_numpy()[pos[hit]]).groupby(tag_of_pair[hit]).median()
+        self.median = np.zeros(len(self.tags))
+        self.median[grouped.index.to_numpy()] = grouped.to_numpy()
+        return self
+
+    def _median_excluding(self, i, code):
+        """排除某檔成員後的中位數 (該股票本身也是成員時使用)；沒有其他成員時回傳 None"""
+        others = [c for c in self.members(self.tags[i]) if c != code]
+        if not others:
+            return None
+        vals = self._values[self._values.index.isin(others)]
+        return 0.0 if vals.empty else vals.median()
+
+    def best_fit(self, stock_code, stock_change, candidate_tags, max_diff=MAX_DIFF):
+        """
+        從候選標籤中找出中位數漲幅最接近的標籤 (需先 set_snapshot)
+
+        Returns:
+            str or None: 差異小於 max_diff 的最佳標籤
+        """
+        best_tag = None
+        min_diff = float('inf')
+        own = set(self.tags_of(stock_code))
+        for tag in candidate_tags:
+            i = self.tag_id.get(tag)
+            if i is None:
+                continue
+            if tag in own:
+                median = self._median_excluding(i, stock_code)
+                if median is None:
+                    continue
+            else:
+                median = self.median[i]
+            diff = abs(stock_change - median)
+            if diff < min_diff:
+                min_diff = diff
+                best_tag = tag
+        if best_tag and min_diff < max_diff:
+            return best_tag
+        return None
+
+
 def calculate_sector_median(stock_df, sector_stocks):
     """
     計算族群的中位數漲幅
@@ -114,46 +238,17 @@ def find_best_fit_tag(stock_code, stock_change, candidate_tags, cmoney_tags, sto
         stock_code: 股票代碼
         stock_change: 股票漲幅
         candidate_tags: 候選標籤列表
-        cmoney_tags: CMoney 標籤映射（用於計算族群中位數）
+        cmoney_tags: CMoney 標籤映射 {code: [tags]}，或已 set_snapshot 的 TagIndex (重複呼叫時使用)
         stock_df: 個股資料 DataFrame
     
     Returns:
         str or None: 最佳標籤，若無合適則返回 None
     """
-    # 反向映射：標籤 → 股票列表
-    tag_to_stocks = {}
-    for code, tags in cmoney_tags.items():
-        for tag in tags:
-            if tag not in tag_to_stocks:
-                tag_to_stocks[tag] = []
-            tag_to_stocks[tag].append(code)
-    
-    best_tag = None
-    min_diff = float('inf')
-    
-    for tag in candidate_tags:
-        # 只考慮 CMoney 中存在的標籤
-        if tag not in tag_to_stocks:
-            continue
-        
-        # 計算該標籤族群的中位數漲幅（排除當前股票）
-        sector_stocks = [s for s in tag_to_stocks[tag] if s != stock_code]
-        if not sector_stocks:
-            continue
-        
-        sector_median = calculate_sector_median(stock_df, sector_stocks)
-        diff = abs(stock_change - sector_median)
-        
-        if diff < min_diff:
-            min_diff = diff
-            best_tag = tag
-    
-    # 只有差異小於閾值才返回
-    MAX_DIFF = 3.0  # 最大允許差異 3%
-    if best_tag and min_diff < MAX_DIFF:
-        return best_tag
-    
-    return None
+    if isinstance(cmoney_tags, TagIndex) and cmoney_tags.median is not None:
+        index = cmoney_tags
+    else:
+        index = TagIndex(cmoney_tags).set_snapshot(stock_df)
+    return index.best_fit(stock_code, stock_change, candidate_tags)
 
 
 def build_unified_mapping(stock_df, cmoney_tags):
@@ -167,16 +262,9 @@ def build_unified_mapping(stock_df, cmoney_tags):
     Returns:
         dict: {tag: [stock_codes]}
     """
-    # 反向映射：標籤 → 股票列表
-    tag_to_stocks = {}
-    
-    # 1. 先加入所有 CMoney 標籤
-    for code, tags in cmoney_tags.items():
-        for tag in tags:
-            if tag not in tag_to_stocks:
-                tag_to_stocks[tag] = []
-            if code not in tag_to_stocks[tag]:
-                tag_to_stocks[tag].append(code)
+    # 1. 先加入所有 CMoney 標籤 (倒排索引只建一次，族群中位數一次 groupby 算完)
+    index = TagIndex(cmoney_tags).set_snapshot(stock_df)
+    tag_to_stocks = index.to_mapping()
     
     # 2. 找出缺漏的股票
     all_stocks = set(stock_df['code'].tolist())
@@ -188,14 +276,12 @@ def build_unified_mapping(stock_df, cmoney_tags):
         
         # 載入 master_stock_tags 作為候選來源
         master_tags = load_master_tags()
+        changes = stock_df.drop_duplicates('code').set_index('code')['change']
         
         assigned_count = 0
         for code in missing_stocks:
             # 取得該股票的漲幅
-            stock_row = stock_df[stock_df['code'] == code]
-            if stock_row.empty:
-                continue
-            stock_change = stock_row.iloc[0]['change']
+            stock_change = changes[code]
             
             # 從 master_stock_tags 取得候選標籤
             candidate_tags = []
@@ -207,7 +293,7 @@ def build_unified_mapping(stock_df, cmoney_tags):
                 continue
             
             # 找到最佳歸屬
-            best_tag = find_best_fit_tag(code, stock_change, candidate_tags, cmoney_tags, stock_df)
+            best_tag = index.best_fit(code, stock_change, candidate_tags)
             
             if best_tag:
                 if best_tag not in tag_to_stocks:
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+RSI 背離篩選 歷史回測 (RSI Divergence Backtest)
+
+把 RSI_screener 的「基礎過濾 (Filter 1~3) + 日線 / 周線背離」在一段日期區間內
+每個交易日重播一次，統計各類訊號的後續報酬與勝率。
+
+不逐日呼叫 run_screener，而是整段一次算完：
+1. 基礎過濾：Screen.evaluate 一次產生「日期 × 股票」的合格矩陣
+2. 背離偵測：divergence_engine 對全部歷史只掃描一次 (max_bars_ago=None)，
+   每個訊號的確認日 t 就是 run_screener 在第 t 天會回報它的日子
+   (RSI / pivot / 前一個 pivot 都只用到 t 以前的資料，截斷到 t 重算結果相同)
+3. 第 t 天的條件 (有效 K 棒數、當天是否通過 Filter 1~3) 以確認日查表
+4. 後續報酬：以前向填充的收盤價計算 t → t+h 的報酬
+
+周線訊號分兩部分：
+- 完整周線：確認日為該週最後一個交易日，同樣只掃描一次
+- 週中未完成周線：run_screener 在週中執行時，最後一根周線是「本週截至當天」的聚合，
+  區間內每個週中交易日各重算一次 (前面的完整周線 + 當天的未完成周線，只取最後一根確認的訊號)
+
+用法：
+    python RSI_backtest.py --start 2024-01-01 --end 2025-12-31
+    python RSI_backtest.py --start 2024-01-01 --horizons 5,10,20 --full   # 略過 Filter 1~3
+"""
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from RSI_screener import (
+    project_root, WEEKLY_CACHE_DIR,
+    RSI_PERIOD, PIVOT_LB_LEFT, PIVOT_LB_RIGHT, RANGE_LOWER, RANGE_UPPER,
+    load_data, load_name_map, build_screen
+)
+from utils.matrix_cache import load_matrix_cache
+from divergence_engine import scan_divergences, to_weekly
+from utils.indicators import iso_week_starts, week_end_rows
+
+# --- Parameters ---
+HORIZONS = (5, 10, 20, 60)         # 後續報酬觀察天數 (交易日)
+DAILY_MIN_BARS = 100               # 與 scan_daily_divergences 相同
+WEEKLY_MIN_BARS = 30               # 與 scan_weekly_divergences 相同
+
+# 多方訊號預期上漲、空方訊號預期下跌 (勝率依方向計算)
+SIGNAL_DIRECTION = {'bull': 1, 'hidden_bull': 1, 'bear': -1, 'hidden_bear': -1}
+
+
+# ============================================================
+# 🔧 訊號重播
+# ============================================================
+
+def _signals_frame(signals, timeframe):
+    """scan_divergences 的結果攤平成 DataFrame (一列一個訊號)"""
+    rows = [
+        {
+            'code': code,
+            'timeframe': timeframe,
+            'div_type': sig['type'],
+            'confirm_bar': sig['confirm_bar'],
+            'rsi_curr': sig['rsi_curr'],
+            'rsi_prev': sig['rsi_prev'],
+            'price_curr': sig['price_curr'],
+            'price_prev': sig['price_prev'],
+            'date_pivot': sig['date_pivot'],
+            'date_confirm': sig['date_confirm'],
+        }
+        for code, sigs in signals.items() for sig in sigs
+    ]
+    columns = ['code', 'timeframe', 'div_type', 'confirm_bar', 'rsi_curr', 'rsi_prev',
+               'price_curr', 'price_prev', 'date_pivot', 'date_confirm']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def replay_partial_weeks(df_close, df_high, df_low, rows, params):
+    """
+    週中交易日的周線訊號 (run_screener 在週中執行時看到的未完成周線)
+
+    第 t 天的周線 = 前面的完整周線 + 本週截至 t 的聚合；只有最後一根不同，
+    完整周線只轉一次，每天只重算未完成的那一根，再掃描最後一根確認的訊號。
+
+    Args:
+        rows: 要重播的日線列號 (每週最後一個交易日由完整周線負責，這裡略過)
+        params: scan_divergences 參數 (max_bars_ago 會改為 0)
+
+    Returns:
+        DataFrame：_signals_frame 欄位 + row (回報日列號)
+    """
+    codes = list(df_close.columns)
+    index = df_close.index
+    starts = iso_week_starts(index)
+    ends = week_end_rows(starts, len(index))
+    week_of = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(index)]))
+    w_close, w_high, w_low, date_pos = to_weekly(df_close, df_high, df_low, codes)
+    params = dict(params, max_bars_ago=0)
+
+    def stack(full, part, k):
+        return pd.DataFrame(np.vstack([full.to_numpy()[:k], part.to_numpy()]), columns=codes)
+
+    frames = [_signals_frame({}, "周線").assign(row=0)]
+    for t in rows:
+        k = week_of[t]
+        if t == ends[k]:
+            continue
+        s = starts[k]
+        p_close, p_high, p_low, p_pos = to_weekly(df_close.iloc[s:t + 1], df_high.iloc[s:t + 1],
+                                                  df_low.iloc[s:t + 1], codes)
+        signals = scan_divergences(stack(w_close, p_close, k), stack(w_high, p_high, k),
+                                   stack(w_low, p_low, k), codes=codes, min_bars=WEEKLY_MIN_BARS,
+                                   date_pos=stack(date_pos, p_pos + s, k), dates=index, **params)
+        frames.append(_signals_frame(signals, "周線").assign(row=t))
+    return pd.concat(frames, ignore_index=True)
+
+
+def replay_signals(df_close, df_high, df_low, weekly_data=None, weekly=True, rows=None):
+    """
+    全部歷史的背離訊號 (日線 + 周線)，每個訊號附上回報日在日線 index 的列號
+
+    「第 t 天有效 K 棒不足」的訊號在這裡先剔除，等同 run_screener 當天的 min_bars 檢查。
+
+    Args:
+        rows: 週中未完成周線要重播的日線列號 (None 表示全部交易日)
+
+    Returns:
+        DataFrame：_signals_frame 欄位 + row (確認日列號) / col (股票欄號)
+    """
+    params = dict(rsi_period=RSI_PERIOD, lbL=PIVOT_LB_LEFT, lbR=PIVOT_LB_RIGHT,
+                  range_lower=RANGE_LOWER, range_upper=RANGE_UPPER, max_bars_ago=None)
+    codes = list(df_close.columns)
+    valid = (df_close.notna() & df_high.notna() & df_low.notna()).to_numpy()
+
+    print("   📈 日線背離...")
+    daily = _signals_frame(scan_divergences(df_close, df_high, df_low, codes=codes,
+                                            min_bars=DAILY_MIN_BARS, **params), "日線")
+    daily = daily[daily['confirm_bar'] + 1 >= DAILY_MIN_BARS]
+    frames = [daily]
+
+    if weekly:
+        print("   📊 周線背離...")
+        in_sync = (weekly_data is not None and len(weekly_data.dates)
+                   and weekly_data.dates[-1] == df_close.index[-1]
+                   and all(c in weekly_data.codes for c in codes))
+        if in_sync:
+            signals = scan_divergences(weekly_data['close'], weekly_data['high'], weekly_data['low'],
+                                       codes=codes, min_bars=WEEKLY_MIN_BARS, **params)
+        else:
+            print("   ⚠️ 周線快取不存在或未同步，由日線現場聚合")
+            w_close, w_high, w_low, date_pos = to_weekly(df_close, df_high, df_low, codes)
+            signals = scan_divergences(w_close, w_high, w_low, codes=codes, min_bars=WEEKLY_MIN_BARS,
+                                       date_pos=date_pos, dates=df_close.index, **params)
+        weekly_df = _signals_frame(signals, "周線")
+        frames.append(weekly_df[weekly_df['confirm_bar'] + 1 >= WEEKLY_MIN_BARS])
+
+    out = pd.concat(frames, ignore_index=True)
+    out['row'] = df_close.index.get_indexer(out['date_confirm'])
+
+    if weekly:
+        print("   📊 週中未完成周線...")
+        if rows is None:
+            rows = range(len(df_close))
+        partial = replay_partial_weeks(df_close, df_high, df_low, rows, params)
+        out = pd.concat([out, partial], ignore_index=True)
+    out['col'] = df_close.columns.get_indexer(out['code'])
+
+    if weekly:
+        # 周線：當天日線有效 K 棒也要 >= 100 (scan_weekly_divergences 的轉周線門檻)
+        daily_count = np.cumsum(valid, axis=0)
+        is_weekly = (out['timeframe'] == "周線").to_numpy()
+        enough = daily_count[out['row'].to_numpy(), out['col'].to_numpy()] >= DAILY_MIN_BARS
+        out = out[~is_weekly | enough]
+    return out.reset_index(drop=True)
+
+
+def forward_returns(close, rows, cols, horizons=HORIZONS):
+    """
+    close[t+h] / close[t] - 1；超出資料尾端為 NaN
+
+    Returns:
+        dict: {h: ndarray}
+    """
+    values = close.to_numpy()
+    n_rows = len(values)
+    base = values[rows, cols]
+    out = {}
+    for h in horizons:
+        ahead = rows + h
+        ok = ahead < n_rows
+        ret = np.full(len(rows), np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret[ok] = values[ahead[ok], cols[ok]] / base[ok] - 1
+        out[h] = ret
+    return out
+
+
+def summarize(trades, horizons=HORIZONS):
+    """
+    各 時間框架 × 訊號類型 的訊號數、平均報酬、勝率 (依訊號方向)
+
+    Returns:
+        DataFrame (index = (timeframe, div_type))
+    """
+    rows = []
+    for (tf, div_type), g in trades.groupby(['timeframe', 'div_type'], sort=False):
+        direction = SIGNAL_DIRECTION[div_type]
+        row = {'timeframe': tf, 'div_type': div_type, 'signals': len(g)}
+        for h in horizons:
+            ret = g[f'ret_{h}'].dropna()
+            row[f'avg_{h}'] = ret.mean() if len(ret) else np.nan
+            row[f'win_{h}'] = (ret * direction > 0).mean() if len(ret) else np.nan
+        rows.append(row)
+    order = {k: i for i, k in enumerate(["日線", "周線", *SIGNAL_DIRECTION])}
+    rows.sort(key=lambda r: (order[r['timeframe']], order[r['div_type']]))
+    return pd.DataFrame(rows).set_index(['timeframe', 'div_type'])
+
+
+# ============================================================
+# 🚀 主流程
+# ============================================================
+
+def run_backtest(start=None, end=None, horizons=HORIZONS, full_market=False, weekly=True):
+    """
+    區間內每個交易日重播 RSI 背離篩選
+
+    Args:
+        start / end: 日期 (含)；省略時為資料頭 / 尾
+        horizons: 後續報酬觀察天數
+        full_market: 略過 Filter 1~3 (同 RSI_screener --full)
+        weekly: 是否包含周線訊號
+
+    Returns:
+        (trades, summary)：逐筆訊號與統計表；資料不足時為 (None, None)
+    """
+    print("🚀 啟動 RSI 背離歷史回測...")
+    print(f"   📋 RSI={RSI_PERIOD} | Pivot L={PIVOT_LB_LEFT} R={PIVOT_LB_RIGHT} | Range={RANGE_LOWER}~{RANGE_UPPER}")
+
+    data = load_data()
+    if data is None:
+        return None, None
+    df_close = data.get('close')
+    df_high = data.get('high')
+    df_low = data.get('low')
+    if df_close is None or df_high is None or df_low is None:
+        print("❌ 缺少必要資料 (close/high/low).")
+        return None, None
+
+    # 與 run_screener 相同：前向填充 (只用到過去資料，不會偷看未來)
+    df_close = df_close.ffill()
+    df_high = df_high.ffill()
+    df_low = df_low.ffill()
+
+    index = df_close.index
+    lo = 0 if start is None else index.searchsorted(pd.Timestamp(start))
+    hi = len(index) if end is None else index.searchsorted(pd.Timestamp(end), side='right')
+    if hi <= lo:
+        print("❌ 區間內沒有交易日")
+        return None, None
+    print(f"📅 回測區間: {index[lo]:%Y-%m-%d} ~ {index[hi - 1]:%Y-%m-%d} ({hi - lo} 個交易日)")
+
+    # 第一階段：Filter 1~3 整段一次計算
+    passed = None
+    if not full_market:
+        print("\n🌊 基礎過濾 (Filters 1,2,3)...")
+        screen_data = {'close': df_close, 'volume': data['volume']}
+        if 'vol_ma20' in data:
+            screen_data['vol_ma20'] = data['vol_ma20']
+        passed = build_screen(data).evaluate(screen_data, index[lo], index[hi - 1]).to_numpy()
+        print(f"   🔍 平均每日合格: {passed.sum(axis=1).mean():.0f} 檔")
+
+    # 第二階段：全部歷史的背離訊號只掃描一次
+    print("\n🔎 背離重播...")
+    weekly_data = load_matrix_cache(WEEKLY_CACHE_DIR) if weekly else None
+    trades = replay_signals(df_close, df_high, df_low, weekly_data=weekly_data, weekly=weekly,
+                            rows=range(lo, hi))
+    trades = trades[(trades['row'] >= lo) & (trades['row'] < hi)]
+    if passed is not None:
+        keep = passed[trades['row'].to_numpy() - lo, trades['col'].to_numpy()]
+        trades = trades[keep]
+    trades = trades.reset_index(drop=True)
+    print(f"   ✅ 區間內訊號: {len(trades)} 筆")
+
+    if trades.empty:
+        print("\n🍂 區間內沒有背離訊號。")
+        return trades, None
+
+    # 第三階段：後續報酬
+    rows = trades['row'].to_numpy()
+    cols = trades['col'].to_numpy()
+    trades['price'] = df_close.to_numpy()[rows, cols]
+    for h, ret in forward_returns(df_close, rows, cols, horizons).items():
+        trades[f'ret_{h}'] = ret
+
+    name_map = load_name_map()
+    trades.insert(1, 'name', trades['code'].map(name_map).fillna(''))
+    trades = trades.drop(columns=['row', 'col', 'confirm_bar'])
+
+    summary = summarize(trades, horizons)
+    print_summary(summary, horizons)
+    return trades, summary
+
+
+def print_summary(summary, horizons=HORIZONS):
+    """統計表輸出到終端"""
+    labels = {'bull': '底背離', 'hidden_bull': '隱藏底背離', 'bear': '頂背離', 'hidden_bear': '隱藏頂背離'}
+    print("\n📊 回測統計 (平均報酬 / 勝率)")
+    for (tf, div_type), row in summary.iterrows():
+        line = f"   {tf} {labels[div_type]:<6} × {int(row['signals']):>5}"
+        for h in horizons:
+            avg, win = row[f'avg_{h}'], row[f'win_{h}']
+            if np.isnan(avg):
+                line += f" | {h}日 -"
+            else:
+                line += f" | {h}日 {avg * 100:+.2f}% ({win * 100:.0f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='RSI 背離篩選 歷史回測 (周線訊號含週中未完成周線，與每日執行 run_screener 相同)')
+    parser.add_argument('--start', help='開始日期 (YYYY-MM-DD)，省略為資料開頭')
+    parser.add_argument('--end', help='結束日期 (YYYY-MM-DD)，省略為資料結尾')
+    parser.add_argument('--horizons', default=','.join(map(str, HORIZONS)),
+                        help='後續報酬觀察天數，以逗號分隔')
+    parser.add_argument('--full', action='store_true', help='略過 Filter 1~3，全市場回測')
+    parser.add_argument('--no-weekly', action='store_true', help='不含周線訊號 (含週中未完成周線)')
+    args = parser.parse_args()
+
+    horizons = tuple(int(h) for h in args.horizons.split(',') if h.strip())
+    trades, summary = run_backtest(args.start, args.end, horizons=horizons,
+                                   full_market=args.full, weekly=not args.no_weekly)
+    if trades is None or trades.empty:
+        return
+
+    first = trades['date_confirm'].min().strftime('%Y-%m-%d')
+    last = trades['date_confirm'].max().strftime('%Y-%m-%d')
+    out = trades.copy()
+    for col in ('date_pivot', 'date_confirm'):
+        out[col] = out[col].dt.strftime('%Y-%m-%d')
+    csv_filename = os.path.join(project_root, 'logs', f'rsi_backtest_{first}_{last}.csv')
+    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
+    out.to_csv(csv_filename, index=False, encoding='utf-8-sig')
+    summary.to_csv(csv_filename.replace('.csv', '_summary.csv'), encoding='utf-8-sig')
+    print(f"\n✅ 結果已存檔至 {csv_filename}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"\n❌ 錯誤: {e}")
+        import traceback
+        traceback.print_exc()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+RSI 背離批次引擎 (NumPy 向量化)
+
+規則對齊 TradingView 的 RSI Divergence 指標 (Wilder RSI、左右各 lbL / lbR 根的 pivot、
+前一個 pivot 距離 range_lower ~ range_upper)，一次處理整個「日期 × 股票」矩陣：
+
+1. 每檔股票的有效列 (close/high/low 皆非 NaN) 往上對齊，等同逐檔 dropna
+2. Wilder RSI：逐列遞迴，每一步同時更新所有股票
+3. Pivot：以 sliding_window_view 比較 [i-lbL, i+lbR] 視窗的最小 / 最大值
+4. 前一個 pivot：以「最近一個 pivot 位置」的累積最大值查表，不必逐對比較
+
+用法：
+    from divergence_engine import scan_divergences
+    signals = scan_divergences(df_close, df_high, df_low, codes=candidates, max_bars_ago=0)
+    signals['2330']   # list of dict (欄位見 scan_divergences)
+
+    # 周線：先以 ISO 周次聚合，再用同一個引擎掃描
+    w_close, w_high, w_low, date_pos = to_weekly(df_close, df_high, df_low, codes)
+    scan_divergences(w_close, w_high, w_low, min_bars=30, date_pos=date_pos, dates=df_close.index)
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.indicators import iso_week_starts, week_end_rows, resample_weekly
+
+
+# ============================================================
+# 🔧 矩陣運算核心
+# ============================================================
+
+def compact_columns(valid):
+    """
+    把每欄的有效列依原順序往上對齊
+
+    Returns:
+        (order, lengths)：order[r, j] 為第 j 欄第 r 個有效列的原始列號 (r >= lengths[j] 的部分無意義)
+    """
+    order = np.argsort(~valid, axis=0, kind='stable')
+    return order, valid.sum(axis=0)
+
+
+def gather(values, order, lengths):
+    """依 compact_columns 的結果取值，超出長度的部分填 NaN"""
+    out = np.take_along_axis(values, order, axis=0)
+    rows = np.arange(values.shape[0])[:, None]
+    if not np.issubdtype(out.dtype, np.floating):
+        out = out.astype(np.float64)
+    out[rows >= lengths[None, :]] = np.nan
+    return out
+
+
+def rsi_matrix(close, lengths, period=14):
+    """
+    Wilder's RSI (與 TradingView ta.rsi 相同)，每欄從第 0 列開始
+
+    - 第 period 列：前 period 個漲跌幅的簡單平均
+    - 之後：Wilder 平滑 (alpha = 1/period)
+    - 分母為 0 時 RSI = 0；第 period 列之前為 NaN
+    """
+    n_rows, n_cols = close.shape
+    rsi = np.full((n_rows, n_cols), np.nan)
+    if n_rows <= period:
+        return rsi
+
+    # 漲跌幅以原始精度計算 (與逐檔版本的 Series.diff 相同)，平滑以 float64 累加
+    delta = np.diff(close, axis=0)
+    up = np.clip(delta, 0, None)
+    down = np.clip(-delta, 0, None)
+
+    # 初始平均沿連續軸計算，加總順序與逐檔的一維 mean 相同 (float32 下結果才會逐位元一致)
+    alpha = 1.0 / period
+    sum_up = np.ascontiguousarray(up[:period].T).mean(axis=1).astype(np.float64)
+    sum_down = np.ascontiguousarray(down[:period].T).mean(axis=1).astype(np.float64)
+    avg_up = np.empty((n_rows - period, n_cols))
+    avg_down = np.empty((n_rows - period, n_cols))
+    avg_up[0], avg_down[0] = sum_up, sum_down
+    for i in range(1, n_rows - period):
+        sum_up = sum_up + (up[period + i - 1] - sum_up) * alpha
+        sum_down = sum_down + (down[period + i - 1] - sum_down) * alpha
+        avg_up[i], avg_down[i] = sum_up, sum_down
+
+    denom = avg_up + avg_down
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(denom == 0, 0.0, 100 * avg_up / denom)
+    rsi[period:] = out
+
+    rows = np.arange(n_rows)[:, None]
+    rsi[(rows >= lengths[None, :]) | (lengths[None, :] <= period)] = np.nan
+    return rsi
+
+
+def pivot_mask(values, lbL=5, lbR=5, kind='low'):
+    """
+    TradingView ta.pivotlow / ta.pivothigh
+
+    第 i 列為 pivot：[i-lbL, i+lbR] 視窗內沒有 NaN，且 values[i] 是視窗最小 (low) / 最大 (high) 值
+    """
+    n_rows = values.shape[0]
+    mask = np.zeros(values.shape, dtype=bool)
+    width = lbL + lbR + 1
+    if n_rows < width:
+        return mask
+    win = sliding_window_view(values, width, axis=0)   # (n_rows - width + 1, 欄, width)
+    center = win[..., lbL]
+    extreme = win.min(axis=-1) if kind == 'low' else win.max(axis=-1)
+    has_nan = np.isnan(win).any(axis=-1)
+    mask[lbL:n_rows - lbR] = ~has_nan & (center == extreme)
+    return mask
+
+
+def previous_pivot(mask, range_lower=5, range_upper=60):
+    """
+    每個 pivot 對應的前一個 pivot 列號
+
+    規則：距離至少 range_lower 的最近一個 pivot，且距離不超過 range_upper；沒有則為 -1
+    """
+    n_rows = mask.shape[0]
+    rows = np.arange(n_rows)[:, None]
+    last = np.maximum.accumulate(np.where(mask, rows, -1), axis=0)
+
+    prev = np.full(mask.shape, -1, dtype=np.int64)
+    if n_rows > range_lower:
+        prev[range_lower:] = last[:n_rows - range_lower]
+    dist = rows - prev
+    prev[(prev < 0) | (dist > range_upper) | ~mask] = -1
+    return prev
+
+
+def match_divergences(rsi, price, prev, kind='low'):
+    """
+    比較每個 pivot 與前一個 pivot 的 RSI / 價格
+
+    kind='low'  (價格用最低價)：bull = RSI 墊高 + 價格破底；hidden_bull = RSI 破底 + 價格墊高
+    kind='high' (價格用最高價)：bear = RSI 走低 + 價格創高；hidden_bear = RSI 創高 + 價格走低
+
+    Returns:
+        list of (rows, cols, prev_rows, type)
+    """
+    r, c = np.nonzero(prev >= 0)
+    p = prev[r, c]
+    rsi_up = rsi[r, c] > rsi[p, c]
+    rsi_down = rsi[r, c] < rsi[p, c]
+    price_up = price[r, c] > price[p, c]
+    price_down = price[r, c] < price[p, c]
+    if kind == 'low':
+        rules = (('bull', rsi_up & price_down), ('hidden_bull', rsi_down & price_up))
+    else:
+        rules = (('bear', rsi_down & price_up), ('hidden_bear', rsi_up & price_down))
+    return [(r[m], c[m], p[m], name) for name, m in rules]
+
+
+# ============================================================
+# 📅 周線聚合
+# ============================================================
+
+def to_weekly(df_close, df_high, df_low, codes):
+    """
+    日線矩陣轉周線 (ISO 周次分組，index 為該週最後一個交易日)
+
+    每檔只使用自己的有效日 (close/high/low 皆非 NaN)：收盤取最後一天、最高取 max、最低取 min。
+    optimize_matrix 已預先產生周線快取，這裡是快取不存在或過期時的備援。
+
+    Returns:
+        (w_close, w_high, w_low, date_pos)
+        date_pos: 周 × 股票，該週最後一個有效日在日線 index 的位置 (沒有交易為 NaN)
+    """
+    close = df_close[codes].to_numpy()
+    high = df_high[codes].to_numpy()
+    low = df_low[codes].to_numpy()
+    valid = ~(np.isnan(close) | np.isnan(high) | np.isnan(low))
+
+    starts = iso_week_starts(df_close.index)
+    rows = np.arange(len(close), dtype=np.float64)[:, None].repeat(len(codes), axis=1)
+    week_index = df_close.index[week_end_rows(starts, len(close))]
+
+    def frame(values, how):
+        return pd.DataFrame(resample_weekly(values, starts, how=how, valid=valid), index=week_index, columns=codes)
+
+    return frame(close, 'last'), frame(high, 'max'), frame(low, 'min'), frame(rows, 'last')
+
+
+# ============================================================
+# 🚀 批次掃描
+# ============================================================
+
+def scan_divergences(df_close, df_high, df_low, codes=None,
+                     rsi_period=14, lbL=5, lbR=5, range_lower=5, range_upper=60,
+                     max_bars_ago=0, min_bars=100, date_pos=None, dates=None):
+    """
+    全部股票一次偵測 RSI 背離
+
+    Args:
+        df_close / df_high / df_low: 日期 × 股票 DataFrame
+        codes: 要掃描的股票 (None 表示全部欄位)
+        max_bars_ago: 只保留確認 K 棒距最後一根 0 ~ max_bars_ago 根的訊號 (None 表示全部歷史訊號)
+        min_bars: 有效 K 棒少於此數的股票略過
+        date_pos / dates: 周線用；訊號日期改為 dates[date_pos[列, 欄]] (見 to_weekly)
+
+    Returns:
+        dict: {code: [signal, ...]}，只列出有訊號的股票；signal 欄位為
+              bar / confirm_bar / type / rsi_curr / rsi_prev /
+              price_curr / price_prev / date_pivot / date_confirm / bars_ago
+    """
+    if codes is None:
+        codes = list(df_close.columns)
+    codes = [c for c in codes if c in df_close.columns and c in df_high.columns and c in df_low.columns]
+    if not codes:
+        return {}
+
+    close = df_close[codes].to_numpy()
+    high = df_high[codes].to_numpy()
+    low = df_low[codes].to_numpy()
+    valid = ~(np.isnan(close) | np.isnan(high) | np.isnan(low))
+
+    # 與逐檔版本相同：有效 K 棒不足 min_bars 或 RSI + pivot 所需長度的股票略過
+    lengths = valid.sum(axis=0)
+    keep = lengths >= max(min_bars, rsi_period + lbL + lbR + range_lower)
+    if not keep.any():
+        return {}
+    codes = [c for c, k in zip(codes, keep) if k]
+    valid = valid[:, keep]
+    order, lengths = compact_columns(valid)
+
+    close = gather(close[:, keep], order, lengths)
+    high = gather(high[:, keep], order, lengths)
+    low = gather(low[:, keep], order, lengths)
+    if date_pos is not None:
+        cell_pos = np.take_along_axis(date_pos[codes].to_numpy(), order, axis=0)
+    else:
+        dates = df_close.index
+        cell_pos = order
+
+    rsi = rsi_matrix(close, lengths, period=rsi_period)
+
+    found = []
+    for kind, price in (('low', low), ('high', high)):
+        mask = pivot_mask(rsi, lbL, lbR, kind=kind)
+        prev = previous_pivot(mask, range_lower, range_upper)
+        for rows, cols, prevs, sig_type in match_divergences(rsi, price, prev, kind=kind):
+            # 只保留最近 max_bars_ago 根內確認的訊號
+            bars_ago = lengths[cols] - 1 - (rows + lbR)
+            recent = bars_ago >= 0
+            if max_bars_ago is not None:
+                recent &= bars_ago <= max_bars_ago
+            found.append((rows[recent], cols[recent], prevs[recent], bars_ago[recent], sig_type, price))
+
+    results = {}
+    for rows, cols, prevs, bars_ago, sig_type, price in found:
+        for r, j, p, ago in zip(rows.tolist(), cols.tolist(), prevs.tolist(), bars_ago.tolist()):
+            confirm_bar = r + lbR
+            results.setdefault(codes[j], []).append({
+                'bar': r,
+                'confirm_bar': confirm_bar,
+                'type': sig_type,
+                'rsi_curr': rsi[r, j],
+                'rsi_prev': rsi[p, j],
+                'price_curr': price[r, j],
+                'price_prev': price[p, j],
+                'date_pivot': dates[int(cell_pos[r, j])],
+                'date_confirm': dates[int(cell_pos[confirm_bar, j])],
+                'bars_ago': ago,
+            })
+
+    # 與逐檔版本相同的順序：依 confirm_bar 穩定排序 (同一根先 pivot low 再 pivot high)
+    for sigs in results.values():
+        sigs.sort(key=lambda x: x['confirm_bar'])
+    return results
@@ -0,0 +1,173 @@
+# === 微基準測試：HiStock 行情表解析 (逐列 iterrows vs 向量化 quote_table) ===
+# 用法：
+#     python bench_histock_parse.py                 # 使用 fixtures/histock_rank.html (不存在時下載一次並保存)
+#     python bench_histock_parse.py --page my.html  # 指定已保存的頁面
+#     python bench_histock_parse.py --synthetic     # 離線：以本地 history 資料產生同格式的頁面
+#
+# 兩種做法都從同一份 pd.read_html 結果開始計時，並比對輸出是否一致。
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from io import StringIO
+
+TOOLS_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_ROOT = os.path.dirname(TOOLS_ROOT)
+sys.path.insert(0, os.path.join(TOOLS_ROOT, "data_pipeline"))
+from quote_table import find_quote_table, normalize_quote_table
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "histock_rank.html")
+HISTOCK_URL = "https://histock.tw/stock/rank.aspx?p=all"
+HISTORY_FOLDER = os.path.join(SRC_ROOT, "data_core", "history")
+
+
+# ================= 舊版做法 (Pipeline_data 逐列解析，保留作為對照) =================
+
+def legacy_parse(target_df):
+    target_df = target_df.copy()
+    target_df.columns = [str(c).strip().replace(" ", "").replace("\n", "").replace("▼", "") for c in target_df.columns]
+    processed_df = target_df[target_df['代號'].astype(str).str.len() == 4]
+
+    rows = []
+    for idx, row in processed_df.iterrows():
+        code_raw = str(row['代號']).strip()
+        if len(code_raw) != 4 or code_raw.startswith('0') or not code_raw.isdigit():
+            continue
+
+        def parse_val(v):
+            s = str(v).replace(',', '').strip()
+            if s == '--' or s == '': return None
+            try: return float(s)
+            except: return None
+
+        cl = parse_val(row.get('價格')) or parse_val(row.get('成交'))
+        op = parse_val(row.get('開盤')) or cl
+        hi = parse_val(row.get('最高')) or cl
+        lo = parse_val(row.get('最低')) or cl
+        vol_lots = parse_val(row.get('成交量'))
+        amount_億 = parse_val(row.get('成交值(億)'))
+        if cl is None: continue
+        if vol_lots is None: vol_lots = 0
+        vol_shares = int(vol_lots * 1000)
+        if amount_億 is not None and amount_億 > 0:
+            amount = float(amount_億) * 100000000
+        else:
+            amount = float(cl) * vol_shares
+
+        stock_name = str(row["名稱"]) if "名稱" in target_df.columns else ""
+        dr = "DR" in stock_name or "甲特" in stock_name
+        trade_val = 0
+        if "成交值(億)" in target_df.columns:
+            val_str = str(row["成交值(億)"]).replace(",", "").replace("-", "0")
+            try: trade_val = float(val_str) if val_str else 0
+            except: trade_val = 0
+        amplitude = 0
+        if "振幅" in target_df.columns:
+            amp_str = str(row["振幅"]).replace("%", "").replace(",", "").replace("-", "0")
+            try: amplitude = float(amp_str) if amp_str else 0
+            except: amplitude = 0
+
+        rows.append((code_raw, op, hi, lo, cl, vol_shares, amount, dr, trade_val == 0 and amplitude == 0))
+    return pd.DataFrame(rows, columns=['Code', 'Open', 'High', 'Low', 'Close', 'Volume', 'Amount',
+                                       'is_dr_or_pref', 'is_zero_activity'])
+
+
+def vectorized_parse(target_df):
+    quotes = normalize_quote_table(target_df)
+    quotes = quotes[quotes['is_common'] & quotes['Close'].notna()]
+    return quotes[['Code', 'Open', 'High', 'Low', 'Close', 'Volume', 'Amount', 'is_dr_or_pref', 'is_zero_activity']]
+
+
+# ================= Fixture =================
+
+def build_synthetic_page(limit=None):
+    """以本地 history 最後兩列產生與 HiStock 排行頁相同欄位的 HTML 表格"""
+    files = sorted(f for f in os.listdir(HISTORY_FOLDER) if f.endswith('.csv'))[:limit]
+    rng = np.random.default_rng(0)
+    rows = []
+    for f in files:
+        df = pd.read_csv(os.path.join(HISTORY_FOLDER, f)).tail(2)
+        if len(df) < 2:
+            continue
+        prev, last = df.iloc[0], df.iloc[1]
+        chg = last['Close'] - prev['Close']
+        amp = (last['High'] - last['Low']) / prev['Close'] * 100 if prev['Close'] else 0
+        rows.append([f[:-4], f"股票{f[:-4]}", f"{last['Close']:,.2f}", f"{chg:.2f}", f"{chg / prev['Close'] * 100:.2f}%",
+                     "0.00%", f"{amp:.2f}%", f"{last['Open']:,.2f}", f"{last['High']:,.2f}", f"{last['Low']:,.2f}",
+                     f"{prev['Close']:,.2f}", f"{last['Volume'] / 1000:,.0f}", f"{last['Amount'] / 1e8:.2f}"])
+    # 加入 DR、甲特、停牌與無成交的列
+    for i, name in enumerate(["泰金寶-DR", "中鋼甲特", "停牌股", "無報價"]):
+        code = str(9100 + i)
+        if name == "無報價":
+            rows.append([code, name, "--", "--", "--", "--", "--", "--", "--", "--", "--", "--", "--"])
+        else:
+            rows.append([code, name, "10.00", "0.00", "0.00%", "0.00%", "0.00%", "10.00", "10.00", "10.00",
+                         "10.00", "0", "0.00"])
+    rng.shuffle(rows)
+    cols = ["代號", "名稱", "價格▼", "漲跌", "漲跌幅", "周漲跌", "振幅", "開盤", "最高", "最低", "昨收", "成交量", "成交值(億)"]
+    return pd.DataFrame(rows, columns=cols).to_html(index=False)
+
+
+def load_page(args):
+    if args.synthetic:
+        return build_synthetic_page()
+    path = args.page or FIXTURE
+    if not os.path.exists(path):
+        import requests
+        print(f"📡 下載 {HISTOCK_URL} 並保存為 fixture...")
+        r = requests.get(HISTOCK_URL, headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}, timeout=30)
+        r.encoding = 'utf-8'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(r.text)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def bench(func, target_df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(target_df)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description='HiStock 行情表解析微基準測試')
+    parser.add_argument('--page', help='已保存的 HiStock 頁面 (HTML)')
+    parser.add_argument('--synthetic', action='store_true', help='以本地 history 資料產生頁面')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    html = load_page(args)
+    target_df = find_quote_table(pd.read_html(StringIO(html)), required=("代號", "價格"))
+    if target_df is None:
+        print("❌ 找不到行情表格")
+        return
+    print(f"📄 表格 {len(target_df)} 列 × {len(target_df.columns)} 欄")
+
+    t_old, old = bench(legacy_parse, target_df, args.repeat)
+    t_new, new = bench(vectorized_parse, target_df, args.repeat)
+
+    old = old.sort_values('Code').reset_index(drop=True)
+    new = new.sort_values('Code').reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(old, new, check_dtype=False)
+        same = "✅ 輸出一致"
+    except AssertionError as e:
+        same = f"❌ 輸出不一致: {e}"
+
+    print(f"   iterrows : {t_old * 1000:8.2f} ms")
+    print(f"   向量化   : {t_new * 1000:8.2f} ms  ({t_old / t_new:.1f}x)")
+    print(f"   {same}")
+
+
+if __name__ == "__main__":
+    main()
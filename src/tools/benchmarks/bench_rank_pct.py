@@ -0,0 +1,90 @@
+# === 微基準測試：橫截面百分位排名 (pandas DataFrame.rank vs utils.indicators.rank_pct) ===
+# 用法：
+#     python bench_rank_pct.py                 # 使用市場矩陣快取的 ibd_raw (float32) / mansfield_raw (float64)
+#     python bench_rank_pct.py --rows 1500     # 只取最後 1500 個交易日
+#     python bench_rank_pct.py --synthetic     # 離線：隨機 1500 × 1950 矩陣 (含 NaN 與同值)
+#
+# 全段：pandas rank(axis=1, pct=True) vs rank_pct
+# 增量：pandas 排名整個暖身視窗 (252 + 1 列) 再取最後一列 vs rank_pct(last_n=1)
+# 兩種做法都比對輸出是否逐位元一致。
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+TOOLS_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_ROOT = os.path.dirname(TOOLS_ROOT)
+sys.path.insert(0, SRC_ROOT)
+sys.path.insert(0, os.path.join(TOOLS_ROOT, "data_pipeline"))
+from utils.indicators import rank_pct
+
+CACHE_DIR = os.path.join(SRC_ROOT, "cache", "market_matrix")
+WARMUP_ROWS = 252
+
+
+def load_matrices(args):
+    """回傳 {名稱: DataFrame}"""
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(args.rows, 1950)).astype('float32')
+        values[rng.random(values.shape) < 0.15] = np.nan
+        values[:, :20] = np.round(values[:, :20], 1)   # 一部分欄位製造同值
+        return {'synthetic_f32': pd.DataFrame(values),
+                'synthetic_f64': pd.DataFrame(values.astype('float64') * 1.0000001)}
+
+    from utils.matrix_cache import load_matrix_cache
+    from utils.indicator_registry import compute
+    from optimize_matrix import load_taiex_series
+
+    data = load_matrix_cache(CACHE_DIR)
+    if data is None:
+        print("❌ 找不到市場矩陣快取，請先執行 optimize_matrix.py 或改用 --synthetic")
+        return {}
+    sources = {k: data[k] for k in ('close', 'high', 'low', 'volume')}
+    sources['taiex'] = load_taiex_series(sources['close'].index)
+    values = compute(['ibd_raw', 'mansfield_raw'], sources, verbose=False)
+    return {k: values[k].iloc[-args.rows:] for k in ('ibd_raw', 'mansfield_raw') if values.get(k) is not None}
+
+
+def bench(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    parser = argparse.ArgumentParser(description='橫截面百分位排名微基準測試')
+    parser.add_argument('--rows', type=int, default=1500, help='取最後幾個交易日')
+    parser.add_argument('--synthetic', action='store_true', help='以隨機矩陣測試')
+    parser.add_argument('--workers', type=int, default=None, help='rank_pct 執行緒數 (預設 CPU 數)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, df in load_matrices(args).items():
+        print(f"\n📄 {name}: {df.shape[0]} 列 × {df.shape[1]} 欄 ({df.values.dtype})")
+
+        t_old, old = bench(lambda: df.rank(axis=1, pct=True).values, args.repeat)
+        t_new, new = bench(lambda: rank_pct(df.values, workers=args.workers), args.repeat)
+        same = "✅ 一致" if np.array_equal(old, new, equal_nan=True) else "❌ 不一致"
+        print(f"   全段  pandas : {t_old * 1000:8.2f} ms")
+        print(f"   全段  kernel : {t_new * 1000:8.2f} ms  ({t_old / t_new:.1f}x)  {same}")
+
+        window = df.iloc[-(WARMUP_ROWS + 1):]
+        t_old, old = bench(lambda: window.rank(axis=1, pct=True).values[-1:], args.repeat)
+        t_new, new = bench(lambda: rank_pct(df.values, last_n=1), args.repeat)
+        same = "✅ 一致" if np.array_equal(old, new, equal_nan=True) else "❌ 不一致"
+        print(f"   增量  pandas : {t_old * 1000:8.2f} ms")
+        print(f"   增量  kernel : {t_new * 1000:8.2f} ms  ({t_old / t_new:.1f}x)  {same}")
+
+
+if __name__ == "__main__":
+    main()
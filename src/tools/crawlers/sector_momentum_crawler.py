@@ -12,6 +12,7 @@ CMoney 族群資金動能數據爬蟲
 """
 
 import os
+import sys
 import time
 import pandas as pd
 from datetime import datetime
@@ -28,6 +29,12 @@ TOOLS_DIR = os.path.dirname(SCRIPT_DIR)
 SRC_DIR = os.path.dirname(TOOLS_DIR)
 DATA_DIR = os.path.join(SRC_DIR, "data_core")
 MARKET_META_DIR = os.path.join(DATA_DIR, "market_meta")
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+
+# 由專案根目錄匯入共用模組 (被策略以 importlib 載入時，utils 可能是策略自己的套件)
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+from src.utils.sector_archive import sync_archive
 
 # 確保目錄存在
 os.makedirs(MARKET_META_DIR, exist_ok=True)
@@ -414,6 +421,12 @@ def main():
         output_file = os.path.join(MARKET_META_DIR, f"sector_momentum_{today}.csv")
         final_df.to_csv(output_file, index=False, encoding='utf-8-sig')
         
+        # 併入族群資金動能歷史庫 (CSV 仍保留為原始資料)
+        try:
+            sync_archive(MARKET_META_DIR)
+        except Exception as e:
+            print(f"⚠️ 族群資金動能歷史庫更新失敗: {e}")
+        
         print(f"\n✅ 完成!")
         print(f"   檔案: {output_file}")
         print(f"   族群數: {len(final_df)}")
@@ -10,6 +10,15 @@ from io import StringIO
 from dotenv import load_dotenv
 load_dotenv()
 
+# 同目錄模組 (被其他腳本 import 時也能找到)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from finmind_downloader import FinMindDownloader
+from daily_ingest import DailyIngestBatch
+from history_index import HistoryIndex
+from quote_table import find_quote_table, normalize_quote_table
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.trading_calendar import get_calendar
+
 # ================= 設定區 =================
 # ★★★ 你的 FinMind Token (多組輪替) ★★★
 # ★★★ 你的 FinMind Token (多組輪替) ★★★
@@ -26,6 +35,9 @@ META_FOLDER = os.path.join(SRC_ROOT, "data_core", "market_meta")
 # 下載天數
 HISTORY_DAYS = 2000 
 
+# 各 CSV 最後一列索引 (sidecar manifest，所有寫入步驟共用)
+HISTORY_INDEX = HistoryIndex(DATA_FOLDER)
+
 # ================= 核心工具函數 =================
 
 def ensure_folder_exists():
@@ -72,6 +84,13 @@ def check_if_today_is_trading_day():
     print(f"📅 系統日期：{today_str}")
     print("🔍 正在檢查今日是否為「有效交易日」且「資料已產出」...")
     
+    # 本地交易日曆已確認為週末 / 假日：不必連線
+    calendar = get_calendar()
+    if calendar.lookup(today_str) is False:
+        print(f"💤 檢查結果：今日 ({today_str}) 非交易日 (交易日曆)。")
+        print("⛔ 程式將自動停止，不執行下載。")
+        return False
+    
     url = "https://api.finmindtrade.com/api/v4/data"
     parameter = {
         "dataset": "TaiwanStockPrice",
@@ -88,6 +107,7 @@ def check_if_today_is_trading_day():
         market_date = data["data"][-1]["date"]
         if market_date == today_str:
             print(f"✅ 確認成功！今日 ({today_str}) 是交易日，且資料已更新。")
+            calendar.record([today_str], today_str, today_str)
             return True
     
     print(f"💤 檢查結果：今日 ({today_str}) 無交易資料。")
@@ -116,87 +136,21 @@ def get_stock_list_universal():
             return []
 
         html_content = StringIO(response.text)
-        dfs = pd.read_html(html_content)
-        
-        target_df = None
-        for df in dfs:
-            cols = [str(c) for c in df.columns]
-            condition_a = any("代號" in c for c in cols) and any("名稱" in c for c in cols)
-            
-            if not condition_a and len(df) > 0:
-                row0 = [str(v) for v in df.iloc[0].values]
-                if any("代號" in r for r in row0):
-                    df.columns = df.iloc[0]
-                    df = df[1:]
-                    condition_a = True
-            
-            if condition_a:
-                target_df = df
-                break
-        
+        target_df = find_quote_table(pd.read_html(html_content), required=("代號", "名稱"))
         if target_df is None:
             return []
 
-        # 標準化欄位名稱
-        clean_cols = []
-        for c in target_df.columns:
-            c_str = str(c)
-            if "代號" in c_str: clean_cols.append("代號")
-            elif "名稱" in c_str: clean_cols.append("名稱")
-            elif "價格" in c_str: clean_cols.append("收盤")
-            elif "成交值" in c_str or "成交額" in c_str: clean_cols.append("成交值")
-            elif "周漲跌" in c_str or "週漲跌" in c_str: clean_cols.append("週漲跌")
-            elif "開盤" in c_str: clean_cols.append("開盤")
-            elif "最高" in c_str: clean_cols.append("最高")
-            elif "最低" in c_str: clean_cols.append("最低")
-            else: clean_cols.append(c_str)
-        target_df.columns = clean_cols
-
-        raw_codes = target_df['代號'].astype(str).tolist()
-        valid_list = []
-        filtered_count = 0
-        suspicious_codes = []  # 振幅=0 且成交值=0 的可疑股票
+        quotes = normalize_quote_table(target_df)
         
-        for idx, code in enumerate(raw_codes):
-            code = code.strip()
-            # 基本格式檢查：4位數字、不以0開頭
-            if len(code) == 4 and not code.startswith('0') and code.isdigit():
-                try:
-                    row = target_df.iloc[idx]
-                    
-                    # 過濾 DR 股和甲特股 (名稱欄位)
-                    stock_name = ""
-                    if "名稱" in target_df.columns:
-                        stock_name = str(row["名稱"])
-                    if "DR" in stock_name or "甲特" in stock_name:
-                        filtered_count += 1
-                        continue
-                    
-                    # 取得成交值
-                    trade_val = 0
-                    if "成交值" in target_df.columns:
-                        val_str = str(row["成交值"]).replace(",", "").replace("-", "0")
-                        try:
-                            trade_val = float(val_str) if val_str else 0
-                        except:
-                            trade_val = 0
-                    
-                    # 取得振幅
-                    amplitude = 0
-                    if "振幅" in target_df.columns:
-                        amp_str = str(row["振幅"]).replace("%", "").replace(",", "").replace("-", "0")
-                        try:
-                            amplitude = float(amp_str) if amp_str else 0
-                        except:
-                            amplitude = 0
-                    
-                    # 振幅=0 且 成交值=0 → 需要用 FinMind 驗證
-                    if trade_val == 0 and amplitude == 0:
-                        suspicious_codes.append(code)
-                    else:
-                        valid_list.append(code)
-                except:
-                    valid_list.append(code)
+        # 基本格式檢查：4位數字、不以0開頭；過濾 DR 股和甲特股
+        common = quotes[quotes['is_common']]
+        excluded = common['is_dr_or_pref']
+        filtered_count = int(excluded.sum())
+        common = common[~excluded]
+        
+        # 振幅=0 且 成交值=0 → 需要用 FinMind 驗證
+        valid_list = common.loc[~common['is_zero_activity'], 'Code'].tolist()
+        suspicious_codes = common.loc[common['is_zero_activity'], 'Code'].tolist()
         
         # 使用 FinMind 驗證可疑股票
         if suspicious_codes:
@@ -255,35 +209,29 @@ def get_stock_list_universal():
 
 # ================= 第二部分：FinMind 下載器 (多執行緒並行版) =================
 
-def update_stock_single(stock_id, token):
-    """ 單一股票更新 (輔助函式) """
+def update_stock_single(stock_id, fetch):
+    """
+    單一股票更新 (輔助函式)
+    fetch: fetch(parameter) -> JSON，由 FinMindDownloader 負責 Token / 限速 / 重試
+    """
     file_path = os.path.join(DATA_FOLDER, f"{stock_id}.csv")
     today_str = datetime.now().strftime('%Y-%m-%d')
     start_date = (datetime.now() - timedelta(days=HISTORY_DAYS)).strftime('%Y-%m-%d')
     query_start_date = start_date
 
-    # 1. 檢查是否需要更新
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-                if len(lines) > 1:
-                    last_line = lines[-1].strip()
-                    last_date = last_line.split(',')[0]
-                    if last_date == today_str: return False # 已是最新
-                    if len(last_date) == 10: query_start_date = last_date
-        except: pass
+    # 1. 檢查是否需要更新 (查最後一列索引，不讀整個檔案)
+    last_date = HISTORY_INDEX.last_date(stock_id)
+    if last_date == today_str: return False # 已是最新
+    if len(last_date) == 10: query_start_date = last_date
 
     # 2. 下載資料
-    url = "https://api.finmindtrade.com/api/v4/data"
     parameter = {
         "dataset": "TaiwanStockPrice",
         "data_id": stock_id,
-        "start_date": query_start_date,
-        "token": token
+        "start_date": query_start_date
     }
     
-    data = safe_request(url, parameter)
+    data = fetch(parameter)
     if data and "data" in data and len(data["data"]) > 0:
         df_new = pd.DataFrame(data["data"])
         df_new = df_new[['date', 'open', 'max', 'min', 'close', 'Trading_Volume']]
@@ -302,56 +250,47 @@ def update_stock_single(stock_id, token):
             df_final = df_new
             
         df_final.to_csv(file_path, index=False, float_format='%.2f')
+        HISTORY_INDEX.update(stock_id)
         return True
     return False
 
 def orchestrate_update(missing_stocks):
     """ 
-    單執行緒 + Token 輪替下載器 
-    (解決 402 Rate Limit 問題) 
+    多執行緒 + Token 輪替下載器 
+    (每組 Token 以 Token Bucket 限速，402/429 時該 Token 共用退避)
     """
     total = len(missing_stocks)
-    num_keys = len(API_KEYS)
+    downloader = FinMindDownloader(API_KEYS)
     print(f"\n🚀 啟動 FinMind 安全補漏機制")
-    print(f"🔥 待補股票: {total} 檔 | 可用 Token: {num_keys} 組")
-    print(f"⚡ 策略: 單執行緒輪替 Token (Round-Robin) + 安全間隔")
+    print(f"🔥 待補股票: {total} 檔 | 可用 Token: {len(downloader.keys)} 組")
+    print(f"⚡ 策略: {downloader.max_workers} 執行緒並行 + Token 輪替 (Round-Robin) + 配額限速")
 
     updated_count = 0
+    start = time.time()
     
-    for i, stock_id in enumerate(missing_stocks):
-        # 輪替使用 Token
-        token = API_KEYS[i % num_keys]
-        
-        # 顯示進度
-        print(f"[{i+1}/{total}] 檢查 {stock_id} (Token: ...{token[-4:]})...", end="\r")
-        
-        try:
-            is_updated = update_stock_single(stock_id, token)
-            if is_updated:
-                updated_count += 1
-                sys.stdout.write(f"[{i+1}/{total}] {stock_id} ✅ 更新成功      \n")
-                # 成功後休息久一點 (2秒)
-                time.sleep(2.0)
-            else:
-                # 沒資料更新，稍微休息即可 (1秒)
-                time.sleep(1.0)
-                
-        except Exception as e:
-            print(f"❌ {stock_id} 失敗: {e}")
-            time.sleep(1.0)
+    for done, (stock_id, is_updated, err) in enumerate(downloader.map(update_stock_single, missing_stocks), 1):
+        if err is not None:
+            print(f"❌ {stock_id} 失敗: {err}")
+        elif is_updated:
+            updated_count += 1
+            sys.stdout.write(f"[{done}/{total}] {stock_id} ✅ 更新成功      \n")
+        else:
+            print(f"[{done}/{total}] 檢查 {stock_id}...", end="\r")
             
-    print(f"\n🎉 補漏完成！共更新 {updated_count} 檔。")
+    HISTORY_INDEX.save()
+    print(f"\n🎉 補漏完成！共更新 {updated_count} 檔。(耗時 {time.time() - start:.1f} 秒)")
 
 # ================= 主程式 =================
 # ================= 第三部分：官方雙刀流下載器 (TWSE + TPEx) =================
 
-def update_daily_official(valid_whitelist=None, force=False):
+def update_daily_official(valid_whitelist=None, force=False, batch=None):
     """
     使用官方來源抓取「當日」所有股票行情
     1. TWSE (OpenAPI) -> 上市
     2. TPEx (Web JSON) -> 上櫃
     
     優點：只需 2 次請求即可更新全市場，避開 FinMind IP 限制。
+    batch: DailyIngestBatch，由呼叫端統一提交；None 時在函式結束前自行提交
     """
     print("\n🚀 啟動「官方雙刀流」更新模式 (TWSE + TPEx)")
     
@@ -422,86 +361,31 @@ def update_daily_official(valid_whitelist=None, force=False):
             return False
 
     print("💾 正在整合並寫入本地資料庫...")
-    updated_count = 0
     
-    # 建立要更新的資料表 (Code -> DataDict)
-    # 格式統一轉為: Date, Open, High, Low, Close, Volume
+    # 整合成一張行情表 (Code, Date, Open, High, Low, Close, Volume, Amount)
+    # TWSE API: Code, Date, TradeVolume, OpeningPrice, HighestPrice, LowestPrice, ClosingPrice
+    # TPEx API: SecuritiesCompanyCode, Date, Open, High, Low, Close, TradingShares (已經是股數)
+    df_snapshot = pd.concat([
+        _normalize_official_quotes(twse_data, 'Code',
+                                   ['OpeningPrice', 'HighestPrice', 'LowestPrice', 'ClosingPrice', 'TradeVolume']),
+        _normalize_official_quotes(tpex_data, 'SecuritiesCompanyCode',
+                                   ['Open', 'High', 'Low', 'Close', 'TradingShares']),
+    ], ignore_index=True)
     
-    # 處理 TWSE
-    # API: Code, Name, TradeVolume, TradeValue, OpeningPrice, HighestPrice, LowestPrice, ClosingPrice
-    for row in twse_data:
-        try:
-            code = row['Code']
-            # ★ 篩選：4碼且首位非0 (排除 ETF/權證)
-            if len(code) != 4 or code.startswith('0'):
-                continue
-
-            # [Optimization] Whitelist Check
-            if valid_whitelist is not None and code not in valid_whitelist:
-                continue
-
-            # 日期轉西元 (TWSE 給的是民國 1131224)
-            d_str = row['Date'] # 1131224
-            y = int(d_str[:3]) + 1911
-            m = d_str[3:5]
-            d = d_str[5:7]
-            date_ad = f"{y}-{m}-{d}"
-            
-            # 數值處理 (去除逗號)
-            vol = float(row['TradeVolume'].replace(',', ''))
-            op = float(row['OpeningPrice'].replace(',', ''))
-            hi = float(row['HighestPrice'].replace(',', ''))
-            lo = float(row['LowestPrice'].replace(',', ''))
-            cl = float(row['ClosingPrice'].replace(',', ''))
-            
-            # Calculate Amount
-            amount = cl * vol
-            
-            # 存擋
-            save_to_csv(code, date_ad, op, hi, lo, cl, vol, amount)
-            updated_count += 1
-        except:
-            pass
-            
-    # 處理 TPEx (Open API)
-    # JSON Keys: Date, SecuritiesCompanyCode, Close, Open, High, Low, TradingShares
-    for row in tpex_data:
-        try:
-            code = row['SecuritiesCompanyCode']
-            
-            # ★ 篩選：4碼且首位非0 (排除 ETF/權證)
-            if len(code) != 4 or code.startswith('0'):
-                continue
-
-            # [Optimization] Whitelist Check
-            if valid_whitelist is not None and code not in valid_whitelist:
-                continue
-
-            # 日期轉西元 (TPEx Open API 給的是民國 1141224)
-            d_str = row['Date']
-            y = int(d_str[:3]) + 1911
-            m = d_str[3:5]
-            d = d_str[5:7]
-            date_ad = f"{y}-{m}-{d}"
-            
-            cl = float(row['Close'])
-            op = float(row['Open'])
-            hi = float(row['High'])
-            lo = float(row['Low'])
-            vol = float(row['TradingShares']) # 已經是股數
-            
-            # 排除無交易 (---)
-            if str(cl) == '---' or  str(op) == '---': continue
-
-            # Calculate Amount
-            amount = cl * vol
-
-            save_to_csv(code, date_ad, op, hi, lo, cl, vol, amount)
-            updated_count += 1
-        except:
-            pass
-
-    print(f"✅ 官方資料更新完成！共處理 {updated_count} 檔。")
+    # ★ 篩選：4碼且首位非0 (排除 ETF/權證)
+    df_snapshot = df_snapshot[(df_snapshot['Code'].str.len() == 4) & ~df_snapshot['Code'].str.startswith('0')]
+    # [Optimization] Whitelist Check
+    if valid_whitelist is not None:
+        df_snapshot = df_snapshot[df_snapshot['Code'].isin(valid_whitelist)]
+    
+    own_batch = batch is None
+    if own_batch:
+        batch = DailyIngestBatch(DATA_FOLDER, index=HISTORY_INDEX)
+    updated_count, skipped_count = batch.add_frame(df_snapshot)
+    if own_batch:
+        batch.commit()
+
+    print(f"✅ 官方資料更新完成！共更新 {updated_count} 檔 (略過 {skipped_count} 檔)。")
     
     # 建立已更新清單 (Set)
     updated_codes = set()
@@ -512,69 +396,61 @@ def update_daily_official(valid_whitelist=None, force=False):
         
     return updated_codes
 
-def save_to_csv(code, date_str, op, hi, lo, cl, vol, amount=None):
-    """ 將單筆資料 Append 到 CSV """
-    file_path = os.path.join(DATA_FOLDER, f"{code}.csv")
+def _normalize_official_quotes(rows, code_col, value_cols):
+    """
+    將官方 API 的 JSON 列轉成統一格式的 DataFrame
+    value_cols: 依序對應 Open, High, Low, Close, Volume 的原始欄位
+    無法解析的列 (例如 '---' 無交易、日期錯誤) 直接排除
+    """
+    out_cols = ['Code', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Amount']
+    if not rows:
+        return pd.DataFrame(columns=out_cols)
     
-    # 計算 Amount 如果未提供
-    if amount is None:
-        try:
-            amount = float(cl) * float(vol)
-        except:
-            amount = 0.0
-
-    # 如果檔案不存在，自動建立並寫入 Header
-    if not os.path.exists(file_path):
-        print(f"🆕 發現新股票: {code}，建立檔案中...")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write("Date,Open,High,Low,Close,Volume,Amount\n")
+    df = pd.DataFrame(rows)
+    if code_col not in df.columns or 'Date' not in df.columns or any(c not in df.columns for c in value_cols):
+        return pd.DataFrame(columns=out_cols)
+    
+    out = pd.DataFrame({'Code': df[code_col].astype(str).str.strip()})
+    
+    # 日期轉西元 (民國 1131224 -> 2024-12-24)
+    d_str = df['Date'].astype(str)
+    year = pd.to_numeric(d_str.str[:3], errors='coerce') + 1911
+    out['Date'] = year.astype('Int64').astype(str) + '-' + d_str.str[3:5] + '-' + d_str.str[5:7]
+    
+    # 數值處理 (去除逗號)
+    for dst, src in zip(['Open', 'High', 'Low', 'Close', 'Volume'], value_cols):
+        out[dst] = pd.to_numeric(df[src].astype(str).str.replace(',', '', regex=False), errors='coerce').astype('float64')
+    
+    out = out[year.notna() & out[['Open', 'High', 'Low', 'Close', 'Volume']].notna().all(axis=1)]
+    # Calculate Amount
+    out['Amount'] = out['Close'] * out['Volume']
+    return out[out_cols]
 
-    # 讀取最後一行檢查日期和資料重複
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            if len(lines) > 1:
-                last_line = lines[-1].strip()
-                parts = last_line.split(',')
-                last_date = parts[0]
-                if last_date == date_str:
-                    return "SKIPPED"  # 日期完全相同，跳過
-                # 防止假資料：如果 OHLCV 與最後一行完全一致（非交易日重複），也跳過
-                if len(parts) >= 6:
-                    try:
-                        last_ohlcv = (float(parts[1]), float(parts[2]), float(parts[3]), float(parts[4]), float(parts[5]))
-                        new_ohlcv = (float(op), float(hi), float(lo), float(cl), float(vol))
-                        if last_ohlcv == new_ohlcv:
-                            return "SKIPPED"  # OHLCV 完全一致 = 非交易日假資料
-                    except:
-                        pass
-    except:
-        pass
-
-    # Append 寫入
-    # 格式: Date, Open, High, Low, Close, Volume, Amount
-    new_line = f"{date_str},{op},{hi},{lo},{cl},{vol},{amount:.2f}\n"
+def save_to_csv(code, date_str, op, hi, lo, cl, vol, amount=None):
+    """ 將單筆資料 Append 到 CSV (單筆版；大量寫入請用 DailyIngestBatch) """
+    batch = DailyIngestBatch(DATA_FOLDER, index=HISTORY_INDEX)
+    status = batch.add(code, date_str, op, hi, lo, cl, vol, amount)
     try:
-        with open(file_path, 'a', encoding='utf-8') as f:
-            f.write(new_line)
-            f.flush()
-            os.fsync(f.fileno())
-        if code == "2330": print("   [DEBUG] 2330 Written & Flushed.")
-        return True
+        batch.commit()
     except Exception as e:
         print(f"❌ Write Error {code}: {e}")
         return False
+    return status
 
-def update_from_histock(already_updated_codes, valid_whitelist=None):
+def update_from_histock(already_updated_codes, valid_whitelist=None, batch=None):
     """
     從 HiStock 抓取全市場行情 (作為第二道防線)
     valid_whitelist: 僅允許更新的股票代號集合 (Strict Filter)
+    batch: DailyIngestBatch，由呼叫端統一提交；None 時在函式結束前自行提交
     """
     print("\n📡 2. 連線至 HiStock (通用備援機制)...")
     url = "https://histock.tw/stock/rank.aspx?p=all"
     
     updated_count = 0
     new_updated_codes = set()
+    own_batch = batch is None
+    if own_batch:
+        batch = DailyIngestBatch(DATA_FOLDER, index=HISTORY_INDEX)
     
     try:
         headers = {
@@ -588,125 +464,42 @@ def update_from_histock(already_updated_codes, valid_whitelist=None):
             return new_updated_codes
 
         # Parse HTML Table
-        dfs = pd.read_html(StringIO(r.text))
-        target_df = None
-        for df in dfs:
-            # Check cols
-            cols = [str(c) for c in df.columns]
-            if any("代號" in c for c in cols) and any("價格" in c for c in cols):
-                target_df = df
-                break
-        
+        target_df = find_quote_table(pd.read_html(StringIO(r.text)), required=("代號", "價格"))
         if target_df is None:
             print("   ❌ 解析失敗: 找不到目標表格")
             return new_updated_codes
 
-        # Debug: Print columns
-        # print(f"   Table Columns: {target_df.columns.tolist()}")
-
-        # Clean columns: remove spaces, newlines, and sort arrows
-        clean_cols = []
-        for c in target_df.columns:
-            clean_cols.append(str(c).strip().replace(" ", "").replace("\n", "").replace("▼", ""))
-        target_df.columns = clean_cols
-        
-        # Verify '代號' exists exactly
-        if '代號' not in target_df.columns:
-            # Try to find which column is code
-            # usually col 0
-            if '代號' in str(target_df.columns[0]):
-                target_df.rename(columns={target_df.columns[0]: '代號'}, inplace=True)
-            else:
-                print(f"   ❌ 找不到 '代號' 欄位. Columns: {target_df.columns}")
-                return new_updated_codes
-
         today_ad = datetime.now().strftime('%Y-%m-%d')
         
-        processed_df = target_df[target_df['代號'].astype(str).str.len() == 4] # Filter broadly first
+        # 一次清理整張表 (價格 / 開高低 / 成交量(張) / 成交值(億))
+        quotes = normalize_quote_table(target_df)
         
-        print(f"   🔍 HiStock 抓到 {len(processed_df)} 筆資料，正在篩選與寫入...")
-
-        for idx, row in processed_df.iterrows():
-            try:
-                code_raw = str(row['代號']).strip()
-                # 嚴格篩選
-                if len(code_raw) != 4 or code_raw.startswith('0') or not code_raw.isdigit():
-                    continue
-                
-                # [Optimization] Whitelist Check
-                if valid_whitelist is not None:
-                    if code_raw not in valid_whitelist:
-                        continue
-                
-                # Check if already updated by Official (Set check is fast)
-                if code_raw in already_updated_codes:
-                    continue
-
-                # Extract Data
-                # Note: HiStock uses '-' for no data?
-                def parse_val(v):
-                    s = str(v).replace(',', '').strip()
-                    if s == '--' or s == '': return None
-                    try: return float(s)
-                    except: return None
-                
-                # Column names might differ slightly (e.g. '價格' vs '成交')
-                # Strict Mapping based on User Screenshot:
-                # [代號, 名稱, 價格, 漲跌, 漲跌幅, 周漲跌, 振幅, 開盤, 最高, 最低, 昨收, 成交量, 成交值(億)]
-                # We need: 價格(Close), 開盤(Open), 最高(High), 最低(Low), 成交量(Volume), 成交值(億)(Amount)
-                
-                # Check exact keys from screenshot (after cleaning '▼')
-                cl = parse_val(row.get('價格')) or parse_val(row.get('成交'))
-                op = parse_val(row.get('開盤')) or cl
-                hi = parse_val(row.get('最高')) or cl
-                lo = parse_val(row.get('最低')) or cl
-                vol_lots = parse_val(row.get('成交量'))
-                amount_億 = parse_val(row.get('成交值(億)'))
-                
-                if cl is None: continue
-                if op is None: op = cl
-                if hi is None: hi = cl
-                if lo is None: lo = cl
-                if vol_lots is None: vol_lots = 0
-                
-                vol_shares = int(vol_lots * 1000)
-                
-                # 優先使用 HiStock 的成交值(億),如果沒有才用計算方式
-                if amount_億 is not None and amount_億 > 0:
-                    amount = float(amount_億) * 100000000  # 億轉換為元
-                else:
-                    amount = float(cl) * vol_shares  # 備用計算方式
-                
-                # Save
-                if code_raw == "2330":
-                    print(f"[DEBUG] Processing 2330: Price={cl}, Vol={vol_shares}, Amt={amount}, Date={today_ad}")
-                
-                status_save = save_to_csv(code_raw, today_ad, op, hi, lo, cl, vol_shares, amount)
-                
-                if status_save is False: 
-                    # Error occurred
-                    continue
-                
-                new_updated_codes.add(code_raw)
-                
-                if status_save == "SKIPPED":
-                    # Skipped due to up-to-date, but track it as processed
-                    continue
-                    
-                if code_raw == "2330":
-                    print(f"[DEBUG] 2330 Save Status: {status_save}")
-
-                updated_count += 1
-                new_updated_codes.add(code_raw)
-                
-            except Exception as inner_e:
-                print(f"Row Error {code_raw}: {inner_e}")
-                continue
+        print(f"   🔍 HiStock 抓到 {int((quotes['Code'].str.len() == 4).sum())} 筆資料，正在篩選與寫入...")
+
+        # 嚴格篩選：普通股、有價格、在白名單內、官方資料尚未更新
+        mask = quotes['is_common'] & quotes['Close'].notna()
+        if valid_whitelist is not None:
+            mask &= quotes['Code'].isin(valid_whitelist)
+        mask &= ~quotes['Code'].isin(already_updated_codes)
+        quotes = quotes[mask].drop_duplicates('Code')
+        quotes['Date'] = today_ad
+
+        row_2330 = quotes[quotes['Code'] == "2330"]
+        if not row_2330.empty:
+            r0 = row_2330.iloc[0]
+            print(f"[DEBUG] Processing 2330: Price={r0['Close']}, Vol={r0['Volume']}, Amt={r0['Amount']}, Date={today_ad}")
+        
+        # 已是最新 (SKIPPED) 的也視為已處理
+        updated_count, _ = batch.add_frame(quotes)
+        new_updated_codes.update(quotes['Code'])
 
         print(f"   ✅ HiStock 更新完成！共補足 {updated_count} 檔。")
         
     except Exception as e:
         print(f"   ❌ HiStock 執行錯誤: {e}")
+    
+    if own_batch:
+        batch.commit()
         
     return new_updated_codes
 
@@ -762,16 +555,24 @@ if __name__ == "__main__":
     today_str = datetime.now().strftime('%Y-%m-%d')
     print(f"📅 執行日期: {today_str}")
 
+    # HiStock + 官方來源共用同一個批次，最後一次寫入
+    batch = DailyIngestBatch(DATA_FOLDER, index=HISTORY_INDEX)
+
     # 2. ★ 優先：HiStock (User Request Preferred Source)
     print("\n🚀 啟動 Step 1: HiStock 爬蟲 (優先來源)...")
     # strict_whitelist = all_stocks (only these are allowed)
-    updated_codes = update_from_histock(set(), valid_whitelist=set(all_stocks))
+    updated_codes = update_from_histock(set(), valid_whitelist=set(all_stocks), batch=batch)
     
     # 3. ★ 次要：官方雙刀流 (TWSE + TPEx)
     print("\n🚀 啟動 Step 2: 官方雙刀流 (TWSE+TPEx) (補足 HiStock 缺漏)...")
     # Official function returns False if completely failed, or a set if succeeded
     force_mode = "--force" in sys.argv
-    official_res = update_daily_official(valid_whitelist=set(all_stocks), force=force_mode)
+    official_res = update_daily_official(valid_whitelist=set(all_stocks), force=force_mode, batch=batch)
+    
+    # 一次提交當日所有新資料 (FinMind 補漏前必須落盤)
+    t0 = time.time()
+    written = batch.commit()
+    print(f"💾 批次寫入完成: {written} 檔 ({time.time() - t0:.2f} 秒)")
     
     if official_res is not False:
         updated_codes.update(official_res)
@@ -11,9 +11,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from history_index import HistoryIndex
+
 # ================= 設定區 =================
 SRC_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_FOLDER = os.path.join(SRC_ROOT, "data_core", "history")
+HISTORY_INDEX = HistoryIndex(DATA_FOLDER)
 
 # FinMind 設定
 FINMIND_TOKEN = os.getenv("FINMIND_TOKEN", "")
@@ -29,21 +33,10 @@ REQUEST_DELAY = 6
 
 def get_stocks_needing_update(target_date: str = TARGET_DATE) -> list:
     """
-    掃描所有 CSV，找出需要更新的股票 (最後日期 < target_date)
+    找出需要更新的股票 (最後日期 < target_date)，查最後一列索引，不讀整個 CSV
     """
-    need_update = []
-    csv_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.csv')]
-    
-    for f in csv_files:
-        try:
-            df = pd.read_csv(os.path.join(DATA_FOLDER, f))
-            if len(df) > 0:
-                last_date = str(df['Date'].iloc[-1])
-                if last_date < target_date:
-                    need_update.append(f.replace('.csv', ''))
-        except:
-            pass
-    
+    need_update = HISTORY_INDEX.stale_codes(target_date)
+    HISTORY_INDEX.save()
     return need_update
 
 
@@ -113,6 +106,7 @@ def update_stock_csv(stock_id: str, new_data: pd.DataFrame) -> int:
     
     if not os.path.exists(file_path):
         new_data.to_csv(file_path, index=False, float_format='%.2f')
+        HISTORY_INDEX.update(stock_id)
         return len(new_data)
     
     try:
@@ -129,6 +123,7 @@ def update_stock_csv(stock_id: str, new_data: pd.DataFrame) -> int:
         df_merged = df_merged.sort_values('Date')
         
         df_merged.to_csv(file_path, index=False, float_format='%.2f')
+        HISTORY_INDEX.update(stock_id)
         return len(new_rows)
         
     except Exception as e:
@@ -191,6 +186,7 @@ def main():
             csv_path = os.path.join(DATA_FOLDER, f"{stock_id}.csv")
             if os.path.exists(csv_path):
                 os.remove(csv_path)
+                HISTORY_INDEX.remove(stock_id)
                 print("🗑️ 已刪除 (下市)")
                 deleted_count += 1
             else:
@@ -209,6 +205,8 @@ def main():
         if i < len(stocks) - 1:
             time.sleep(REQUEST_DELAY)
     
+    HISTORY_INDEX.save()
+    
     # 3. 總結
     total_time = time.time() - start_time
     print("\n" + "=" * 60)
@@ -1,15 +1,24 @@
 # === 歷史資料補齊腳本：使用官方 TWSE/TPEx CSV ===
 # 用途：補齊 2026 年 1 月歷史資料 (個股 + 大盤)
+#
+# 全市場模式 (--bulk)：改用交易所「單日全部個股」報表，一個交易日每個市場只發一次請求
+#     python backfill_history.py --bulk 2026-01-01 2026-01-31
+#     中斷後重新執行相同指令會從 checkpoint 接續 (--fresh 重新抓取)
 
 import os
 import sys
+import json
 import time
 import requests
 import pandas as pd
 from datetime import datetime
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from finmind_downloader import TokenBucket
+from history_index import HistoryIndex
+
 load_dotenv()
 
 # ================= 設定區 =================
@@ -23,6 +32,13 @@ TARGET_YEAR_MONTH = "20260101"  # 西元 2026 年 1 月
 # 限速設定
 REQUEST_DELAY = 0.5  # 每次請求間隔 (秒)
 
+# 全市場模式設定
+BULK_DIR = os.path.join(SRC_ROOT, "cache", "backfill")     # 單日報表暫存 + checkpoint
+BULK_CHECKPOINT = os.path.join(BULK_DIR, "checkpoint.json")
+BULK_WORKERS = 4            # 同時進行的請求數
+BULK_RATE_PER_SEC = 0.5     # 每個市場每秒請求數 (證交所約每 5 秒 3 次會封鎖 IP)
+BULK_ATTEMPTS = 3
+
 # ================= 核心函數 =================
 
 def fetch_twse_monthly(stock_id: str, date_yyyymmdd: str = TARGET_YEAR_MONTH) -> pd.DataFrame:
@@ -332,6 +348,211 @@ def update_taiex_via_finmind():
         print(f"  ❌ 大盤更新失敗: {e}")
         return False
 
+# ================= 全市場模式 (單日全部個股報表) =================
+
+BULK_COLUMNS = ['Code', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Amount']
+
+# 各市場的單日報表：欄位名稱依序對應 Code, Open, High, Low, Close, Volume
+BULK_MARKETS = {
+    "twse": {
+        "url": "https://www.twse.com.tw/rwd/zh/afterTrading/MI_INDEX",
+        "params": lambda d: {"date": d.strftime('%Y%m%d'), "type": "ALLBUT0999", "response": "json"},
+        "fields": ['證券代號', '開盤價', '最高價', '最低價', '收盤價', '成交股數'],
+    },
+    "tpex": {
+        "url": "https://www.tpex.org.tw/www/zh-tw/afterTrading/dailyQ",
+        "params": lambda d: {"date": d.strftime('%Y/%m/%d'), "id": "", "response": "json"},
+        "fields": ['代號', '開盤', '最高', '最低', '收盤', '成交股數'],
+    },
+}
+
+
+def _find_quote_table(payload, fields):
+    """從回傳的 JSON 找出含有全部欄位的表格，回傳 (欄位, 資料列)；找不到回傳 None"""
+    tables = list(payload.get('tables') or [])
+    # 舊版格式：fields1/data1 ... fields9/data9
+    for key, val in payload.items():
+        if key.startswith('fields') and isinstance(val, list):
+            tables.append({'fields': val, 'data': payload.get('data' + key[len('fields'):], [])})
+    for table in tables:
+        names = [str(c).strip() for c in table.get('fields') or []]
+        if all(f in names for f in fields):
+            return names, table.get('data') or []
+    return None
+
+
+def _quotes_frame(names, rows, fields, date_str):
+    """
+    將單日報表轉成統一格式 (與 Pipeline_data._normalize_official_quotes 相同)
+    無交易 ('--') 的列直接排除，不寫入 0
+    """
+    if not rows:
+        return pd.DataFrame(columns=BULK_COLUMNS)
+    width = len(names)
+    df = pd.DataFrame([r[:width] for r in rows if len(r) >= width], columns=names)
+
+    out = pd.DataFrame({'Code': df[fields[0]].astype(str).str.strip()})
+    out['Date'] = date_str
+    for dst, src in zip(['Open', 'High', 'Low', 'Close', 'Volume'], fields[1:]):
+        out[dst] = pd.to_numeric(df[src].astype(str).str.replace(',', '', regex=False), errors='coerce').astype('float64')
+    out = out[out[['Open', 'High', 'Low', 'Close', 'Volume']].notna().all(axis=1)]
+    out['Amount'] = out['Close'] * out['Volume']
+    return out[BULK_COLUMNS]
+
+
+def fetch_market_day(market, day):
+    """
+    抓取單一市場某一天的全部個股行情
+
+    Returns:
+        DataFrame (BULK_COLUMNS)；非交易日回傳空表
+    Raises:
+        連線 / 格式錯誤 (呼叫端重試，不寫入 checkpoint)
+    """
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    spec = BULK_MARKETS[market]
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+    }
+    resp = requests.get(spec["url"], params=spec["params"](day), headers=headers, timeout=20, verify=False)
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    payload = resp.json()
+
+    found = _find_quote_table(payload, spec["fields"])
+    if found is None:
+        # 非交易日：證交所 stat 為「很抱歉，沒有符合條件的資料!」，櫃買回傳空表
+        if str(payload.get('stat', '')).upper() != 'OK' or not payload.get('tables'):
+            return pd.DataFrame(columns=BULK_COLUMNS)
+        raise RuntimeError("找不到行情表格")
+    names, rows = found
+    return _quotes_frame(names, rows, spec["fields"], day.strftime('%Y-%m-%d'))
+
+
+def _day_file(market, day):
+    return os.path.join(BULK_DIR, f"{market}_{day.strftime('%Y%m%d')}.csv")
+
+
+def _load_checkpoint():
+    try:
+        with open(BULK_CHECKPOINT, 'r', encoding='utf-8') as f:
+            return {m: set(v) for m, v in json.load(f).get('done', {}).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(done):
+    tmp_path = f"{BULK_CHECKPOINT}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'done': {m: sorted(v) for m, v in done.items()}}, f, indent=0)
+    os.replace(tmp_path, BULK_CHECKPOINT)
+
+
+def fetch_bulk_range(start, end, workers=BULK_WORKERS, fresh=False):
+    """
+    以單日全部個股報表抓取日期區間 (含頭尾)
+
+    - 每個平日、每個市場一次請求，並行數上限 workers，各市場各自限速
+    - 每抓完一天就暫存到 BULK_DIR 並記錄 checkpoint，中斷後重跑只抓缺的日子
+
+    Returns:
+        (區間內全部行情 DataFrame, 失敗的 (市場, 日期) 清單)
+    """
+    os.makedirs(BULK_DIR, exist_ok=True)
+    days = list(pd.bdate_range(start, end))
+    done = {} if fresh else _load_checkpoint()
+    for market in BULK_MARKETS:
+        done.setdefault(market, set())
+
+    tasks = [(m, d) for d in days for m in BULK_MARKETS if d.strftime('%Y%m%d') not in done[m]]
+    print(f"📅 區間 {days[0].date() if days else start} ~ {days[-1].date() if days else end}："
+          f"{len(days)} 個平日，待抓取 {len(tasks)} 個 (市場, 日期)")
+
+    buckets = {m: TokenBucket(BULK_RATE_PER_SEC, 1) for m in BULK_MARKETS}
+
+    def work(task):
+        market, day = task
+        last_error = None
+        for attempt in range(BULK_ATTEMPTS):
+            wait = buckets[market].try_acquire()
+            while wait > 0:
+                time.sleep(wait)
+                wait = buckets[market].try_acquire()
+            try:
+                df = fetch_market_day(market, day)
+                df.to_csv(_day_file(market, day), index=False)
+                return len(df)
+            except Exception as e:
+                last_error = e
+                time.sleep(3 * (attempt + 1))
+        raise last_error
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(work, t): t for t in tasks}
+        for i, fut in enumerate(as_completed(futures), 1):
+            market, day = futures[fut]
+            try:
+                n = fut.result()
+            except Exception as e:
+                failed.append((market, day.strftime('%Y-%m-%d')))
+                print(f"[{i}/{len(tasks)}] ❌ {market.upper()} {day.date()}: {e}")
+                continue
+            done[market].add(day.strftime('%Y%m%d'))
+            _save_checkpoint(done)
+            print(f"[{i}/{len(tasks)}] ✅ {market.upper()} {day.date()}: {n} 檔" if n else
+                  f"[{i}/{len(tasks)}] ⏭️ {market.upper()} {day.date()}: 非交易日")
+
+    frames = []
+    for day in days:
+        for market in BULK_MARKETS:
+            path = _day_file(market, day)
+            if day.strftime('%Y%m%d') in done[market] and os.path.exists(path):
+                frames.append(pd.read_csv(path, dtype={'Code': str}))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=BULK_COLUMNS), failed
+    return pd.concat(frames, ignore_index=True), failed
+
+
+def main_bulk(start, end, workers=BULK_WORKERS, fresh=False):
+    """
+    全市場模式：抓取區間內的單日報表，再逐檔合併 (每檔 CSV 只讀寫一次)
+    """
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    print("=" * 60)
+    print("📅 歷史資料補齊腳本 (全市場模式)")
+    print(f"📁 資料目錄: {DATA_FOLDER}")
+    print("=" * 60)
+
+    df_all, failed = fetch_bulk_range(start, end, workers=workers, fresh=fresh)
+
+    # ★ 與每日更新相同：4碼且首位非0，且只補已有資料檔的個股
+    index = HistoryIndex(DATA_FOLDER)
+    existing = set(index.codes())
+    df_all = df_all[(df_all['Code'].str.len() == 4) & ~df_all['Code'].str.startswith('0')]
+    df_all = df_all[df_all['Code'].isin(existing)]
+
+    updated_count = 0
+    for code, group in df_all.groupby('Code', sort=True):
+        new_rows = update_stock_csv(code, group.drop(columns='Code').sort_values('Date'))
+        if new_rows > 0:
+            index.update(code)
+            updated_count += 1
+    index.save()
+
+    print("\n" + "=" * 60)
+    print("📊 補齊完成！")
+    print(f"   ✅ 更新: {updated_count} 檔")
+    print(f"   ❌ 抓取失敗: {len(failed)} 個 (市場, 日期)")
+    if failed:
+        print(f"   失敗清單: {failed[:20]}... (重新執行相同指令即可補抓)")
+    print("=" * 60)
+
 
 def main():
     """
@@ -397,4 +618,15 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if "--bulk" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser(description='歷史資料補齊 (全市場模式)')
+        parser.add_argument('--bulk', nargs=2, metavar=('START', 'END'), required=True,
+                            help='日期區間 (YYYY-MM-DD YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=BULK_WORKERS, help='並行請求數')
+        parser.add_argument('--fresh', action='store_true', help='忽略 checkpoint 重新抓取')
+        args = parser.parse_args()
+        main_bulk(args.bulk[0], args.bulk[1], workers=args.workers, fresh=args.fresh)
+    else:
+        main()
@@ -3,6 +3,7 @@ CSV to JSON Converter for GitHub Pages Chart Website
 將 src/data_core/history/*.csv 轉換為 Lightweight Charts 可用的 JSON 格式
 """
 import os
+import sys
 import json
 import pandas as pd
 from pathlib import Path
@@ -13,6 +14,9 @@ HISTORY_DIR = BASE_DIR / "src" / "data_core" / "history"
 META_DIR = BASE_DIR / "src" / "data_core" / "market_meta"
 OUTPUT_DIR = BASE_DIR / "docs" / "data"
 
+sys.path.insert(0, str(BASE_DIR / "src"))
+from utils.price_store import open_store
+
 # 設定
 # MAX_DAYS = 500  # 不限制天數，使用全部資料
 
@@ -37,14 +41,12 @@ def load_stock_names():
     return name_map
 
 
-def convert_csv_to_json(csv_path: Path, stock_name: str) -> dict | None:
-    """將單一 CSV 轉換為 JSON 格式"""
+def convert_csv_to_json(df: pd.DataFrame, stock_name: str) -> dict | None:
+    """將單一股票 K 棒 (價量資料庫格式，Date 為 index) 轉換為 JSON 格式"""
     try:
-        df = pd.read_csv(csv_path)
-        
         # 確認必要欄位
-        required = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
-        if not all(col in df.columns for col in required):
+        required = ['Open', 'High', 'Low', 'Close', 'Volume']
+        if df is None or not all(col in df.columns for col in required):
             return None
         
         # 移除有缺失值的行
@@ -54,25 +56,23 @@ def convert_csv_to_json(csv_path: Path, stock_name: str) -> dict | None:
         df = df[~((df['Open'] == 0) & (df['High'] == 0) & (df['Low'] == 0) & (df['Close'] == 0))]
         
         # 使用全部資料（不限制天數）
-        df = df.copy()
-        
         if df.empty:
             return None
         
         # 轉換為 Lightweight Charts 格式
         data = []
-        for _, row in df.iterrows():
-            vol = row['Volume']
+        times = df.index.strftime('%Y-%m-%d')
+        for t, o, h, l, c, vol in zip(times, df['Open'], df['High'], df['Low'], df['Close'], df['Volume']):
             # 處理可能的 NaN 或無效值
             if pd.isna(vol) or vol < 0:
                 vol = 0
             
             data.append({
-                "time": str(row['Date']),
-                "open": float(row['Open']),
-                "high": float(row['High']),
-                "low": float(row['Low']),
-                "close": float(row['Close']),
+                "time": t,
+                "open": float(o),
+                "high": float(h),
+                "low": float(l),
+                "close": float(c),
                 "volume": int(vol / 1000)  # 轉換為張數
             })
         
@@ -81,7 +81,7 @@ def convert_csv_to_json(csv_path: Path, stock_name: str) -> dict | None:
             "data": data
         }
     except Exception as e:
-        print(f"⚠️ 轉換失敗 {csv_path.name}: {e}")
+        print(f"⚠️ 轉換失敗 {stock_name}: {e}")
         return None
 
 
@@ -94,20 +94,22 @@ def main():
     # 載入股票名稱
     name_map = load_stock_names()
     
-    # 取得所有 CSV 檔案
-    csv_files = list(HISTORY_DIR.glob("*.csv"))
-    print(f"📁 找到 {len(csv_files)} 個 CSV 檔案")
+    # 透過欄式價量資料庫讀取 (只重新解析有變動的 CSV)
+    store = open_store(sync=True, history_dir=str(HISTORY_DIR))
+    if store is None:
+        print("❌ 無法開啟價量資料庫")
+        return
+    print(f"📁 找到 {len(store.codes)} 個 CSV 檔案")
     
     # 建立股票清單
     stock_list = []
     success_count = 0
     
-    for csv_path in csv_files:
-        stock_id = csv_path.stem  # 檔名不含副檔名
+    for stock_id in store.codes:
         stock_name = name_map.get(stock_id, stock_id)
         
         # 轉換
-        result = convert_csv_to_json(csv_path, stock_name)
+        result = convert_csv_to_json(store.load_stock(stock_id), stock_name)
         if result:
             # 寫入 JSON
             json_path = OUTPUT_DIR / f"{stock_id}.json"
@@ -127,7 +129,7 @@ def main():
     with open(list_path, 'w', encoding='utf-8') as f:
         json.dump(stock_list, f, ensure_ascii=False, indent=2)
     
-    print(f"✅ 轉換完成: {success_count}/{len(csv_files)} 檔")
+    print(f"✅ 轉換完成: {success_count}/{len(store.codes)} 檔")
     print(f"📄 股票清單: {list_path}")
     print(f"📂 輸出目錄: {OUTPUT_DIR}")
     
@@ -0,0 +1,247 @@
+# === 每日行情批次寫入 (取代逐檔 save_to_csv) ===
+# 用途：
+# 1. 收集當日全市場行情 (HiStock / TWSE / TPEx)，以「最後一列索引」(history_index) 做重複檢查
+# 2. 一次提交：先寫入 write-ahead journal 並 fsync (唯一的持久化屏障)，再 append 各 CSV
+# 3. 中途中斷時，下次啟動會重播 journal (已寫入的列自動略過，可重複執行)
+#
+# 用法：
+#     batch = DailyIngestBatch(DATA_FOLDER)
+#     batch.add("2330", "2026-04-13", 1000.0, 1010.0, 995.0, 1005.0, 30000000, 3.0e10)
+#     batch.add_frame(df_snapshot)   # Code, Date, Open, High, Low, Close, Volume, Amount
+#     batch.commit()
+
+import os
+import json
+
+from history_index import HistoryIndex, read_last_line
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+JOURNAL_FILE = os.path.join(SRC_ROOT, "cache", "ingest_journal.jsonl")
+
+CSV_HEADER = "Date,Open,High,Low,Close,Volume,Amount\n"
+
+
+def _format_line(date_str, op, hi, lo, cl, vol, amount):
+    """與舊版 save_to_csv 相同的列格式"""
+    return f"{date_str},{op},{hi},{lo},{cl},{vol},{amount:.2f}\n"
+
+
+class DailyIngestBatch:
+    """
+    當日行情的批次寫入器
+
+    Args:
+        data_folder: history CSV 資料夾
+        journal_path: write-ahead journal 路徑
+        verbose: 是否印出新股建檔訊息
+        index: 共用的 HistoryIndex (省略時自行建立)
+    """
+
+    def __init__(self, data_folder, journal_path=JOURNAL_FILE, verbose=True, index=None):
+        self.data_folder = data_folder
+        self.journal_path = journal_path
+        self.verbose = verbose
+        self.index = index or HistoryIndex(data_folder)
+        self._last = {}      # code -> (last_date, last_ohlcv | None)
+        self._pending = {}   # code -> [line, ...]
+        replay_journal(data_folder, journal_path, index=self.index)
+
+    # ---- 最後一列索引 ----
+    def _last_row(self, code):
+        if code not in self._last:
+            line = self.index.last_row(code)
+            parts = line.split(',') if line else []
+            ohlcv = None
+            if len(parts) >= 6:
+                try:
+                    ohlcv = tuple(float(p) for p in parts[1:6])
+                except ValueError:
+                    ohlcv = None
+            self._last[code] = (parts[0] if parts else "", ohlcv)
+        return self._last[code]
+
+    def last_date(self, code):
+        """目前 (含尚未提交) 的最後日期，沒有資料回傳空字串"""
+        return self._last_row(code)[0]
+
+    # ---- 加入資料 ----
+    def add(self, code, date_str, op, hi, lo, cl, vol, amount=None):
+        """
+        加入單筆行情 (判斷規則與舊版 save_to_csv 相同)
+
+        Returns:
+            True: 待寫入 / "SKIPPED": 日期重複或 OHLCV 與最後一列完全相同 (非交易日假資料)
+        """
+        if amount is None:
+            try:
+                amount = float(cl) * float(vol)
+            except (TypeError, ValueError):
+                amount = 0.0
+
+        last_date, last_ohlcv = self._last_row(code)
+        if last_date == date_str:
+            return "SKIPPED"
+        try:
+            new_ohlcv = (float(op), float(hi), float(lo), float(cl), float(vol))
+        except (TypeError, ValueError):
+            new_ohlcv = None
+        if last_ohlcv is not None and last_ohlcv == new_ohlcv:
+            return "SKIPPED"
+
+        self._pending.setdefault(code, []).append(_format_line(date_str, op, hi, lo, cl, vol, amount))
+        self._last[code] = (date_str, new_ohlcv)
+        return True
+
+    def add_frame(self, df):
+        """
+        加入整張行情表 (欄位: Code, Date, Open, High, Low, Close, Volume, Amount)
+
+        Returns:
+            (寫入檔數, 略過檔數)
+        """
+        added = skipped = 0
+        cols = ['Code', 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Amount']
+        for row in df[cols].itertuples(index=False, name=None):
+            if self.add(*row) is True:
+                added += 1
+            else:
+                skipped += 1
+        return added, skipped
+
+    @property
+    def pending_codes(self):
+        return set(self._pending)
+
+    # ---- 提交 ----
+    def commit(self):
+        """
+        一次寫入所有待寫資料
+
+        1. 所有待寫列寫入 journal 並 fsync (唯一的持久化屏障)
+        2. 逐檔 append (不再逐檔 fsync)
+        3. 資料落盤後刪除 journal
+
+        Returns:
+            實際 append 的檔案數
+        """
+        if not self._pending:
+            return 0
+
+        entries = [
+            {"code": code, "lines": lines}
+            for code, lines in self._pending.items()
+        ]
+        _write_journal(self.journal_path, entries)
+        _apply_entries(self.data_folder, entries, self.index, verbose=self.verbose)
+        _finish_journal(self.data_folder, self.journal_path, [e["code"] for e in entries])
+        self.index.save()
+
+        count = len(entries)
+        self._pending = {}
+        return count
+
+
+# ================= Journal =================
+
+def _write_journal(journal_path, entries):
+    os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    tmp_path = journal_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, journal_path)
+
+
+def _apply_entries(data_folder, entries, index, verbose=True):
+    """
+    依 journal 內容 append 到各 CSV (可重複執行)
+
+    - 檔案不存在：建立並寫入 header
+    - 檔尾沒有換行：若是上次中斷留下的半列則截掉，否則補上換行
+    - 待寫的列若已存在於檔尾 (上次中斷前已寫入)：略過
+    """
+    for entry in entries:
+        code, lines = entry["code"], entry["lines"]
+        file_path = os.path.join(data_folder, f"{code}.csv")
+
+        if not os.path.exists(file_path):
+            if verbose:
+                print(f"🆕 發現新股票: {code}，建立檔案中...")
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(CSV_HEADER)
+
+        _repair_tail(file_path, lines)
+        last_line, _ = read_last_line(file_path)
+        last_date = last_line.split(',')[0] if last_line else ""
+
+        # 已寫入的部分 (以日期判斷) 略過
+        written = [ln.split(',')[0] for ln in lines]
+        if last_date in written:
+            lines = lines[written.index(last_date) + 1:]
+        if lines:
+            with open(file_path, 'a', encoding='utf-8') as f:
+                f.write("".join(lines))
+        index.update(code, entry["lines"][-1].strip())
+
+
+def _repair_tail(file_path, lines):
+    """
+    確保檔尾是完整的一列
+    - 最後一列是待寫列的前半段 (上次寫到一半中斷)：截掉，稍後重寫
+    - 其他沒有換行結尾的情況：補上換行，避免新列接在同一行
+    """
+    last_line, ends_with_newline = read_last_line(file_path)
+    if ends_with_newline:
+        return
+    with open(file_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        torn = last_line and any(ln.startswith(last_line) and ln.strip() != last_line for ln in lines)
+        if torn:
+            f.truncate(end - len(last_line.encode('utf-8')))
+        else:
+            f.write(b"\n")
+
+
+def _finish_journal(data_folder, journal_path, codes):
+    """確認資料落盤後刪除 journal"""
+    if hasattr(os, "sync"):
+        os.sync()  # POSIX：一次把所有檔案的緩衝寫回磁碟
+    else:
+        # Windows 沒有 os.sync，逐檔 fsync
+        for code in codes:
+            file_path = os.path.join(data_folder, f"{code}.csv")
+            try:
+                with open(file_path, 'rb+') as f:
+                    os.fsync(f.fileno())
+            except OSError:
+                pass
+    try:
+        os.remove(journal_path)
+    except OSError:
+        pass
+
+
+def replay_journal(data_folder, journal_path=JOURNAL_FILE, index=None):
+    """重播上次未完成的 journal (不存在則不做事)，回傳重播的檔案數"""
+    if not os.path.exists(journal_path):
+        return 0
+    entries = []
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ journal 損壞，略過重播: {e}")
+        return 0
+
+    print(f"♻️ 發現未完成的寫入紀錄，重播 {len(entries)} 檔...")
+    index = index or HistoryIndex(data_folder)
+    _apply_entries(data_folder, entries, index)
+    _finish_journal(data_folder, journal_path, [e["code"] for e in entries])
+    index.save()
+    return len(entries)
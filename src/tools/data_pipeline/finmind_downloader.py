@@ -0,0 +1,179 @@
+# === FinMind 並行下載排程器 (Token Bucket 限速 + 共用退避 + Token 輪替) ===
+# 用途：
+# 1. 每組 Token 各自一個 Token Bucket，依配額 (每小時請求數) 平均發送
+# 2. 任一執行緒收到 402/429 時，該 Token 全體暫停 (指數退避)，其餘 Token 照常工作
+# 3. 固定大小的執行緒池，請求輪流分配到可用的 Token
+#
+# 用法：
+#     from finmind_downloader import FinMindDownloader
+#     downloader = FinMindDownloader(API_KEYS)
+#     data = downloader.request({"dataset": "TaiwanStockPrice", "data_id": "2330", "start_date": "2026-01-01"})
+#     results = downloader.map(lambda sid, fetch: ..., stock_ids)
+
+import os
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+FINMIND_API = "https://api.finmindtrade.com/api/v4/data"
+
+# 每組 Token 每小時可用請求數 (FinMind 註冊會員 600 次/小時，可用環境變數調整)
+RATE_PER_HOUR = int(os.getenv("FINMIND_RATE_PER_HOUR", "600"))
+# 允許瞬間連發的請求數
+BURST = 5
+# 402/429 退避：初始秒數 / 上限
+BACKOFF_START = 30
+BACKOFF_MAX = 600
+# 單一請求最多嘗試次數 (與 Pipeline_data.safe_request 相同)
+MAX_ATTEMPTS = 8
+
+
+class TokenBucket:
+    """執行緒安全的 Token Bucket 限速器"""
+
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """取得一個額度；不足時回傳需要等待的秒數 (0 表示已取得)"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def drain(self):
+        """清空額度 (被限流時使用，避免退避結束後立刻連發)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = 0.0
+
+
+class _KeyState:
+    """單一 Token 的限速與退避狀態"""
+
+    def __init__(self, token, rate_per_hour, burst):
+        self.token = token
+        self.bucket = TokenBucket(rate_per_hour / 3600.0, burst)
+        self.blocked_until = 0.0
+        self.backoff = BACKOFF_START
+        self.lock = threading.Lock()
+
+    def label(self):
+        return f"...{self.token[-4:]}" if self.token else "(無 Token)"
+
+
+class FinMindDownloader:
+    """
+    多 Token 共用的 FinMind 下載排程器
+
+    Args:
+        tokens: Token 清單 (空字串代表匿名，配額較低)
+        rate_per_hour: 每組 Token 每小時請求數
+        max_workers: 執行緒池大小 (預設 = Token 數 × 2，最多 8)
+    """
+
+    def __init__(self, tokens, rate_per_hour=RATE_PER_HOUR, max_workers=None, burst=BURST):
+        tokens = list(dict.fromkeys(tokens)) or [""]
+        self.keys = [_KeyState(t, rate_per_hour, burst) for t in tokens]
+        self.max_workers = max_workers or min(8, len(self.keys) * 2)
+        self._next = 0
+        self._rr_lock = threading.Lock()
+
+    # ---- Token 分配 ----
+    def _acquire_key(self):
+        """輪流挑選可用的 Token；全部都在退避或額度用完時，等到最早可用的那組"""
+        while True:
+            with self._rr_lock:
+                start = self._next
+                self._next = (self._next + 1) % len(self.keys)
+
+            now = time.monotonic()
+            min_wait = None
+            for offset in range(len(self.keys)):
+                key = self.keys[(start + offset) % len(self.keys)]
+                wait = key.blocked_until - now
+                if wait <= 0:
+                    wait = key.bucket.try_acquire()
+                    if wait == 0:
+                        return key
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+            time.sleep(min(max(min_wait, 0.05), 5.0))
+
+    def _on_rate_limited(self, key, status):
+        """共用退避：同一 Token 的所有執行緒一起暫停"""
+        with key.lock:
+            now = time.monotonic()
+            if key.blocked_until > now:
+                return  # 其他執行緒已經設定過退避
+            wait = key.backoff
+            key.blocked_until = now + wait
+            key.backoff = min(key.backoff * 2, BACKOFF_MAX)
+        key.bucket.drain()
+        print(f"⚠️ 觸發限制 ({status})，Token {key.label()} 暫停 {wait} 秒...")
+
+    def _on_success(self, key):
+        with key.lock:
+            key.backoff = BACKOFF_START
+
+    # ---- 請求 ----
+    def request(self, parameter, url=FINMIND_API, timeout=20):
+        """
+        發送一次 FinMind 請求 (自動加上 Token、限速與重試)
+
+        Returns:
+            dict (API 回傳的 JSON) 或 None (重試用盡)
+        """
+        for _ in range(MAX_ATTEMPTS):
+            key = self._acquire_key()
+            params = dict(parameter)
+            if key.token:
+                params["token"] = key.token
+            try:
+                resp = requests.get(url, params=params, timeout=timeout)
+            except Exception:
+                time.sleep(3)
+                continue
+
+            if resp.status_code == 200:
+                self._on_success(key)
+                try:
+                    return resp.json()
+                except ValueError:
+                    return None
+            if resp.status_code in (402, 429):
+                self._on_rate_limited(key, resp.status_code)
+                continue
+            time.sleep(3)
+        return None
+
+    def map(self, func, items):
+        """
+        以執行緒池並行處理 items
+
+        Args:
+            func: func(item, fetch)，fetch(parameter) 等同 self.request
+            items: 要處理的項目
+
+        Yields:
+            (item, 結果, 例外)，依完成順序
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(func, item, self.request): item for item in items}
+            for fut in as_completed(futures):
+                item = futures[fut]
+                try:
+                    yield item, fut.result(), None
+                except Exception as e:
+                    yield item, None, e
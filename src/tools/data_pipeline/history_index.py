@@ -0,0 +1,165 @@
+# === history CSV 最後一列索引 (sidecar manifest) ===
+# 用途：
+# 1. 記錄每個 history/*.csv 的最後一列 (日期與原始文字) 與檔案大小
+# 2. 檔案大小對不上 (有其他程式寫入) 或沒有紀錄時，從檔尾往回讀最後一列並更新紀錄
+# 3. 「哪些股票需要更新」只需要 listdir + stat，不必讀整個 CSV
+#
+# 用法：
+#     index = HistoryIndex(DATA_FOLDER)
+#     index.last_date("2330")            # '2026-04-13'
+#     index.stale_codes("2026-04-14")    # 最後日期早於指定日期的股票
+#     ... 寫入 CSV 後 ...
+#     index.update("2330")
+#     index.save()
+#
+# 索引檔放在 src/cache/ (不進 git)：新的 CI runner 上不存在時，依檔案大小比對自動重建
+
+import os
+import json
+import hashlib
+import threading
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_FOLDER = os.path.join(SRC_ROOT, "data_core", "history")
+CACHE_DIR = os.path.join(SRC_ROOT, "cache")
+MANIFEST_FILE = "history_last_rows.json"
+
+
+def manifest_path_for(data_folder):
+    """資料夾對應的索引檔路徑 (預設 history 以外的資料夾依路徑各自一個檔案)"""
+    folder = os.path.abspath(data_folder)
+    if folder == os.path.abspath(DATA_FOLDER):
+        return os.path.join(CACHE_DIR, MANIFEST_FILE)
+    key = hashlib.sha1(folder.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f"history_last_rows.{key}.json")
+
+
+def read_last_line(file_path, chunk_size=4096):
+    """
+    從檔尾往回讀取最後一列 (不讀整個檔案)
+
+    Returns:
+        (最後一列文字, 檔案是否以換行結尾)；空檔或只有 header 時回傳 ("", True)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end == 0:
+            return "", True
+        f.seek(end - 1)
+        ends_with_newline = f.read(1) == b"\n"
+
+        data = b""
+        pos = end
+        while pos > 0:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+            if data.rstrip(b"\r\n").count(b"\n") >= 1:
+                break
+
+    lines = data.rstrip(b"\r\n").split(b"\n")
+    last = lines[-1].decode('utf-8', errors='ignore').strip()
+    if last.startswith("Date,"):
+        last = ""
+    return last, ends_with_newline
+
+
+class HistoryIndex:
+    """
+    history 資料夾的最後一列索引 (執行緒安全)
+
+    紀錄以檔案大小驗證：大小不同就視為失效，改從檔尾重讀。
+    (不用 mtime，git checkout 後 mtime 會全部改變，但大小不變)
+    """
+
+    def __init__(self, data_folder=DATA_FOLDER):
+        self.data_folder = data_folder
+        self.manifest_path = manifest_path_for(data_folder)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _path(self, code):
+        return os.path.join(self.data_folder, f"{code}.csv")
+
+    # ---- 查詢 ----
+    def last_row(self, code):
+        """最後一列原始文字，檔案不存在或沒有資料回傳空字串"""
+        file_path = self._path(code)
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return ""
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is not None and entry.get('size') == size:
+                return entry.get('row', "")
+        return self.update(code)
+
+    def last_date(self, code):
+        """最後一列日期 (YYYY-MM-DD)，沒有資料回傳空字串"""
+        row = self.last_row(code)
+        return row.split(',')[0] if row else ""
+
+    def codes(self):
+        """資料夾中所有股票代碼"""
+        return sorted(f[:-4] for f in os.listdir(self.data_folder) if f.endswith('.csv'))
+
+    def stale_codes(self, target_date, codes=None):
+        """最後日期早於 target_date 的股票 (沒有資料的不列入)"""
+        result = []
+        for code in (self.codes() if codes is None else codes):
+            last = self.last_date(code)
+            if last and last < target_date:
+                result.append(code)
+        return result
+
+    # ---- 更新 ----
+    def update(self, code, last_line=None):
+        """
+        寫入 CSV 後呼叫，更新該檔的紀錄
+
+        Args:
+            last_line: 已知的最後一列文字 (省略時從檔尾讀取)
+        Returns:
+            最後一列文字
+        """
+        file_path = self._path(code)
+        try:
+            if last_line is None:
+                last_line, _ = read_last_line(file_path)
+            size = os.path.getsize(file_path)
+        except OSError:
+            self.remove(code)
+            return ""
+        with self._lock:
+            self._entries[code] = {'row': last_line, 'size': size}
+            self._dirty = True
+        return last_line
+
+    def remove(self, code):
+        """刪除 / 封存 CSV 後呼叫"""
+        with self._lock:
+            if self._entries.pop(code, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """有變動時原子寫回 manifest"""
+        with self._lock:
+            if not self._dirty:
+                return
+            # 順便清掉已不存在的檔案
+            self._entries = {c: e for c, e in self._entries.items() if os.path.exists(self._path(c))}
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': self._entries}, f, ensure_ascii=False, sort_keys=True, indent=0)
+            os.replace(tmp_path, self.manifest_path)
+            self._dirty = False
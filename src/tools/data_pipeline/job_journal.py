@@ -0,0 +1,246 @@
+# === 長時間批次工作的進度紀錄 (SQLite) ===
+# 用途：
+# 1. refetch_all_history / sync_stock_data 共用，記錄每檔股票的狀態、最後日期與嘗試次數
+# 2. 中斷後重新執行只處理未完成 / 失敗的股票，已完成的直接略過 (不浪費 API 配額)
+# 3. 進度與預估剩餘時間直接從紀錄計算
+#
+# 用法：
+#     journal = JobJournal("refetch_all_history")
+#     journal.plan(stock_ids)
+#     for sid in journal.pending(stock_ids):
+#         journal.start(sid)
+#         ... 成功 ... journal.done(sid, last_date="2026-04-13")
+#         ... 失敗 ... journal.fail(sid, "HTTP 429")
+#     print(journal.progress_line())
+#
+# 查看進度：python job_journal.py [工作名稱]
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+JOB_DB = os.path.join(SRC_ROOT, "cache", "jobs.sqlite")
+
+# 狀態
+PENDING = "pending"
+RUNNING = "running"    # 執行中被中斷的會停在這個狀態，下次視同待處理
+DONE = "done"
+FAILED = "failed"      # 可重試 (連線錯誤、配額用完...)
+EMPTY = "empty"        # 來源沒有資料，不再重試
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job        TEXT    NOT NULL,
+    stock_id   TEXT    NOT NULL,
+    status     TEXT    NOT NULL,
+    last_date  TEXT,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    updated_at REAL    NOT NULL,
+    PRIMARY KEY (job, stock_id)
+)
+"""
+
+
+class JobJournal:
+    """
+    單一工作的逐檔進度紀錄 (執行緒安全)
+
+    Args:
+        job: 工作名稱 (同一個資料庫可放多個工作)
+        db_path: SQLite 檔案路徑
+        max_attempts: 失敗超過此次數就不再自動重試 (None 表示不限)
+    """
+
+    def __init__(self, job, db_path=JOB_DB, max_attempts=None):
+        self.job = job
+        self.max_attempts = max_attempts
+        self.session_start = time.time()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    # ---- 規劃 ----
+    def plan(self, stock_ids, requeue_done=False):
+        """
+        加入尚未紀錄的股票 (已有紀錄的保持原狀)，回傳新加入的數量
+
+        Args:
+            requeue_done: 已完成的紀錄改回待處理 (例如檔案已被刪除，需要重新建檔)
+        """
+        now = time.time()
+        rows = [(self.job, sid, PENDING, now) for sid in stock_ids]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job, stock_id, status, updated_at) VALUES (?, ?, ?, ?)", rows
+            )
+            added = self._conn.total_changes - before
+            if requeue_done:
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = 0, updated_at = ? "
+                    "WHERE job = ? AND stock_id = ? AND status IN (?, ?)",
+                    [(PENDING, now, self.job, sid, DONE, EMPTY) for sid in stock_ids]
+                )
+            self._conn.execute("COMMIT")
+            return added
+
+    def reset(self):
+        """清除本工作的所有紀錄 (重新開始一輪)"""
+        self._execute("DELETE FROM jobs WHERE job = ?", (self.job,))
+
+    # ---- 查詢 ----
+    def pending(self, stock_ids=None):
+        """
+        待處理的股票 (pending / running / 可重試的 failed)，依代碼排序
+
+        Args:
+            stock_ids: 只回傳這些股票 (省略時為本工作全部紀錄)
+        """
+        sql = "SELECT stock_id, status, attempts FROM jobs WHERE job = ? AND status IN (?, ?, ?) ORDER BY stock_id"
+        rows = self._execute(sql, (self.job, PENDING, RUNNING, FAILED))
+        result = [
+            sid for sid, status, attempts in rows
+            if not (status == FAILED and self.max_attempts is not None and attempts >= self.max_attempts)
+        ]
+        if stock_ids is not None:
+            wanted = set(stock_ids)
+            result = [sid for sid in result if sid in wanted]
+        return result
+
+    def status(self, stock_id):
+        """單檔紀錄 dict，沒有紀錄回傳 None"""
+        rows = self._execute(
+            "SELECT status, last_date, attempts, error FROM jobs WHERE job = ? AND stock_id = ?",
+            (self.job, stock_id)
+        )
+        if not rows:
+            return None
+        status, last_date, attempts, error = rows[0]
+        return {"status": status, "last_date": last_date, "attempts": attempts, "error": error}
+
+    def failures(self):
+        """失敗的股票與錯誤訊息 [(stock_id, attempts, error), ...]"""
+        return self._execute(
+            "SELECT stock_id, attempts, error FROM jobs WHERE job = ? AND status = ? ORDER BY stock_id",
+            (self.job, FAILED)
+        )
+
+    def counts(self):
+        """各狀態數量 dict"""
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs WHERE job = ? GROUP BY status", (self.job,))
+        return dict(rows)
+
+    # ---- 更新 ----
+    def start(self, stock_id):
+        self._execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job = ? AND stock_id = ?",
+            (RUNNING, time.time(), self.job, stock_id)
+        )
+
+    def done(self, stock_id, last_date=None):
+        self._set(stock_id, DONE, last_date=last_date)
+
+    def fail(self, stock_id, error=""):
+        self._set(stock_id, FAILED, error=str(error)[:200])
+
+    def empty(self, stock_id, error="無資料"):
+        self._set(stock_id, EMPTY, error=error)
+
+    def _set(self, stock_id, status, last_date=None, error=None):
+        self._execute(
+            "INSERT INTO jobs (job, stock_id, status, last_date, attempts, error, updated_at) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (job, stock_id) DO UPDATE SET "
+            "status = excluded.status, last_date = COALESCE(excluded.last_date, last_date), "
+            "error = excluded.error, updated_at = excluded.updated_at",
+            (self.job, stock_id, status, last_date, error, time.time())
+        )
+
+    # ---- 進度 ----
+    def progress(self):
+        """
+        進度統計 (預估時間以本次執行的完成速度計算)
+
+        Returns:
+            dict: total, finished (done + empty), failed, remaining, rate (檔/秒), eta (秒或 None)
+        """
+        counts = self.counts()
+        total = sum(counts.values())
+        finished = counts.get(DONE, 0) + counts.get(EMPTY, 0)
+        remaining = len(self.pending())
+
+        rows = self._execute(
+            "SELECT COUNT(*) FROM jobs WHERE job = ? AND status IN (?, ?, ?) AND updated_at >= ?",
+            (self.job, DONE, EMPTY, FAILED, self.session_start)
+        )
+        processed = rows[0][0]
+        elapsed = time.time() - self.session_start
+        rate = processed / elapsed if processed and elapsed > 0 else 0.0
+        return {
+            "total": total,
+            "finished": finished,
+            "failed": counts.get(FAILED, 0),
+            "remaining": remaining,
+            "rate": rate,
+            "eta": remaining / rate if rate > 0 else None,
+        }
+
+    def progress_line(self):
+        """一行進度摘要，例如：1200/1900 完成 | ❌ 3 | 剩 697 檔 | 預估 1.2 小時"""
+        p = self.progress()
+        eta = "—" if p["eta"] is None else _format_duration(p["eta"])
+        return (f"{p['finished']}/{p['total']} 完成 | ❌ {p['failed']} | "
+                f"剩 {p['remaining']} 檔 | 預估 {eta}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _format_duration(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} 小時"
+    if seconds >= 60:
+        return f"{seconds / 60:.0f} 分鐘"
+    return f"{seconds:.0f} 秒"
+
+
+def list_jobs(db_path=JOB_DB):
+    """資料庫中的所有工作名稱"""
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(_SCHEMA)
+        return [r[0] for r in conn.execute("SELECT DISTINCT job FROM jobs ORDER BY job")]
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    jobs = sys.argv[1:] or list_jobs()
+    if not jobs:
+        print("📭 沒有任何工作紀錄")
+    for name in jobs:
+        journal = JobJournal(name)
+        counts = journal.counts()
+        print(f"📋 {name}: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+        p = journal.progress()
+        print(f"   {p['finished']}/{p['total']} 完成 | ❌ {p['failed']} | 剩 {p['remaining']} 檔")
+        for sid, attempts, error in journal.failures()[:20]:
+            print(f"   ❌ {sid} (嘗試 {attempts} 次): {error}")
+        journal.close()
@@ -1,10 +1,9 @@
 import os
-import glob
 import pandas as pd
 import numpy as np
-import pickle
 import time
 import sys
+import hashlib
 
 # 強制將輸出編碼設為 utf-8 以支援 emoji
 sys.stdout.reconfigure(encoding='utf-8')
@@ -16,17 +15,461 @@ PROJECT_ROOT = os.path.dirname(SRC_ROOT)
 
 DATA_FOLDER = os.path.join(SRC_ROOT, "data_core", "history")
 META_FOLDER = os.path.join(SRC_ROOT, "data_core", "market_meta")
-CACHE_FILE = os.path.join(SRC_ROOT, "cache", "market_matrix.pkl")
+CACHE_DIR = os.path.join(SRC_ROOT, "cache", "market_matrix")
+WEEKLY_CACHE_DIR = os.path.join(SRC_ROOT, "cache", "market_matrix_weekly")
 
-def generate_cache():
-    print("🚀 開始製作加速快取檔 (完整指標版)...")
+sys.path.insert(0, SRC_ROOT)
+from utils.price_store import open_store
+from utils.indicators import rolling_tail, iso_week_starts, week_end_rows, resample_weekly
+from utils.matrix_cache import load_matrix_cache, save_matrix_cache, MatrixCacheWriter, update_manifest
+from utils.indicator_registry import (
+    REGISTRY, compute, iter_compute, consumed_keys, cache_keys, fingerprint, depends_on, is_cross_section
+)
+from utils.cache_manifest import build_manifest
+from utils.memory_budget import MemoryBudget
+
+# 增量更新時，新資料前需要保留的歷史列數 (最長視窗: 52週 / ROC252 / Mansfield MA252)
+WARMUP_ROWS = 252
+
+# 遞迴型或需要跨越整段歷史的指標 (增量時另外處理)
+PR_MA50_KEYS = {'mansfield_pr_ma50': 'mansfield_pr', 'ibd_pr_ma50': 'ibd_pr'}
+RAW_KEYS = ['close', 'high', 'low', 'volume']
+
+# 部分重建的上限：歷史被改寫的股票超過此比例，或超過一半的指標需要整段重算時，直接完整重建
+PARTIAL_MAX_RATIO = 0.2
+
+# 串流建置的記憶體上限 (MB)；也可用 --max-mem 指定 (設定後自動啟用串流模式)
+MAX_MEM_MB = float(os.environ['MATRIX_MAX_MEM_MB']) if os.environ.get('MATRIX_MAX_MEM_MB') else None
+
+
+def load_taiex_series(index):
+    """讀取大盤收盤價並對齊到矩陣日期 (ffill)，失敗回傳 None"""
+    taiex_path = os.path.join(SRC_ROOT, "data_core", "TAIEX.csv")
+    if not os.path.exists(taiex_path):
+        print("⚠️ 缺少 TAIEX.csv，跳過 Mansfield")
+        return None
+    try:
+        df_taiex = pd.read_csv(taiex_path)
+        df_taiex['Date'] = pd.to_datetime(df_taiex['Date'])
+        df_taiex.set_index('Date', inplace=True)
+        return df_taiex['Close'].reindex(index, method='ffill').astype('float32')
+    except Exception as e:
+        print(f"❌ 讀取 TAIEX 失敗: {e}")
+        return None
+
+
+def _compute_indicators(df_matrix, df_high_matrix, df_low_matrix, df_vol_matrix, s_taiex,
+                        verbose=True, last_n=None, targets=None):
+    """
+    計算指標，回傳快取 dict (不含 timestamp)
+
+    指標定義與相依關係見 utils.indicator_registry；只計算 targets (預設為所有已登記策略
+    需要的 key) 與其相依的中間結果。
+
+    last_n: 只保證最後 last_n 列正確 (增量模式)，滾動視窗改用 NumPy 尾段運算，
+            其餘列填 NaN；None 表示整段計算
+    """
+    if targets is None:
+        targets = consumed_keys()
+    values = compute(targets, {
+        'close': df_matrix, 'high': df_high_matrix, 'low': df_low_matrix,
+        'volume': df_vol_matrix, 'taiex': s_taiex,
+    }, last_n=last_n, verbose=verbose)
+
+    cache_data = {key: values[key] for key in cache_keys(targets)}
+    # 增量更新用的延續狀態 (最後一列)
+    cache_data['state'] = {'last_close': df_matrix.ffill().iloc[-1]}
+    if values.get('rsi') is not None:
+        cache_data['state']['rsi_gain'] = values['rsi_gain'].iloc[-1]
+        cache_data['state']['rsi_loss'] = values['rsi_loss'].iloc[-1]
+    return cache_data
+
+
+def _iter_indicators(df_matrix, df_high_matrix, df_low_matrix, df_vol_matrix, s_taiex, state, targets=None):
+    """
+    串流版 _compute_indicators：依相依順序逐一 yield (key, DataFrame)，只產生要寫入快取的 key
+
+    中間結果在最後一個使用者算完後即釋放；延續狀態 (last_close / rsi_gain / rsi_loss) 寫入 state。
+    """
+    if targets is None:
+        targets = consumed_keys()
+    keep = set(cache_keys(targets))
+    raw = {'close': df_matrix, 'high': df_high_matrix, 'low': df_low_matrix, 'volume': df_vol_matrix}
+    for key in RAW_KEYS:
+        yield key, raw[key]
+    state['last_close'] = df_matrix.ffill().iloc[-1]
+
+    rsi_state = {}
+    for name, val in iter_compute(targets, dict(raw, taiex=s_taiex)):
+        if name in ('rsi_gain', 'rsi_loss') and val is not None:
+            rsi_state[name] = val.iloc[-1]
+        if name == 'rsi' and val is not None:
+            state.update(rsi_state)
+        if name in keep:
+            yield name, val
+        del val
+
+
+def iter_weekly(raw, df_open):
+    """
+    周線矩陣 (ISO 周次，全部股票共用同一組週分段，一次聚合整個矩陣)
+
+    close / high / low / rsi 與 RSI_screener 相同，先把日線前向填充，每檔從第一個有效日
+    (close/high/low 皆有值) 起算：close 取最後一天、high / low 取 max / min。
+
+    週 K 棒 (技術分析圖) 只用實際有交易的日子，與單檔現場聚合相同：
+    open 取第一天、bar_high / bar_low 取 max / min、volume 加總；
+    days 為該週實際交易日數，整週停牌為 0 (前向填充出來的平盤週，圖表不顯示)。
+    index 為每週最後一個交易日。
+
+    Yields:
+        (key, DataFrame)：open / close / high / low / volume / rsi / bar_high / bar_low / days
+        (週 × 股票，float32)
+    """
+    close, high, low = raw['close'].ffill(), raw['high'].ffill(), raw['low'].ffill()
+    valid = (close.notna() & high.notna() & low.notna()).values
+    traded = raw['close'].notna().values
+
+    dates = close.index
+    starts = iso_week_starts(dates)
+    week_index = dates[week_end_rows(starts, len(dates))]
+
+    def frame(values, how, mask=valid):
+        out = resample_weekly(values, starts, how=how, valid=mask)
+        return pd.DataFrame(out, index=week_index, columns=close.columns).astype('float32')
+
+    yield 'open', frame(df_open.values, 'first', traded)
+    w_close = frame(close.values, 'last')
+    yield 'close', w_close
+    yield 'high', frame(high.values, 'max')
+    yield 'low', frame(low.values, 'min')
+    yield 'volume', frame(raw['volume'].values, 'sum', traded)
+    yield 'rsi', compute(['rsi'], {'close': w_close}, verbose=False)['rsi']
+    yield 'bar_high', frame(raw['high'].values, 'max', traded)
+    yield 'bar_low', frame(raw['low'].values, 'min', traded)
+    yield 'days', frame(traded.astype(np.float32), 'sum', np.ones_like(traded))
+
+
+def save_weekly_cache(raw, df_open, budget=None, manifest=None):
+    """重建周線快取 (每次建置都整段重算，全市場只需一次 reduceat；逐一寫入不同時保留)"""
+    t0 = time.time()
+    starts = iso_week_starts(raw['close'].index)
+    week_index = raw['close'].index[week_end_rows(starts, len(raw['close'].index))]
+    writer = MatrixCacheWriter(WEEKLY_CACHE_DIR, week_index, raw['close'].columns)
+    try:
+        for key, val in iter_weekly(raw, df_open):
+            writer.add(key, val)
+            del val
+            if budget is not None:
+                budget.check(f"周線 {key}")
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit(manifest=_weekly_manifest(manifest, week_index))
+    print(f"📅 周線矩陣: {len(week_index)} 週 ({time.time() - t0:.2f}s)")
+
+
+def _cache_manifest(store, dates, codes, keys, s_taiex, prev=None):
+    """本次建置的 manifest (CSV 簽章沿用價量資料庫的索引，未變動的檔案沿用上一版的 sha1)"""
+    manifest = build_manifest(dates, codes, keys, DATA_FOLDER, files=store.index.get('files'),
+                              prev=prev.manifest if prev is not None else None)
+    # 對齊後的大盤序列，下次增量時判斷舊期間的 TAIEX 是否被修正
+    manifest['taiex_rows'] = _taiex_digest(s_taiex)
+    return manifest
+
+
+def _weekly_manifest(manifest, week_index):
+    """周線快取的 manifest (與日線共用來源紀錄)"""
+    if manifest is None:
+        return None
+    return dict(manifest, n_dates=len(week_index), indicators={'rsi': fingerprint('rsi')})
+
+
+def load_previous_cache():
+    """讀取上一版快取 (延遲載入)，不存在或損壞回傳 None"""
+    return load_matrix_cache(CACHE_DIR)
+
+
+def _preview(items, limit=5):
+    items = list(items)
+    return ", ".join(items[:limit]) + (f" 等 {len(items)} 檔" if len(items) > limit else "")
+
+
+def _taiex_digest(s_taiex, n_rows=None):
+    """對齊後大盤序列 (前 n_rows 列) 的 sha1，記錄在 manifest 以判斷 Mansfield 是否需要重算"""
+    if s_taiex is None:
+        return None
+    values = np.ascontiguousarray(s_taiex.values[:n_rows], dtype=np.float32)
+    return hashlib.sha1(values.tobytes()).hexdigest()[:16]
+
+
+def _check_layout(prev, raw):
+    """檢查舊快取能否接續 (日期軸只往後延伸、有延續狀態與 manifest)"""
+    old_close = prev.get('close')
+    if old_close is None or 'state' not in prev:
+        return False, "舊快取缺少增量狀態"
+    if prev.manifest is None:
+        return False, "舊快取沒有 manifest"
+    n_old = len(prev.dates)
+    if n_old > len(raw['close'].index) or not raw['close'].index[:n_old].equals(prev.dates):
+        return False, "日期軸有變動"
+    if n_old < WARMUP_ROWS:
+        return False, "歷史長度不足"
+    return True, ""
+
+
+def _changed_columns(prev, raw, n_old):
+    """
+    舊快取涵蓋的期間內，原始資料被改寫的股票 (直接比對數值，不依賴檔案 mtime)
+
+    Returns:
+        bool 陣列 (對應 raw 的股票)；新加入的股票一律為 True
+    """
+    codes = raw['close'].columns
+    pos = prev.codes.get_indexer(codes)
+    dirty = pos < 0
+    common = np.flatnonzero(~dirty)
+    for key in RAW_KEYS:
+        old = prev[key].values[:, pos[common]]
+        new = raw[key].values[:n_old, common]
+        same = ((old == new) | (np.isnan(old) & np.isnan(new))).all(axis=0)
+        dirty[common[~same]] = True
+        del old, new
+        prev.release(key)
+    return dirty
+
+
+def _stale_keys(prev, keys, s_taiex, n_old, dirty, codes):
+    """
+    需要整段重算 (全部股票) 的指標
+
+    - 定義指紋與 manifest 不同，或舊快取沒有此指標
+    - 大盤序列在舊期間內有變動 (含有無 TAIEX)：所有用到 taiex 的指標
+    - 有股票歷史被改寫、新加入或移除：橫截面指標 (PR 排名) 與其後續指標
+    - 舊快取缺少 RSI 延續狀態
+    以及上述指標的所有下游指標。
+    """
+    manifest = prev.manifest
+    old_fp = manifest.get('indicators', {})
+    indicators = [k for k in keys if k in REGISTRY]
+    stale = {k for k in indicators if k not in prev or old_fp.get(k) != fingerprint(k)}
+    if manifest.get('taiex_rows') != _taiex_digest(s_taiex, n_old):
+        stale |= {k for k in indicators if depends_on(k, {'taiex'})}
+    if dirty.any() or not prev.codes.isin(codes).all():
+        stale |= {k for k in indicators if is_cross_section(k)}
+    if 'rsi' in indicators and 'rsi_gain' not in prev['state']:
+        stale.add('rsi')
+    if stale:
+        stale |= {k for k in indicators if depends_on(k, stale)}
+    return [k for k in indicators if k in stale]
+
+
+def _full_values(raw, s_taiex, targets):
+    """整段重算 targets (全部股票)，回傳 ({key: DataFrame}, 延續狀態)"""
+    keep = set(targets)
+    values, state = {}, {}
+    for name, val in iter_compute(targets, dict(raw, taiex=s_taiex), verbose=False):
+        if name in ('rsi_gain', 'rsi_loss') and val is not None:
+            state[name] = val.iloc[-1]
+        if name in keep:
+            values[name] = val
+        del val
+    return values, state
+
+
+def _column_values(raw, s_taiex, dirty, keys):
+    """只對歷史被改寫 / 新加入的股票整段重算逐檔指標，回傳 ({key: DataFrame}, 延續狀態)"""
+    pos = np.flatnonzero(dirty)
+    local = [k for k in keys if k in REGISTRY and not is_cross_section(k)]
+    sub = {key: raw[key].iloc[:, pos] for key in RAW_KEYS}
+    values, state = _full_values(sub, s_taiex, local)
+    state['last_close'] = sub['close'].ffill().iloc[-1]
+    return values, state
+
+
+def _incremental_rows(prev, raw, s_taiex):
+    """
+    只計算有變動的部分 (接回舊快取見 _iter_merged)
+
+    新增交易日：
+    - 滾動視窗類 (MA / ATR / 52週 / ROC / PR rank)：取最後 WARMUP_ROWS + k 列重算，保留最後 k 列
+    - RSI (Wilder EWM)：從上次保存的 gain / loss 狀態繼續遞迴
+    - PR 均線：接在舊 PR 的最後 49 列後面計算
+    - 1日漲跌幅：從上次保存的最後有效收盤價繼續
+    舊期間有變動 (依 manifest 與實際數值判斷)：
+    - 歷史被改寫或新加入的股票：只重算這些股票的逐檔指標 (整段)
+    - 定義變更 / 大盤變動 / 橫截面指標：整段重算該指標 (全部股票)
+
+    Returns:
+        (keys, plan)：快取 key 與 _iter_merged 需要的資料；
+        沒有任何變動時回傳 prev；變動太多或無法增量時回傳 None (改為完整重建)
+    """
+    ok, reason = _check_layout(prev, raw)
+    if not ok:
+        print(f"⚠️ 無法增量更新: {reason}，改為完整重建")
+        return None
+
+    df_matrix = raw['close']
+    codes = df_matrix.columns
+    n_old = len(prev.dates)
+    k = len(df_matrix.index) - n_old
+    keys = cache_keys(consumed_keys())
+
+    dirty = _changed_columns(prev, raw, n_old)
+    if dirty.sum() > PARTIAL_MAX_RATIO * len(codes):
+        print(f"⚠️ {int(dirty.sum())} 檔股票歷史有改寫，改為完整重建")
+        return None
+    stale = _stale_keys(prev, keys, s_taiex, n_old, dirty, codes)
+    if len(stale) > len(keys) // 2:
+        print(f"⚠️ {len(stale)} 項指標需要整段重算，改為完整重建")
+        return None
+    if k == 0 and not dirty.any() and not stale and prev.codes.equals(codes):
+        print("✅ 沒有新增交易日，資料也沒有變動，沿用舊快取")
+        return prev
+
+    if k:
+        print(f"⚡ 增量更新 {k} 個交易日 ({df_matrix.index[n_old].date()} ~ {df_matrix.index[-1].date()})...")
+    if dirty.any():
+        print(f"🔧 {int(dirty.sum())} 檔股票歷史改寫 / 新加入，重算這些股票: {_preview(codes[dirty])}")
+    if stale:
+        print(f"🔧 整段重算指標: {', '.join(stale)}")
+
+    state = {name: series.reindex(codes) for name, series in prev['state'].items()}
+    new_rows = {}
+    if k:
+        new_rows, new_state = _tail_rows(prev, raw, s_taiex, n_old, k, [key for key in keys if key not in stale])
+        state.update(new_state)
+
+    full, full_state = _full_values(raw, s_taiex, stale) if stale else ({}, {})
+    state.update(full_state)
+
+    columns = {}
+    if dirty.any():
+        columns, col_state = _column_values(raw, s_taiex, dirty, [key for key in keys if key not in stale])
+        for name, series in col_state.items():
+            if name in state:
+                state[name] = state[name].copy()
+                state[name].loc[series.index] = series.values
+
+    return keys, {'raw': raw, 'new_rows': new_rows, 'full': full, 'dirty': dirty, 'columns': columns, 'state': state}
+
+
+def _tail_rows(prev, raw, s_taiex, n_old, k, targets):
+    """新增 k 個交易日的指標列 (只含 targets)，回傳 (new_rows, 延續狀態)"""
+    df_matrix = raw['close']
+    state = prev['state']
+    tail = slice(n_old - WARMUP_ROWS, None)
+    part = _compute_indicators(
+        raw['close'].iloc[tail], raw['high'].iloc[tail], raw['low'].iloc[tail], raw['volume'].iloc[tail],
+        s_taiex.iloc[tail] if s_taiex is not None else None,
+        verbose=False, last_n=k, targets=targets
+    )
+    new_rows = {key: val.iloc[-k:] for key, val in part.items() if isinstance(val, pd.DataFrame)}
+    new_state = {}
+
+    # 1. RSI：延續 Wilder EWM 狀態 (gain/loss 不含 NaN，直接以上次最後一列為起點)
+    #    ewm(com=13, adjust=False): y[t] = (1 - a) * y[t-1] + a * x[t], a = 1/14
+    if 'rsi' in part:
+        delta = np.diff(df_matrix.values[n_old - 1:].astype(np.float64), axis=0)
+        up = np.where(delta > 0, delta, 0.0)
+        down = np.where(delta < 0, -delta, 0.0)
+        alpha = 1.0 / 14
+        gain = np.empty_like(up)
+        loss = np.empty_like(down)
+        g = state['rsi_gain'].reindex(df_matrix.columns).values
+        l = state['rsi_loss'].reindex(df_matrix.columns).values
+        for i in range(k):
+            g = (1 - alpha) * g + alpha * up[i]
+            l = (1 - alpha) * l + alpha * down[i]
+            gain[i], loss[i] = g, l
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = 100 - (100 / (1 + gain / loss))
+        new_rows['rsi'] = pd.DataFrame(rsi, index=df_matrix.index[n_old:], columns=df_matrix.columns).astype('float32')
+        new_state['rsi_gain'] = pd.Series(gain[-1], index=df_matrix.columns)
+        new_state['rsi_loss'] = pd.Series(loss[-1], index=df_matrix.columns)
+
+    # 2. PR 均線：接在舊 PR 後面
+    for ma_key, pr_key in PR_MA50_KEYS.items():
+        if ma_key not in part or prev.get(pr_key) is None:
+            continue
+        old_pr = prev[pr_key].iloc[-49:].reindex(columns=df_matrix.columns).values
+        pr = np.concatenate([old_pr, new_rows[pr_key].values])
+        new_rows[ma_key] = pd.DataFrame(
+            rolling_tail(pr, 50, 25, last_n=k), index=new_rows[pr_key].index, columns=df_matrix.columns
+        ).astype('float32')
+
+    # 3. 1日漲跌幅：以上次最後有效收盤價為基準
+    last_close = state['last_close'].reindex(df_matrix.columns)
+    closes = pd.concat([last_close.to_frame().T, df_matrix.iloc[n_old:]])
+    if 'change_1' in part:
+        new_rows['change_1'] = (closes.ffill().pct_change() * 100).iloc[1:].astype('float32')
+    new_state['last_close'] = closes.ffill().iloc[-1]
+    return new_rows, new_state
+
+
+def _iter_merged(prev, keys, plan):
+    """
+    依 _incremental_rows 的結果產生新快取，一次一個指標
+
+    原始資料直接取新矩陣；整段重算的指標直接輸出；其餘指標為舊快取 (對齊新的股票清單)
+    接上新增列，再覆寫歷史被改寫的股票欄位。
+    呼叫端處理完一個指標後，舊快取的對應矩陣即解除 memory-map，不會累積在 RSS 中。
+    """
+    raw, new_rows, full, columns = plan['raw'], plan['new_rows'], plan['full'], plan['columns']
+    codes = raw['close'].columns
+    dirty_pos = np.flatnonzero(plan['dirty'])
+    for key in keys:
+        if key in raw:
+            yield key, raw[key]
+            continue
+        if key in full:
+            yield key, full.pop(key)
+            continue
+        old = prev[key]
+        if old is None:
+            yield key, None
+            continue
+        if not old.columns.equals(codes):
+            old = old.reindex(columns=codes)
+        new = new_rows.pop(key, None)
+        out = pd.concat([old, new.astype(old.dtypes.iloc[0])]) if new is not None else old
+        del old, new
+        fix = columns.pop(key, None)
+        if fix is not None and len(dirty_pos):
+            arr = np.array(out.values, copy=True)
+            arr[:, dirty_pos] = fix.values
+            out = pd.DataFrame(arr, index=out.index, columns=codes, copy=False)
+            del arr
+        yield key, out
+        del out, fix
+        prev.release(key)
+
+
+def generate_cache(incremental=True, stream=False, max_mem_mb=None):
+    """
+    建置市場矩陣快取
+
+    Args:
+        incremental: 只計算新增交易日，以及歷史被改寫的股票 / 定義變更的指標 (變動太多時自動改為完整重建)
+        stream: 串流模式，每算完一個指標就寫入並釋放，記憶體不隨指標數量增加
+        max_mem_mb: 記憶體上限 (MB)，超過時中止建置 (舊版快取不受影響)；設定後自動啟用串流模式
+    """
+    stream = stream or max_mem_mb is not None
+    print("🚀 開始製作加速快取檔 (完整指標版)" + (" [串流模式]" if stream else "") + "...")
     
     if not os.path.exists(DATA_FOLDER):
         print("❌ 錯誤：找不到 stock_db 資料夾！")
         return
 
-    csv_files_all = glob.glob(os.path.join(DATA_FOLDER, "*.csv"))
-    if not csv_files_all:
+    timings = {}
+    budget = MemoryBudget(max_mem_mb)
+    budget.start_phase('同步')
+    t_phase = time.time()
+
+    # 0. 同步欄式價量資料庫 (只重新解析有變動的 CSV，檔案多時並行解析)
+    store = open_store(sync=True, history_dir=DATA_FOLDER)
+    timings['同步'] = time.time() - t_phase
+    if store is None or not store.codes:
         print("⚠️ 無 CSV 檔案")
         return
 
@@ -58,237 +501,132 @@ def generate_cache():
         print("⚠️ 警告：找不到 MoneyDJ 清單，無法執行過濾！(將讀取所有檔案)")
 
     # 2. 執行過濾
-    csv_files = []
-    for f in csv_files_all:
-        sid = os.path.basename(f).replace('.csv', '')
-        # 如果有清單，就只收清單內的；否則全收
-        if valid_codes:
-            if sid in valid_codes:
-                csv_files.append(f)
-        else:
-            csv_files.append(f)
+    # 如果有清單，就只收清單內的；否則全收
+    if valid_codes:
+        stock_ids = [sid for sid in store.codes if sid in valid_codes]
+    else:
+        stock_ids = list(store.codes)
 
-    print(f"📖 正在讀取 {len(csv_files)} 檔股票資料 (已過濾)...")
-    
-    close_dict = {}
-    high_dict = {}
-    low_dict = {}
-    vol_dict = {}
-    
-    for i, file in enumerate(csv_files):
-        try:
-            stock_id = os.path.basename(file).replace('.csv', '')
-            # 讀取 Close, High, Low, Volume
-            df = pd.read_csv(file, usecols=['Date', 'Close', 'High', 'Low', 'Volume'])
-            df['Date'] = pd.to_datetime(df['Date'])
-            df.set_index('Date', inplace=True)
-            # 去重並保留最後一筆
-            df = df[~df.index.duplicated(keep='last')]
-            
-            close_dict[stock_id] = df['Close']
-            high_dict[stock_id] = df['High']
-            low_dict[stock_id]  = df['Low']
-            vol_dict[stock_id]  = df['Volume']
-            
-            if i % 100 == 0:
-                print(f"   已讀取 {i}/{len(csv_files)}...", end='\r')
-        except: continue
-    print(f"✅ 讀取完成！共 {len(close_dict)} 檔")
-
-    print("⚡ 建立全市場矩陣與轉換 Float32...")
-    # 建立全市場股價矩陣 (轉 float32 節省空間)
-    df_matrix = pd.DataFrame(close_dict).sort_index().astype('float32')
-    df_high_matrix = pd.DataFrame(high_dict).sort_index().astype('float32')
-    df_low_matrix = pd.DataFrame(low_dict).sort_index().astype('float32')
-    df_vol_matrix = pd.DataFrame(vol_dict).sort_index().astype('float32')
+    print(f"📖 正在讀取 {len(stock_ids)} 檔股票資料 (已過濾)...")
+    budget.start_phase('讀取')
+    t_phase = time.time()
+    # 全市場股價矩陣：四個欄位一次配置成 float32 (欄位 × 日期 × 股票)，共用同一個日期軸
+    block, dates, codes = store.load_block(['close', 'high', 'low', 'volume', 'open'], codes=stock_ids, dtype=np.float32)
+    df_matrix, df_high_matrix, df_low_matrix, df_vol_matrix, df_open_matrix = (
+        pd.DataFrame(block[i], index=dates, columns=codes, copy=False) for i in range(5)
+    )
+    timings['讀取'] = time.time() - t_phase
+    budget.check()
+    print(f"✅ 讀取完成！共 {len(codes)} 檔 ({timings['讀取']:.2f}s)")
 
     # Debug: Check Matrix Quality
     print(f"📊 矩陣時間範圍: {df_matrix.index[0]} ~ {df_matrix.index[-1]}")
     print(f"📉 最後一日有效股數: {df_matrix.iloc[-1].count()} / {len(df_matrix.columns)}")
     print(f"📉 倒數第二日有效股數: {df_matrix.iloc[-2].count()} / {len(df_matrix.columns)}")
     
-    # ----------------------------------------------------
-    # 1. 計算 Mansfield (需要大盤)
-    # ----------------------------------------------------
-    # ----------------------------------------------------
-    taiex_path = os.path.join(SRC_ROOT, "data_core", "TAIEX.csv")
-    df_mansfield_pr = None
-    
-    if os.path.exists(taiex_path):
+    raw = {
+        'close': df_matrix, 'high': df_high_matrix,
+        'low': df_low_matrix, 'volume': df_vol_matrix
+    }
+    s_taiex = load_taiex_series(df_matrix.index)
+
+    # 增量模式：只計算新增交易日與有變動的股票 / 指標；變動太多時自動改為完整重建
+    budget.start_phase('計算' if not stream else '計算寫入')
+    t_phase = time.time()
+    prev = load_previous_cache() if incremental else None
+    rows = _incremental_rows(prev, raw, s_taiex) if prev is not None else None
+    if rows is not None and rows is prev:
+        # 資料沒有變動，不需重寫，只更新 manifest 的檔案簽章 (周線快取不存在時補建)
+        manifest = _cache_manifest(store, df_matrix.index, df_matrix.columns,
+                                   [k for k in prev.keys() if k not in ('timestamp', 'state')], s_taiex, prev)
+        update_manifest(CACHE_DIR, manifest)
+        weekly = load_matrix_cache(WEEKLY_CACHE_DIR)
+        if weekly is None or 'days' not in weekly:
+            budget.start_phase('周線')
+            save_weekly_cache(raw, df_open_matrix, budget, manifest)
+        else:
+            update_manifest(WEEKLY_CACHE_DIR, _weekly_manifest(manifest, weekly.dates))
+        budget.report()
+        return
+
+    # items：依序產生 (key, DataFrame)；state：增量更新用的延續狀態 (完整重建時邊算邊填)
+    if rows is not None:
+        keys, plan = rows
+        state = plan['state']
+        items = _iter_merged(prev, keys, plan)
+    else:
+        state = {}
+        items = _iter_indicators(df_matrix, df_high_matrix, df_low_matrix, df_vol_matrix, s_taiex, state)
+
+    if stream:
+        # 串流：每個指標算完 (或接好) 就寫入 .npy 並釋放，全部寫完才生效
+        print("💾 逐一計算並寫入擴充快取檔...")
+        writer = MatrixCacheWriter(CACHE_DIR, df_matrix.index, df_matrix.columns)
         try:
-            print("⚡ 計算 Mansfield Strength...")
-            df_taiex = pd.read_csv(taiex_path)
-            df_taiex['Date'] = pd.to_datetime(df_taiex['Date'])
-            df_taiex.set_index('Date', inplace=True)
-            s_taiex = df_taiex['Close'].reindex(df_matrix.index, method='ffill').astype('float32')
-            
-            df_rel = df_matrix.div(s_taiex, axis=0)
-            df_ma = df_rel.rolling(window=252, min_periods=200).mean()
-            df_mansfield_raw = ((df_rel / df_ma) - 1) * 10
-            df_mansfield_pr = df_mansfield_raw.rank(axis=1, pct=True) * 100
-            df_mansfield_pr = df_mansfield_pr.astype('float32')
-        except Exception as e:
-            print(f"❌ Mansfield 計算失敗: {e}")
+            for key, val in items:
+                writer.add(key, val)
+                del val
+                budget.check(key)
+            for name, series in state.items():
+                writer.add_state(name, series)
+        except BaseException:
+            writer.abort()
+            raise
+        manifest = _cache_manifest(store, df_matrix.index, df_matrix.columns, list(writer.matrices), s_taiex, prev)
+        gen_dir = writer.commit(manifest=manifest)
+        timings['計算寫入'] = time.time() - t_phase
+        del items
+        if prev is not None:
+            prev.release()
     else:
-        print("⚠️ 缺少 TAIEX.csv，跳過 Mansfield")
+        cache_data = dict(items)
+        cache_data['state'] = state
+        timings['計算'] = time.time() - t_phase
 
-    # ----------------------------------------------------
-    # 2. 計算 IBD Rating (RS Score)
-    # ----------------------------------------------------
-    print("⚡ 計算 IBD RS Rating...")
-    # Future Warning Fix: pct_change now defaults to no fill, older pandas used pad.
-    # We use ffill() explicitly before pct_change if needed, or rely on built-in behavior with fill_method=None (for newer pandas)
-    roc1 = df_matrix.pct_change(63, fill_method=None)
-    roc2 = df_matrix.pct_change(126, fill_method=None)
-    roc3 = df_matrix.pct_change(189, fill_method=None)
-    roc4 = df_matrix.pct_change(252, fill_method=None)
-    df_ibd_raw = (roc1 * 0.4) + (roc2 * 0.2) + (roc3 * 0.2) + (roc4 * 0.2)
-    df_ibd_pr = df_ibd_raw.rank(axis=1, pct=True) * 100
-    df_ibd_pr = df_ibd_pr.astype('float32')
-    
-    # ----------------------------------------------------
-    # New: 計算 PR 值的 50日均線 (For Momentum Trend)
-    # ----------------------------------------------------
-    print("⚡ 計算 PR 值均線 (MA50)...")
-    df_mansfield_pr_ma50 = None
-    if df_mansfield_pr is not None:
-        df_mansfield_pr_ma50 = df_mansfield_pr.rolling(50, min_periods=25).mean().astype('float32')
-        
-    df_ibd_pr_ma50 = df_ibd_pr.rolling(50, min_periods=25).mean().astype('float32')
-
-    # ----------------------------------------------------
-    # 3. 計算 均線 (MA)
-    # ----------------------------------------------------
-    print("⚡ 計算各期均線 (MA)...")
-    df_ma5 = df_matrix.rolling(5, min_periods=3).mean().astype('float32')
-    df_ma10 = df_matrix.rolling(10, min_periods=5).mean().astype('float32')
-    df_ma20 = df_matrix.rolling(20, min_periods=10).mean().astype('float32')
-    df_ma50 = df_matrix.rolling(50, min_periods=25).mean().astype('float32')
-    df_ma150 = df_matrix.rolling(150, min_periods=75).mean().astype('float32')
-    df_ma200 = df_matrix.rolling(200, min_periods=100).mean().astype('float32')
-
-    # Volume MA
-    print("⚡ 計算成交量均線...")
-    df_vol_ma5 = df_vol_matrix.rolling(5, min_periods=3).mean().astype('float32')
-    df_vol_ma20 = df_vol_matrix.rolling(20, min_periods=10).mean().astype('float32') # Added as per VCP requirement
-    df_vol_ma50 = df_vol_matrix.rolling(50, min_periods=25).mean().astype('float32')
-
-    # ----------------------------------------------------
-    # 4. 計算 RSI (14)
-    # ----------------------------------------------------
-    # ----------------------------------------------------
-    # 4. 計算 RSI (14) & ATR (14)
-    # ----------------------------------------------------
-    print("⚡ 計算 RSI (14) & ATR (14)...")
-    delta = df_matrix.diff()
-    
-    # Use Wilder's Smoothing (EWM with com=13 for N=14)
-    # Standard Simple Rolling Mean (SMA) gives different results than TradingView
-    gain = (delta.where(delta > 0, 0)).ewm(com=13, adjust=False).mean()
-    loss = (-delta.where(delta < 0, 0)).ewm(com=13, adjust=False).mean()
-    
-    rs = gain / loss
-    df_rsi = 100 - (100 / (1 + rs))
-    df_rsi = df_rsi.astype('float32')
-    
-    # ATR Calculation
-    # TR = max(High-Low, abs(High-PrevClose), abs(Low-PrevClose))
-    prev_close = df_matrix.shift(1)
-    
-    # Correct Vectorized TR:
-    tr = np.maximum(
-        (df_high_matrix - df_low_matrix),
-        np.maximum(
-            (df_high_matrix - prev_close).abs(),
-            (df_low_matrix - prev_close).abs()
-        )
-    )
-    df_atr = tr.rolling(14, min_periods=5).mean().astype('float32') # Relaxed
-    df_atr5 = tr.rolling(5, min_periods=3).mean().astype('float32') # NEW for V3 (Relaxed)
-    df_atr20 = tr.rolling(20, min_periods=10).mean().astype('float32') # NEW for V3 (Relaxed)
-
-    # 4.2 Volume MAs (Fibonacci)
-    df_vol_ma8 = df_vol_matrix.rolling(8, min_periods=3).mean().astype('float32')
-    df_vol_ma34 = df_vol_matrix.rolling(34, min_periods=15).mean().astype('float32')
-
-    # Removed Linear Regression Slope calculation (too slow and unused) 
-
-
-    # ----------------------------------------------------
-    # 5. 計算 52週高低價
-    # ----------------------------------------------------
-    print("⚡ 計算 52週高低價...")
-    df_high_52w = df_high_matrix.rolling(252, min_periods=120).max().astype('float32')
-    df_low_52w = df_low_matrix.rolling(252, min_periods=120).min().astype('float32')
-
-    # ----------------------------------------------------
-    # 6. 計算 波動率 (Amplitude)
-    # ----------------------------------------------------
-    print("⚡ 計算波動率 (Amp)...")
-    # (High - Low) / Close
-    df_amplitude = (df_high_matrix - df_low_matrix) / df_matrix
-    df_amp_ma10 = df_amplitude.rolling(10).mean().astype('float32')
-    df_amp_ma20 = df_amplitude.rolling(20).mean().astype('float32')
-
-    # ----------------------------------------------------
-    # 7. 計算 1日漲跌幅 (Use ffill to calculate change vs Last Valid Close)
-    # ----------------------------------------------------
-    df_change_1 = df_matrix.ffill().pct_change() * 100
-    df_change_1 = df_change_1.astype('float32')
-
-    # 儲存
-    print("💾 正在寫入擴充快取檔...")
-    cache_data = {
-        'timestamp': time.time(),
-        
-        # 原始資料
-        'close': df_matrix,
-        'high': df_high_matrix,
-        'low': df_low_matrix,
-        'volume': df_vol_matrix,
-        
-        # 強度指標
-        'mansfield_raw': df_mansfield_raw, # NEW: Added per user request
-        'mansfield_pr': df_mansfield_pr,
-        'mansfield_pr_ma50': df_mansfield_pr_ma50,
-        'ibd_pr': df_ibd_pr,
-        'ibd_pr_ma50': df_ibd_pr_ma50,
-        
-        # 均線
-        'ma5': df_ma5, 'ma10': df_ma10, 'ma20': df_ma20,
-        'ma50': df_ma50, 'ma150': df_ma150, 'ma200': df_ma200,
-        
-        # 量能
-        'vol_ma5': df_vol_ma5, 'vol_ma20': df_vol_ma20, 'vol_ma50': df_vol_ma50,
-        'vol_ma8': df_vol_ma8, 'vol_ma34': df_vol_ma34, # NEW for V3
-        
-        # 其他技術指標
-        'rsi': df_rsi,
-        'atr': df_atr, 'atr5': df_atr5, 'atr20': df_atr20, # NEW for V3
-        # Removed Slope keys
-        'high_52w': df_high_52w, 'low_52w': df_low_52w,
-        'amp_ma10': df_amp_ma10, 'amp_ma20': df_amp_ma20,
-        'change_1': df_change_1
-    }
-    
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
-    
-    with open(CACHE_FILE, 'wb') as f:
-        pickle.dump(cache_data, f)
-        
-    size_mb = os.path.getsize(CACHE_FILE) / 1024 / 1024
+        # 儲存 (每個指標一個 .npy，讀取端按需 memory-map)
+        print("💾 正在寫入擴充快取檔...")
+        budget.start_phase('寫入')
+        t_phase = time.time()
+        cache_data['timestamp'] = time.time()
+        manifest = _cache_manifest(store, df_matrix.index, df_matrix.columns, list(cache_data), s_taiex, prev)
+        gen_dir = save_matrix_cache(cache_data, CACHE_DIR, manifest=manifest)
+        del cache_data
+        timings['寫入'] = time.time() - t_phase
+
+    # 周線矩陣 (周線篩選 / 周線圖直接查表)
+    budget.start_phase('周線')
+    t_phase = time.time()
+    save_weekly_cache(raw, df_open_matrix, budget, manifest)
+    timings['周線'] = time.time() - t_phase
+
+    size_mb = sum(os.path.getsize(os.path.join(gen_dir, f)) for f in os.listdir(gen_dir)) / 1024 / 1024
     print(f"🎉 快取製作完成！(已包含所有篩選指標)")
-    print(f"📁 檔案位置: {CACHE_FILE}")
+    print(f"📁 檔案位置: {gen_dir}")
     print(f"📦 檔案大小: {size_mb:.2f} MB")
+    print("⏱️ 各階段耗時: " + " / ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    budget.report()
 
 if __name__ == "__main__":
     
-    # Optimization: Check if already run today
-    if os.path.exists(CACHE_FILE):
-        mtime = datetime.fromtimestamp(os.path.getmtime(CACHE_FILE))
-        if mtime.date() == datetime.now().date():
-            print(f"✅ [optimize_matrix] 今日 ({mtime.date()}) 已產生矩陣，跳過執行。")
-            sys.exit(0)
-
-    generate_cache()
+    # 快取與 CSV / 指標定義一致時跳過 (只 stat CSV，內容有疑慮時才比對 sha1)
+    if "--full" not in sys.argv:
+        cached = load_matrix_cache(CACHE_DIR)
+        if cached is not None:
+            status = cached.validate(keys=cache_keys(consumed_keys()))
+            weekly = load_matrix_cache(WEEKLY_CACHE_DIR)
+            if status and weekly is not None and 'days' in weekly:
+                print(f"✅ [optimize_matrix] 快取與資料一致 (最後日期 {cached.manifest['last_date']})，跳過執行。")
+                sys.exit(0)
+            print(f"🔄 快取需要更新: {status.summary()}")
+            del cached
+
+    # --full: 強制完整重建 (不使用增量模式，也不檢查 manifest)
+    # --stream: 串流建置；--max-mem MB (或環境變數 MATRIX_MAX_MEM_MB): 記憶體上限，同時啟用串流
+    max_mem_mb = MAX_MEM_MB
+    if "--max-mem" in sys.argv:
+        max_mem_mb = float(sys.argv[sys.argv.index("--max-mem") + 1])
+    try:
+        generate_cache(incremental="--full" not in sys.argv, stream="--stream" in sys.argv, max_mem_mb=max_mem_mb)
+    except MemoryError as e:
+        print(f"❌ {e}，已中止建置 (沿用舊版快取)")
+        sys.exit(1)
@@ -0,0 +1,119 @@
+# === 網頁行情表格 (HiStock 等) 向量化清理 ===
+# 用途：
+# 1. 從 pd.read_html 的結果找出行情表格並統一欄位名稱
+# 2. 一次清理所有數值欄位 (去逗號、%、'--')，不再逐列 iterrows + try/float
+# 3. 以布林遮罩標記普通股、DR / 甲特股、振幅與成交值皆為 0 的可疑股票
+#
+# 用法：
+#     dfs = pd.read_html(StringIO(html))
+#     raw = find_quote_table(dfs, required=("代號", "價格"))
+#     quotes = normalize_quote_table(raw)
+#     quotes[quotes['is_common'] & ~quotes['is_dr_or_pref']]
+
+import numpy as np
+import pandas as pd
+
+# 標準欄位：依序檢查，第一個符合的規則決定欄位名稱
+_COLUMN_RULES = [
+    ("Code", lambda c: "代號" in c),
+    ("Name", lambda c: "名稱" in c),
+    ("Price", lambda c: "價格" in c),
+    ("Trade", lambda c: c == "成交"),            # 部分頁面用「成交」代替「價格」
+    ("Open", lambda c: "開盤" in c),
+    ("High", lambda c: "最高" in c),
+    ("Low", lambda c: "最低" in c),
+    ("Lots", lambda c: "成交量" in c),             # 單位：張
+    ("Value", lambda c: "成交值" in c or "成交額" in c),  # 單位：億
+    ("Amplitude", lambda c: "振幅" in c),          # 單位：%
+]
+
+QUOTE_COLUMNS = ['Code', 'Name', 'Close', 'Open', 'High', 'Low', 'Volume', 'Amount', 'Value', 'Amplitude']
+
+
+def clean_header(col):
+    """去除欄位名稱中的空白、換行與排序箭頭"""
+    return str(col).strip().replace(" ", "").replace("\n", "").replace("▼", "").replace("▲", "")
+
+
+def find_quote_table(dfs, required=("代號", "名稱")):
+    """
+    從 pd.read_html 的結果找出第一個包含 required 欄位的表格
+
+    欄位名稱在第一列 (而非 header) 的表格會自動把第一列提升為 header。
+
+    Returns:
+        DataFrame (欄位已經 clean_header 處理) 或 None
+    """
+    for df in dfs:
+        cols = [clean_header(c) for c in df.columns]
+        if not all(any(r in c for c in cols) for r in required) and len(df) > 0:
+            row0 = [clean_header(v) for v in df.iloc[0].values]
+            if all(any(r in c for c in row0) for r in required):
+                df = df.iloc[1:].copy()
+                cols = row0
+        if all(any(r in c for c in cols) for r in required):
+            df = df.copy()
+            df.columns = cols
+            return df
+    return None
+
+
+def to_number(series):
+    """
+    向量化轉數值：去除逗號、%、空白；'--'、'-'、空字串與無法解析者為 NaN
+    """
+    s = series.astype(str).str.replace(',', '', regex=False).str.replace('%', '', regex=False).str.strip()
+    s = s.mask(s.isin(['', '-', '--', '---', 'nan', 'None']))
+    return pd.to_numeric(s, errors='coerce').astype('float64')
+
+
+def normalize_quote_table(df):
+    """
+    將行情表格轉成標準格式 (一次處理整張表)
+
+    Returns:
+        DataFrame，欄位：
+        - Code, Name (字串)
+        - Close: 價格 (為空或 0 時改用「成交」欄)
+        - Open / High / Low: 為空或 0 時以 Close 代替
+        - Volume: 股數 (成交量張數 × 1000，空值為 0)
+        - Amount: 成交金額 (元)，優先用成交值(億)，沒有時以 Close × Volume 計算
+        - Value / Amplitude: 成交值(億) 與振幅(%)，空值為 0
+        - is_common: 4 碼數字且首位非 0 (普通股)
+        - is_dr_or_pref: 名稱含 DR 或 甲特 (存託憑證 / 特別股)
+        - is_zero_activity: 振幅與成交值皆為 0 (可能已停牌或下市)
+    """
+    names = {}
+    for col in df.columns:
+        for key, rule in _COLUMN_RULES:
+            if key not in names.values() and rule(col):
+                names[col] = key
+                break
+    src = df[list(names)].rename(columns=names)
+    src.index = range(len(src))
+
+    def column(key):
+        return to_number(src[key]) if key in src.columns else pd.Series(np.nan, index=src.index)
+
+    out = pd.DataFrame(index=src.index)
+    out['Code'] = src['Code'].astype(str).str.strip() if 'Code' in src.columns else ""
+    out['Name'] = src['Name'].astype(str) if 'Name' in src.columns else ""
+
+    price = column('Price')
+    out['Close'] = price.where(price.notna() & price.ne(0), column('Trade'))
+    for key in ('Open', 'High', 'Low'):
+        val = column(key)
+        out[key] = val.where(val.notna() & val.ne(0), out['Close'])
+
+    lots = column('Lots').fillna(0)
+    out['Volume'] = (lots * 1000).astype('int64')
+    value = column('Value').fillna(0)
+    out['Amount'] = np.where(value > 0, value * 100000000, out['Close'] * out['Volume'])
+    out['Value'] = value
+    out['Amplitude'] = column('Amplitude').fillna(0)
+
+    code = out['Code']
+    out['is_common'] = (code.str.len() == 4) & ~code.str.startswith('0') & code.str.isdigit()
+    out['is_dr_or_pref'] = out['Name'].str.contains('DR', regex=False) | out['Name'].str.contains('甲特', regex=False)
+    out['is_zero_activity'] = out['Value'].eq(0) & out['Amplitude'].eq(0)
+    return out
@@ -1,7 +1,15 @@
-"""完整重新抓取所有 history 股票資料 (2020-07-01 ~ today)"""
+"""完整重新抓取所有 history 股票資料 (2020-07-01 ~ today)
+
+進度記錄在 job_journal (SQLite)，中斷後重新執行只會處理未完成與失敗的股票；
+整輪完成後要重新開始一輪請加 --restart。
+"""
 import os, sys, glob, time, requests, pandas as pd
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from job_journal import JobJournal
+from history_index import HistoryIndex
+
 sys.stdout.reconfigure(encoding='utf-8')
 load_dotenv()
 
@@ -16,18 +24,30 @@ if not TOKEN:
     print('❌ FINMIND_TOKEN not set')
     sys.exit(1)
 
+HISTORY_INDEX = HistoryIndex(DATA)
+
+journal = JobJournal('refetch_all_history')
+if '--restart' in sys.argv:
+    journal.reset()
+
 files = glob.glob(os.path.join(DATA, '*.csv'))
-stock_ids = sorted([os.path.basename(f).replace('.csv', '') for f in files])
+journal.plan(sorted([os.path.basename(f).replace('.csv', '') for f in files]))
+stock_ids = journal.pending()
 
-print(f'📊 完整重新抓取 {len(stock_ids)} 檔')
+print(f'📊 完整重新抓取 {len(stock_ids)} 檔 ({journal.progress_line()})')
 print(f'📅 {START} ~ today')
 print(f'⏱️  預估: {len(stock_ids) * DELAY / 3600:.1f} 小時')
 print('='*60)
 
+if not stock_ids:
+    print('✅ 本輪已全部完成 (重新開始請加 --restart)')
+    sys.exit(0)
+
 success, failed, deleted = 0, [], 0
 
 for i, sid in enumerate(stock_ids):
     print(f'[{i+1}/{len(stock_ids)}] {sid}...', end=' ')
+    journal.start(sid)
     
     try:
         r = requests.get(API, params={
@@ -43,16 +63,25 @@ for i, sid in enumerate(stock_ids):
                 'start_date': START, 'token': TOKEN
             }, timeout=30)
         
+        if r.status_code != 200:
+            # 配額 / 伺服器錯誤：不可當成「無資料」刪檔，留待下次重試
+            print(f'❌ HTTP {r.status_code}')
+            journal.fail(sid, f'HTTP {r.status_code}')
+            failed.append(sid)
+            continue
+        
         data = r.json().get('data', [])
         
         if not data:
             fp = os.path.join(DATA, f'{sid}.csv')
             if os.path.exists(fp):
                 os.remove(fp)
+                HISTORY_INDEX.remove(sid)
                 deleted += 1
                 print('🗑️ Deleted')
             else:
                 print('❌ No data')
+            journal.empty(sid)
             failed.append(sid)
             continue
         
@@ -67,20 +96,28 @@ for i, sid in enumerate(stock_ids):
         
         fp = os.path.join(DATA, f'{sid}.csv')
         df.to_csv(fp, index=False, float_format='%.2f')
+        HISTORY_INDEX.update(sid)
         
         print(f'✅ {len(df)} rows')
+        journal.done(sid, last_date=str(df['Date'].iloc[-1]))
         success += 1
         
     except Exception as e:
         print(f'❌ {e}')
+        journal.fail(sid, e)
         failed.append(sid)
     
     if i < len(stock_ids) - 1:
         time.sleep(DELAY)
     
     if (i+1) % 100 == 0:
-        print(f'\n--- {i+1}/{len(stock_ids)} ({success} ok, {len(failed)} failed) ---\n')
+        print(f'\n--- {i+1}/{len(stock_ids)} ({success} ok, {len(failed)} failed) | {journal.progress_line()} ---\n')
+
+HISTORY_INDEX.save()
 
 print('\n' + '='*60)
 print(f'✅ {success} | 🗑️ {deleted} | ❌ {len(failed) - deleted}')
+print(f'📋 {journal.progress_line()}')
+if journal.failures():
+    print('   失敗的股票重新執行本腳本即可重試')
 print('='*60)
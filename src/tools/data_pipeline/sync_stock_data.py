@@ -19,10 +19,15 @@ DATA_FOLDER = os.path.join(SRC_ROOT, "data_core", "history")
 
 # 動態載入 Pipeline_data 的函數
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from history_index import HistoryIndex
+from job_journal import JobJournal
+
+HISTORY_INDEX = HistoryIndex(DATA_FOLDER)
 
 FINMIND_TOKEN = os.getenv("FINMIND_TOKEN", "")
 FINMIND_API = "https://api.finmindtrade.com/api/v4/data"
 HISTORY_YEARS = 5  # 新股抓取近幾年資料
+MAX_ATTEMPTS = 3   # 新股建檔失敗幾次後不再自動重試 (可用 python job_journal.py sync_stock_data 查看)
 
 # ================= 核心函數 =================
 
@@ -49,6 +54,7 @@ def delete_delisted_stocks(valid_stocks, existing_csvs):
             file_path = os.path.join(DATA_FOLDER, f"{code}.csv")
             if os.path.exists(file_path):
                 os.remove(file_path)
+                HISTORY_INDEX.remove(code)
                 deleted_count += 1
                 print(f"   🗑️ 刪除 {code}.csv")
         print(f"   ✅ 已刪除 {deleted_count} 檔")
@@ -93,28 +99,46 @@ def fetch_finmind_history(stock_id, years=HISTORY_YEARS):
 
 
 def create_new_stocks(valid_stocks, existing_csvs):
-    """為新上市股票建立 CSV 並抓取歷史資料"""
+    """
+    為新上市股票建立 CSV 並抓取歷史資料
+    進度記錄在 job_journal：中斷後重跑只處理尚未建檔的股票，失敗的最多重試 MAX_ATTEMPTS 次
+    """
     new_stocks = valid_stocks - existing_csvs
     created_count = 0
     
     if new_stocks:
-        print(f"\n🆕 發現 {len(new_stocks)} 檔新股票，正在建立...")
+        journal = JobJournal("sync_stock_data", max_attempts=MAX_ATTEMPTS)
+        # 沒有 CSV 的股票一律要建檔 (之前完成過但後來被刪除的也重新排入)
+        journal.plan(sorted(new_stocks), requeue_done=True)
+        todo = journal.pending(new_stocks)
+        skipped = len(new_stocks) - len(todo)
+        
+        print(f"\n🆕 發現 {len(new_stocks)} 檔新股票，正在建立..."
+              + (f" (略過 {skipped} 檔已多次失敗)" if skipped else ""))
         
-        for i, code in enumerate(sorted(new_stocks)):
-            print(f"   [{i+1}/{len(new_stocks)}] {code}...", end=" ")
+        for i, code in enumerate(todo):
+            print(f"   [{i+1}/{len(todo)}] {code}...", end=" ")
+            journal.start(code)
             
             df = fetch_finmind_history(code)
             
             if not df.empty:
                 file_path = os.path.join(DATA_FOLDER, f"{code}.csv")
                 df.to_csv(file_path, index=False, float_format='%.2f')
+                HISTORY_INDEX.update(code)
+                journal.done(code, last_date=str(df['Date'].iloc[-1]))
                 print(f"✅ {len(df)} 筆資料")
                 created_count += 1
             else:
+                journal.fail(code, "無資料")
                 print("❌ 無資料")
             
+            if (i + 1) % 50 == 0:
+                print(f"   --- {journal.progress_line()} ---")
+            
             time.sleep(1)  # 限速
         
+        journal.close()
         print(f"   ✅ 已建立 {created_count} 檔")
     
     return created_count
@@ -148,6 +172,8 @@ def main():
     # 4. 建立新股票
     created = create_new_stocks(valid_stocks, existing_csvs)
     
+    HISTORY_INDEX.save()
+    
     # 5. 總結
     print("\n" + "=" * 60)
     print("🔄 同步完成！")
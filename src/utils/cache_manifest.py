@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+指標矩陣快取的 manifest (新鮮度 / 來源紀錄)
+
+optimize_matrix 寫入快取時一併記錄 (存在 index.json 的 'manifest' 欄位)：
+    - last_date / n_dates / n_codes：矩陣範圍
+    - files：每個 history CSV 的 [mtime_ns, size, sha1]
+    - inputs：TAIEX.csv、MoneyDJ 清單等共用輸入檔的 [mtime_ns, size, sha1]
+    - indicators：每個快取 key 的定義指紋 (見 indicator_registry.fingerprint)
+
+validate() 只需要對 CSV 做 stat (約 2000 個檔案，數十毫秒)；mtime 或大小不同時
+才讀檔比對 sha1，git checkout 重設 mtime 但內容相同的檔案不會被誤判為過期。
+
+用法：
+    data = load_matrix_cache()
+    status = data.validate(keys=['close', 'rsi'])
+    if not status:
+        print(f"⚠️ 快取已過期: {status.summary()}")
+"""
+
+import os
+import hashlib
+
+try:
+    from .price_store import _scan_history, HISTORY_DIR
+    from .indicator_registry import REGISTRY, fingerprint
+except ImportError:
+    from price_store import _scan_history, HISTORY_DIR
+    from indicator_registry import REGISTRY, fingerprint
+
+# 路徑設定
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT_FILES = {
+    'taiex': os.path.join(SRC_ROOT, "data_core", "TAIEX.csv"),
+    'universe': os.path.join(SRC_ROOT, "data_core", "market_meta", "moneydj_industries.csv"),
+}
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(path):
+    """檔案內容的 sha1 (前 16 碼)，檔案不存在回傳 None"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:16]
+    except OSError:
+        return None
+
+
+def _stat(path):
+    """[mtime_ns, size]，檔案不存在回傳 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def file_signature(path, stat=None, prev=None):
+    """
+    檔案簽章 [mtime_ns, size, sha1]；檔案不存在回傳 None
+
+    stat: 已知的 [mtime_ns, size] (例如 price_store 的索引)，省略時重新 stat
+    prev: 上一版簽章，mtime / size 都相同時沿用其 sha1，不必重新讀檔
+    """
+    if stat is None:
+        stat = _stat(path)
+        if stat is None:
+            return None
+    if prev is not None and list(prev[:2]) == list(stat):
+        return [stat[0], stat[1], prev[2]]
+    return [stat[0], stat[1], file_digest(path)]
+
+
+def _same_file(path, stat, sig):
+    """stat ([mtime_ns, size]) 相同即視為未變動；否則大小相同時比對內容"""
+    if sig is None:
+        return stat is None
+    if stat is None:
+        return False
+    if list(stat) == list(sig[:2]):
+        return True
+    return stat[1] == sig[1] and file_digest(path) == sig[2]
+
+
+def build_manifest(dates, codes, keys, history_dir=HISTORY_DIR, files=None, prev=None):
+    """
+    建立 manifest
+
+    Args:
+        dates / codes: 矩陣的日期軸與股票
+        keys: 快取中的 key (原始資料以外的 key 記錄指紋)
+        history_dir: history CSV 資料夾
+        files: {代碼: [mtime_ns, size]} (例如 price_store 索引的 'files')，省略時重新掃描
+        prev: 上一版 manifest，未變動檔案沿用其 sha1
+    """
+    if files is None:
+        files = _scan_history(history_dir)
+    prev_files = (prev or {}).get('files', {})
+    prev_inputs = (prev or {}).get('inputs', {})
+    return {
+        'version': MANIFEST_VERSION,
+        'last_date': dates[-1].strftime('%Y-%m-%d') if len(dates) else None,
+        'n_dates': len(dates),
+        'n_codes': len(codes),
+        'files': {
+            code: file_signature(os.path.join(history_dir, f"{code}.csv"), stat, prev_files.get(code))
+            for code, stat in files.items()
+        },
+        'inputs': {
+            name: file_signature(path, prev=prev_inputs.get(name))
+            for name, path in INPUT_FILES.items()
+        },
+        'indicators': {key: fingerprint(key) for key in keys if key in REGISTRY},
+    }
+
+
+class CacheStatus:
+    """
+    validate() 的結果 (可直接當 bool 使用：True 表示快取與資料一致)
+
+    Attributes:
+        reasons: 過期原因 (文字)
+        changed_codes: CSV 有新增 / 修改 / 刪除的股票
+        changed_inputs: 有變動的共用輸入檔 (taiex / universe)
+        changed_keys: 定義已修改或快取中缺少的指標
+    """
+
+    def __init__(self, reasons=(), changed_codes=(), changed_inputs=(), changed_keys=()):
+        self.reasons = list(reasons)
+        self.changed_codes = list(changed_codes)
+        self.changed_inputs = list(changed_inputs)
+        self.changed_keys = list(changed_keys)
+
+    @property
+    def ok(self):
+        return not self.reasons
+
+    def __bool__(self):
+        return self.ok
+
+    def summary(self):
+        return "; ".join(self.reasons) if self.reasons else "快取與資料一致"
+
+    def __repr__(self):
+        return f"CacheStatus(ok={self.ok}, {self.summary()!r})"
+
+
+def _preview(items, limit=5):
+    items = list(items)
+    more = f" 等 {len(items)} 檔" if len(items) > limit else ""
+    return ", ".join(items[:limit]) + more
+
+
+def validate(manifest, history_dir=HISTORY_DIR, keys=None, codes=None, inputs=True):
+    """
+    檢查快取是否與目前的 CSV / 指標定義一致
+
+    Args:
+        manifest: 快取的 manifest (MarketMatrix.manifest)
+        history_dir: history CSV 資料夾
+        keys: 只檢查這些 key 的指標定義 (預設為 manifest 記錄的全部；快取沒有的 key 視為過期)
+        codes: 只檢查這些股票的 CSV (預設為全部，包含新增 / 刪除的 CSV)
+        inputs: 是否檢查共用輸入檔 (TAIEX / MoneyDJ 清單)
+
+    Returns:
+        CacheStatus
+    """
+    if not manifest or manifest.get('version') != MANIFEST_VERSION:
+        return CacheStatus(["快取沒有 manifest (舊版快取)"])
+
+    reasons = []
+    old_files = manifest.get('files', {})
+    if codes is None:
+        files = _scan_history(history_dir)
+        check = sorted(set(files) | set(old_files))
+    else:
+        files = {code: _stat(os.path.join(history_dir, f"{code}.csv")) for code in codes}
+        check = list(codes)
+    changed_codes = [
+        code for code in check
+        if not _same_file(os.path.join(history_dir, f"{code}.csv"), files.get(code), old_files.get(code))
+    ]
+    if changed_codes:
+        reasons.append(f"CSV 有變動: {_preview(changed_codes)}")
+
+    changed_inputs = []
+    if inputs:
+        old_inputs = manifest.get('inputs', {})
+        for name, path in INPUT_FILES.items():
+            if not _same_file(path, _stat(path), old_inputs.get(name)):
+                changed_inputs.append(name)
+        if changed_inputs:
+            reasons.append(f"輸入檔有變動: {', '.join(changed_inputs)}")
+
+    old_keys = manifest.get('indicators', {})
+    check_keys = list(old_keys) if keys is None else [k for k in keys if k in REGISTRY]
+    changed_keys = [k for k in check_keys if old_keys.get(k) != fingerprint(k)]
+    if changed_keys:
+        reasons.append(f"指標定義有變動或缺少: {', '.join(changed_keys)}")
+
+    return CacheStatus(reasons, changed_codes, changed_inputs, changed_keys)
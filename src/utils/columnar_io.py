@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+欄式快取共用 I/O (NumPy .npy + JSON 索引)
+
+目錄結構：
+    <root>/index.json          目前生效的索引 (指向某一個 generation)
+    <root>/<generation>/*.npy  每個欄位一個 .npy 檔，可 memory-map 讀取
+
+寫入時一律寫到新的 generation 資料夾，最後才原子替換 index.json，
+讀者永遠只會看到完整的一版；舊版資料夾延後清理
+(Windows 上被 memory-map 中的檔案無法刪除，清理失敗會直接略過)。
+"""
+
+import os
+import json
+import shutil
+import time
+import numpy as np
+
+INDEX_FILE = "index.json"
+
+
+def read_json(path, default=None):
+    """讀取 JSON，檔案不存在或損壞時回傳 default"""
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+
+def write_json(path, obj):
+    """原子寫入 JSON (先寫暫存檔再 os.replace)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_array(path, arr):
+    """寫入單一 .npy 陣列"""
+    with open(path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(arr), allow_pickle=False)
+
+
+def load_array(path, mmap=True):
+    """讀取 .npy 陣列 (預設 memory-map 唯讀，不會整檔載入記憶體)"""
+    return np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+
+
+def read_index(root):
+    """讀取目前生效的索引，不存在回傳 None"""
+    return read_json(os.path.join(root, INDEX_FILE))
+
+
+def new_generation(root):
+    """建立新的 generation 資料夾，回傳 (名稱, 路徑)"""
+    os.makedirs(root, exist_ok=True)
+    base = f"gen_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    name, n = base, 0
+    # 同一秒內重複寫入時加序號，避免覆寫到仍被 memory-map 的上一版
+    while os.path.exists(os.path.join(root, name)):
+        n += 1
+        name = f"{base}_{n}"
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    return name, path
+
+
+def commit_generation(root, name, index, keep=2):
+    """
+    將 index 指向新的 generation 並清理舊版
+
+    Args:
+        root: 快取根目錄
+        name: new_generation() 回傳的名稱
+        index: 索引內容 (dict)，會自動寫入 'generation' 欄位
+        keep: 保留最近幾版 (含本版)，讓正在讀取舊版的程序不受影響
+    """
+    index = dict(index)
+    index['generation'] = name
+    write_json(os.path.join(root, INDEX_FILE), index)
+    prune_generations(root, keep=keep, current=name)
+
+
+def prune_generations(root, keep=2, current=None):
+    """
+    刪除較舊的 generation 資料夾 (失敗就略過)
+
+    依資料夾 mtime 排序 (名稱的序號不是固定位數，字串排序不可靠)；
+    current (index.json 目前指向的版本) 一定保留，並計入 keep。
+    """
+    try:
+        gens = [d for d in os.listdir(root)
+                if d.startswith("gen_") and d != current and os.path.isdir(os.path.join(root, d))]
+        gens.sort(key=lambda d: (os.path.getmtime(os.path.join(root, d)), d))
+    except OSError:
+        return
+    keep_old = max(keep - 1, 0) if current is not None else keep
+    for d in gens[:len(gens) - keep_old] if keep_old > 0 else gens:
+        shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+
+def generation_path(root, index):
+    """取得索引目前指向的 generation 資料夾路徑"""
+    return os.path.join(root, index['generation'])
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+全市場指標登錄表 (宣告式) 與相依排程
+
+每個指標宣告：名稱、輸入 (其他指標或原始資料)、視窗、輸出 dtype、是否寫入快取。
+compute() 依相依關係排序，只計算要求的指標與它們用到的中間結果
+(漲跌幅 delta、gain / loss 的 Wilder EWM、true range...)，每個中間結果只算一次。
+
+策略在 CONSUMERS 登記自己讀取的快取 key，optimize_matrix 只建置有人使用的指標；
+新策略加一行登記 (必要時再用 @indicator 加新指標)，不必負擔整份指標清單。
+
+用法：
+    from utils.indicator_registry import compute, consumed_keys, cache_keys
+    targets = consumed_keys()                  # 所有已登記策略需要的 key
+    values = compute(targets, {'close': df_close, 'high': df_high, 'low': df_low,
+                               'volume': df_volume, 'taiex': s_taiex})
+    cache = {key: values[key] for key in cache_keys(targets)}
+
+新增指標：
+    @indicator('ma60', inputs=['close'], window=60)
+    def _ma60(ctx, close):
+        return ctx.roll(close, 60, 30)
+
+每個指標的定義指紋 (fingerprint) 會寫入快取 manifest，修改函式或參數後
+optimize_matrix 只重算受影響的指標；程式碼看不出差異的修改請遞增 version。
+"""
+
+import hashlib
+import inspect
+import json
+import numpy as np
+import pandas as pd
+
+try:
+    from .indicators import rolling_tail, rolling_slope, rank_pct
+except ImportError:
+    from indicators import rolling_tail, rolling_slope, rank_pct
+
+# 原始資料 (由呼叫端提供；taiex 為大盤收盤價 Series，可為 None)
+SOURCES = ('close', 'high', 'low', 'volume', 'taiex')
+
+
+class Indicator:
+    """
+    單一指標的宣告
+
+    Args:
+        name: 快取 key
+        inputs: 輸入的指標 / 原始資料名稱 (依序傳給 func)
+        func: func(ctx, *inputs) -> DataFrame
+        window: 最長回看列數 (說明用；增量更新的暖身長度需涵蓋它)
+        dtype: 輸出 dtype (None 表示保留計算結果的 dtype)
+        cache: 是否寫入快取 (False 為中間結果)
+        optional: 計算失敗時印出錯誤並輸出 None，而不是中斷整個建置
+        version: 定義版本 (修改計算方式但程式碼看不出差異時手動遞增，例如改用外部資料)
+        cross_section: 橫截面指標 (每一列依全部股票計算，例如 PR 排名)；
+                       任何一檔股票的資料改變，整個矩陣都要重算
+    """
+
+    def __init__(self, name, inputs, func, window=None, dtype='float32', cache=True, optional=False,
+                 version=1, cross_section=False):
+        self.name = name
+        self.inputs = list(inputs)
+        self.func = func
+        self.window = window
+        self.dtype = dtype
+        self.cache = cache
+        self.optional = optional
+        self.version = version
+        self.cross_section = cross_section
+
+    def __repr__(self):
+        return f"Indicator({self.name!r}, inputs={self.inputs}, window={self.window}, dtype={self.dtype})"
+
+
+REGISTRY = {}
+
+# 策略 / 工具讀取的快取 key (optimize_matrix 只建置這些 key 與其相依指標)
+CONSUMERS = {
+    # RSI 背離篩選 (均線、斜率另以前向填充後的收盤價自行計算)
+    'RSI_screener': ['close', 'high', 'low', 'volume', 'vol_ma20'],
+    # 技術分析圖：全市場 PR 排名
+    'technical_analysis_chart': ['mansfield_pr', 'ibd_pr'],
+}
+
+
+def indicator(name, inputs, window=None, dtype='float32', cache=True, optional=False,
+              version=1, cross_section=False):
+    """登錄指標的 decorator"""
+    def wrap(func):
+        if name in REGISTRY or name in SOURCES:
+            raise ValueError(f"指標重複登錄: {name}")
+        REGISTRY[name] = Indicator(name, inputs, func, window=window, dtype=dtype, cache=cache, optional=optional,
+                                   version=version, cross_section=cross_section)
+        return func
+    return wrap
+
+
+def register_consumer(name, keys):
+    """登記 (或覆寫) 某個策略需要的快取 key"""
+    unknown = [k for k in keys if k not in REGISTRY and k not in SOURCES]
+    if unknown:
+        raise KeyError(f"未登錄的指標: {unknown}")
+    CONSUMERS[name] = list(keys)
+
+
+def consumed_keys(consumers=None):
+    """已登記策略需要的 key 聯集 (依登錄順序；原始資料 close/high/low/volume 一律保留)"""
+    names = CONSUMERS if consumers is None else consumers
+    wanted = {'close', 'high', 'low', 'volume'}
+    for name in names:
+        wanted.update(CONSUMERS[name])
+    return [k for k in SOURCES if k in wanted] + [k for k in REGISTRY if k in wanted]
+
+
+# ============================================================
+# 🔧 相依排程
+# ============================================================
+
+def resolve(targets):
+    """
+    依相依關係排序 (只包含 targets 與其相依的指標，不含原始資料)
+
+    Raises:
+        KeyError: 未登錄的指標
+        ValueError: 循環相依
+    """
+    order, state = [], {}
+
+    def visit(name, path):
+        if name in SOURCES:
+            return
+        if name not in REGISTRY:
+            raise KeyError(f"未登錄的指標: {name}")
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"指標循環相依: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in REGISTRY[name].inputs:
+            visit(dep, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in targets:
+        visit(name, [])
+    return order
+
+
+def cache_keys(targets):
+    """
+    要寫入快取的 key：原始資料 close/high/low/volume + targets 與其相依指標中 cache=True 者
+    (相依的 PR 等指標也寫入，增量更新時需要接續)
+    """
+    return list(SOURCES[:4]) + [k for k in resolve(targets) if REGISTRY[k].cache]
+
+
+# fingerprint() 的結果快取 (登錄表在 import 時就固定)
+_FINGERPRINTS = {}
+
+
+def fingerprint(name):
+    """
+    指標定義的指紋 (版本、輸入、視窗、dtype、函式原始碼與閉包參數，並遞迴包含相依指標)
+
+    寫入快取 manifest；指紋不同表示該指標 (或它相依的指標) 的定義已修改，快取需重算。
+    原始資料 (close / taiex...) 回傳名稱本身。
+    """
+    if name in SOURCES:
+        return name
+    if name not in _FINGERPRINTS:
+        ind = REGISTRY[name]
+        try:
+            source = inspect.getsource(ind.func)
+        except (OSError, TypeError):
+            source = ind.func.__code__.co_code.hex()
+        cells = [repr(c.cell_contents) for c in (ind.func.__closure__ or ())]
+        spec = [ind.version, ind.inputs, ind.window, ind.dtype, source, cells,
+                [fingerprint(dep) for dep in ind.inputs]]
+        _FINGERPRINTS[name] = hashlib.sha1(json.dumps(spec).encode('utf-8')).hexdigest()[:16]
+    return _FINGERPRINTS[name]
+
+
+def depends_on(name, names):
+    """指標 name 是否 (直接或間接) 使用 names 中的任一指標 / 原始資料 (含 name 本身)"""
+    if name in SOURCES:
+        return name in names
+    names = set(names)
+    order = resolve([name])
+    return any(k in names or any(dep in names for dep in REGISTRY[k].inputs) for k in order)
+
+
+def is_cross_section(name):
+    """指標本身或其相依指標是否為橫截面指標 (無法只重算部分股票)"""
+    return name in REGISTRY and any(REGISTRY[k].cross_section for k in resolve([name]))
+
+
+class ComputeContext:
+    """
+    指標計算的共用工具
+
+    last_n: 只保證最後 last_n 列正確 (增量模式)，滾動視窗改用 NumPy 尾段運算，
+            其餘列填 NaN；None 表示整段計算
+    """
+
+    def __init__(self, last_n=None):
+        self.last_n = last_n
+
+    def roll(self, df, window, min_periods=None, how='mean'):
+        if self.last_n is None:
+            return getattr(df.rolling(window, min_periods=min_periods), how)()
+        out = np.full(df.shape, np.nan)
+        out[-self.last_n:] = rolling_tail(df.values, window, min_periods, how=how, last_n=self.last_n)
+        return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+    def rank(self, df):
+        """橫截面百分位排名 (同 df.rank(axis=1, pct=True))；增量模式只排名最後 last_n 列"""
+        if self.last_n is None:
+            return pd.DataFrame(rank_pct(df.values), index=df.index, columns=df.columns)
+        out = np.full(df.shape, np.nan)
+        out[-self.last_n:] = rank_pct(df.values, last_n=self.last_n)
+        return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+    def ma_slope(self, df, window, min_periods, slope_window):
+        """均線的滾動斜率 (增量模式需要多算 slope_window-1 列均線)"""
+        if self.last_n is None:
+            ma = self.roll(df, window, min_periods).astype('float32').values
+            return pd.DataFrame(rolling_slope(ma, slope_window), index=df.index, columns=df.columns)
+        last_n = self.last_n
+        ma = rolling_tail(df.values, window, min_periods, last_n=last_n + slope_window - 1).astype('float32')
+        out = np.full(df.shape, np.nan)
+        out[-last_n:] = rolling_slope(ma, slope_window, last_n=last_n)
+        return pd.DataFrame(out, index=df.index, columns=df.columns)
+
+
+def iter_compute(targets, sources, last_n=None, verbose=True, release=True):
+    """
+    依相依順序逐一計算指標，每算完一個就 yield (name, value)
+
+    release=True 時，中間結果在最後一個使用它的指標算完後即不再保留
+    (呼叫端寫入快取後釋放自己的參照，記憶體只需容納目前仍有人要用的矩陣)。
+
+    Args:
+        targets / sources / last_n: 同 compute()
+        release: 是否釋放用完的指標
+
+    Yields:
+        (name, DataFrame 或 None)
+    """
+    order = resolve(targets)
+    if verbose:
+        print(f"⚡ 計算 {len(order)} 項指標 (含中間結果)...")
+    last_use = {}
+    for pos, name in enumerate(order):
+        for dep in REGISTRY[name].inputs:
+            last_use[dep] = pos
+
+    ctx = ComputeContext(last_n)
+    values = dict(sources)
+    for pos, name in enumerate(order):
+        ind = REGISTRY[name]
+        args = [values.get(dep) for dep in ind.inputs]
+        if any(arg is None for arg in args):
+            out = None
+        else:
+            try:
+                out = ind.func(ctx, *args)
+            except Exception as e:
+                if not ind.optional:
+                    raise
+                print(f"❌ {name} 計算失敗: {e}")
+                out = None
+            if out is not None and ind.dtype is not None:
+                out = out.astype(ind.dtype)
+        del args
+        values[name] = out
+        if release:
+            for dep in ind.inputs:
+                if dep in REGISTRY and last_use[dep] == pos:
+                    values.pop(dep, None)
+            if name not in last_use:
+                values.pop(name)
+        yield name, out
+        del out
+
+
+def compute(targets, sources, last_n=None, verbose=True):
+    """
+    計算 targets 與其相依指標
+
+    Args:
+        targets: 要計算的 key
+        sources: 原始資料 dict (close / high / low / volume 為 DataFrame，taiex 為 Series 或 None)
+        last_n: 增量模式 (見 ComputeContext)
+
+    Returns:
+        dict: 原始資料 + 所有計算過的指標 (含中間結果)；
+              輸入為 None (例如缺 TAIEX) 或 optional 指標計算失敗時值為 None
+    """
+    values = dict(sources)
+    values.update(iter_compute(targets, sources, last_n=last_n, verbose=verbose, release=False))
+    return values
+
+
+# ============================================================
+# 📋 指標清單
+# ============================================================
+
+# ---- 強度指標：Mansfield (需要大盤) ----
+@indicator('rel_taiex', inputs=['close', 'taiex'], dtype=None, cache=False, optional=True)
+def _rel_taiex(ctx, close, taiex):
+    return close.div(taiex, axis=0)
+
+
+@indicator('mansfield_raw', inputs=['rel_taiex'], window=252, dtype='float64', optional=True)
+def _mansfield_raw(ctx, rel):
+    return ((rel / ctx.roll(rel, 252, 200)) - 1) * 10
+
+
+@indicator('mansfield_pr', inputs=['mansfield_raw'], optional=True, cross_section=True)
+def _mansfield_pr(ctx, raw):
+    return ctx.rank(raw) * 100
+
+
+@indicator('mansfield_pr_ma50', inputs=['mansfield_pr'], window=50)
+def _mansfield_pr_ma50(ctx, pr):
+    return ctx.roll(pr, 50, 25)
+
+
+# ---- 強度指標：IBD RS Rating ----
+@indicator('ibd_raw', inputs=['close'], window=252, dtype=None, cache=False)
+def _ibd_raw(ctx, close):
+    roc1 = close.pct_change(63, fill_method=None)
+    roc2 = close.pct_change(126, fill_method=None)
+    roc3 = close.pct_change(189, fill_method=None)
+    roc4 = close.pct_change(252, fill_method=None)
+    return (roc1 * 0.4) + (roc2 * 0.2) + (roc3 * 0.2) + (roc4 * 0.2)
+
+
+@indicator('ibd_pr', inputs=['ibd_raw'], cross_section=True)
+def _ibd_pr(ctx, raw):
+    return ctx.rank(raw) * 100
+
+
+@indicator('ibd_pr_ma50', inputs=['ibd_pr'], window=50)
+def _ibd_pr_ma50(ctx, pr):
+    return ctx.roll(pr, 50, 25)
+
+
+# ---- 均線 (min_periods 為視窗的一半) ----
+def _register_ma(name, source, window, min_periods):
+    indicator(name, inputs=[source], window=window)(lambda ctx, df: ctx.roll(df, window, min_periods))
+
+
+for _w, _mp in [(5, 3), (10, 5), (20, 10), (50, 25), (150, 75), (200, 100)]:
+    _register_ma(f'ma{_w}', 'close', _w, _mp)
+
+
+@indicator('ma200_slope10', inputs=['close'], window=209)
+def _ma200_slope10(ctx, close):
+    # MA200 的 10 日回歸斜率 (趨勢向上過濾)
+    return ctx.ma_slope(close, 200, 100, 10)
+
+
+for _w, _mp in [(5, 3), (20, 10), (50, 25), (8, 3), (34, 15)]:
+    _register_ma(f'vol_ma{_w}', 'volume', _w, _mp)
+
+
+# ---- RSI (14)：Wilder's Smoothing (EWM com=13，與 TradingView 相同) ----
+@indicator('delta', inputs=['close'], dtype=None, cache=False)
+def _delta(ctx, close):
+    return close.diff()
+
+
+@indicator('rsi_gain', inputs=['delta'], dtype=None, cache=False)
+def _rsi_gain(ctx, delta):
+    return (delta.where(delta > 0, 0)).ewm(com=13, adjust=False).mean()
+
+
+@indicator('rsi_loss', inputs=['delta'], dtype=None, cache=False)
+def _rsi_loss(ctx, delta):
+    return (-delta.where(delta < 0, 0)).ewm(com=13, adjust=False).mean()
+
+
+@indicator('rsi', inputs=['rsi_gain', 'rsi_loss'])
+def _rsi(ctx, gain, loss):
+    return 100 - (100 / (1 + gain / loss))
+
+
+# ---- ATR：TR = max(High-Low, |High-PrevClose|, |Low-PrevClose|) ----
+@indicator('true_range', inputs=['close', 'high', 'low'], dtype=None, cache=False)
+def _true_range(ctx, close, high, low):
+    prev_close = close.shift(1)
+    return np.maximum(
+        (high - low),
+        np.maximum((high - prev_close).abs(), (low - prev_close).abs())
+    )
+
+
+for _name, _w, _mp in [('atr', 14, 5), ('atr5', 5, 3), ('atr20', 20, 10)]:
+    _register_ma(_name, 'true_range', _w, _mp)
+
+
+# ---- 52週高低價 ----
+@indicator('high_52w', inputs=['high'], window=252)
+def _high_52w(ctx, high):
+    return ctx.roll(high, 252, 120, how='max')
+
+
+@indicator('low_52w', inputs=['low'], window=252)
+def _low_52w(ctx, low):
+    return ctx.roll(low, 252, 120, how='min')
+
+
+# ---- 波動率 (High - Low) / Close ----
+@indicator('amplitude', inputs=['close', 'high', 'low'], dtype=None, cache=False)
+def _amplitude(ctx, close, high, low):
+    return (high - low) / close
+
+
+for _w in (10, 20):
+    _register_ma(f'amp_ma{_w}', 'amplitude', _w, None)
+
+
+# ---- 1日漲跌幅 (以前一個有效收盤價為基準) ----
+@indicator('change_1', inputs=['close'])
+def _change_1(ctx, close):
+    return close.ffill().pct_change() * 100
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    used = set(resolve(consumed_keys()))
+    print(f"📋 已登錄 {len(REGISTRY)} 項指標，建置 {len(used)} 項")
+    for name, ind in REGISTRY.items():
+        mark = "✅" if name in used else "⏭️"
+        kind = "" if ind.cache else " (中間結果)"
+        print(f"   {mark} {name:<18} ← {', '.join(ind.inputs)}{kind}")
+    for name, keys in CONSUMERS.items():
+        print(f"🧩 {name}: {len(keys)} 個 key")
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+全市場矩陣指標運算核心 (NumPy 向量化)
+
+輸入皆為「日期 × 股票」的 2D 陣列 (列 = 日期，欄 = 股票)，
+一次處理所有股票，不逐欄呼叫 pandas，適合只需要最後幾列的增量計算。
+
+NaN 規則與 pandas rolling 相同：視窗內忽略 NaN，
+有效筆數不足 min_periods 時輸出 NaN。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def rolling_tail(values, window, min_periods=None, how='mean', last_n=1):
+    """
+    只計算最後 last_n 列的滾動統計
+
+    Args:
+        values: 2D 陣列 (日期 × 股票)
+        window: 視窗長度
+        min_periods: 最少有效筆數 (預設 = window，與 pandas 相同)
+        how: 'mean' / 'max' / 'min'
+        last_n: 要輸出的列數 (取最後 last_n 列)
+
+    Returns:
+        np.ndarray (last_n × 股票)，float64
+    """
+    if min_periods is None:
+        min_periods = window
+    values = np.asarray(values, dtype=np.float64)
+    n_rows = values.shape[0]
+    last_n = min(last_n, n_rows)
+
+    # 取出需要的尾段；不足 window 時前面補 NaN
+    need = last_n + window - 1
+    seg = values[max(0, n_rows - need):]
+    if seg.shape[0] < need:
+        pad = np.full((need - seg.shape[0],) + seg.shape[1:], np.nan)
+        seg = np.concatenate([pad, seg])
+
+    win = sliding_window_view(seg, window, axis=0)  # (last_n, 股票, window)
+    valid = ~np.isnan(win)
+    count = valid.sum(axis=-1)
+
+    if how == 'mean':
+        out = np.where(valid, win, 0.0).sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = out / count
+    elif how == 'max':
+        out = np.where(valid, win, -np.inf).max(axis=-1)
+    elif how == 'min':
+        out = np.where(valid, win, np.inf).min(axis=-1)
+    else:
+        raise ValueError(f"不支援的滾動統計: {how}")
+
+    out[count < max(min_periods, 1)] = np.nan
+    return out
+
+
+def rolling_slope(values, window, last_n=None):
+    """
+    滾動線性回歸斜率 (最小平方法，x = 0, 1, ..., window-1)
+
+    封閉解：slope = (Σxy - x̄Σy) / Σ(x - x̄)²；x 以視窗中心為原點時 Σy 項為 0，
+    只需累加 window 個位移切片，不必逐視窗呼叫 np.polyfit。
+    視窗內有 NaN 時輸出 NaN (與 polyfit 版本相同)。
+
+    Args:
+        values: 2D 陣列 (日期 × 股票) 或 1D 陣列
+        window: 視窗長度
+        last_n: 只計算最後 last_n 列 (None 表示全部，前 window-1 列為 NaN)
+
+    Returns:
+        np.ndarray，float64；last_n 為 None 時形狀與 values 相同，否則為 (last_n, ...)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows = values.shape[0]
+    last_n = n_rows if last_n is None else min(last_n, n_rows)
+
+    need = last_n + window - 1
+    seg = values[max(0, n_rows - need):]
+    if seg.shape[0] < need:
+        pad = np.full((need - seg.shape[0],) + seg.shape[1:], np.nan)
+        seg = np.concatenate([pad, seg])
+
+    x = np.arange(window, dtype=np.float64) - (window - 1) / 2.0
+    out = np.zeros((last_n,) + seg.shape[1:])
+    for j in range(window):
+        out += x[j] * seg[j:j + last_n]
+    return out / (x * x).sum()
+
+
+def iso_week_starts(dates):
+    """
+    ISO 周次分組 (週一 ~ 週日)：回傳每週第一列的位置
+
+    dates 需已排序；同一週的日期必定連續，所有股票共用同一組分段，
+    搭配 resample_weekly 以 reduceat 一次聚合整個矩陣。
+    """
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    monday = days - (days + 3) % 7   # 1970-01-01 為週四
+    return np.flatnonzero(np.r_[True, monday[1:] != monday[:-1]])
+
+
+def week_end_rows(starts, n_rows):
+    """每週最後一列的位置 (作為周線的日期標籤)"""
+    return np.r_[starts[1:] - 1, n_rows - 1]
+
+
+def resample_weekly(values, starts, how='last', valid=None):
+    """
+    日線矩陣依週聚合 (與逐檔 groupby(ISO 周次).last/max/min/first/sum 相同)
+
+    Args:
+        values: 2D 陣列 (日期 × 股票)
+        starts: iso_week_starts 的結果
+        how: 'first' / 'last' / 'max' / 'min' / 'sum'
+        valid: 參與聚合的列 (預設為非 NaN)；整週沒有有效列時輸出 NaN
+
+    Returns:
+        np.ndarray (週 × 股票)，dtype 與 values 相同 (sum 以 float64 累加)
+    """
+    values = np.asarray(values)
+    n_rows = values.shape[0]
+    if valid is None:
+        valid = ~np.isnan(values)
+
+    if how in ('first', 'last'):
+        rows = np.arange(n_rows)[:, None]
+        if how == 'last':
+            pos = np.maximum.reduceat(np.where(valid, rows, -1), starts, axis=0)
+        else:
+            pos = np.minimum.reduceat(np.where(valid, rows, n_rows), starts, axis=0)
+        found = (pos >= 0) & (pos < n_rows)
+        out = np.take_along_axis(values, np.clip(pos, 0, n_rows - 1), axis=0)
+        return np.where(found, out, np.nan).astype(values.dtype)
+    if how == 'max':
+        return np.fmax.reduceat(np.where(valid, values, np.nan), starts, axis=0)
+    if how == 'min':
+        return np.fmin.reduceat(np.where(valid, values, np.nan), starts, axis=0)
+    if how == 'sum':
+        filled = np.where(valid & ~np.isnan(values), values, 0).astype(np.float64)
+        out = np.add.reduceat(filled, starts, axis=0)
+        count = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        return np.where(count > 0, out, np.nan).astype(values.dtype)
+    raise ValueError(f"不支援的周線聚合: {how}")
+
+
+def _sorted_order(values):
+    """
+    每列由小到大的欄位順序與排序後的比較鍵 (NaN 排在最後)
+
+    float32：把值轉成保序的 uint32 (負數取反、正數補上符號位)，與欄號合併成一個 uint64
+    直接 np.sort，比 argsort 快數倍。
+    float64：先以 float32 排序 (轉型保序，只會把相近的值併成同值)，
+    只有「float32 同值但 float64 不同」的列才用 argsort 重排；其他 dtype 用 argsort。
+
+    Returns:
+        (order, ranked, valid)：order 為原始欄號，ranked 可用 != 判斷同值，valid 為非 NaN
+    """
+    n_cols = values.shape[1]
+    if values.dtype == np.float32 and n_cols < 2 ** 32:
+        bits = (values + np.float32(0)).view(np.uint32)          # -0.0 與 0.0 視為同值
+        flip = (bits.view(np.int32) >> 31).view(np.uint32) | np.uint32(0x80000000)
+        key = bits ^ flip
+        key[np.isnan(values)] = np.uint32(0xFFFFFFFF)
+        packed = (key.astype(np.uint64) << np.uint64(32)) | np.arange(n_cols, dtype=np.uint64)
+        packed.sort(axis=1)
+        order = (packed & np.uint64(0xFFFFFFFF)).astype(np.intp)
+        ranked = (packed >> np.uint64(32)).astype(np.uint32)
+        return order, ranked, ranked != np.uint32(0xFFFFFFFF)
+    if values.dtype == np.float64:
+        order, ranked32, valid = _sorted_order(values.astype(np.float32))
+        ranked = np.take_along_axis(values, order, axis=1)
+        merged = (ranked32[:, 1:] == ranked32[:, :-1]) & (ranked[:, 1:] != ranked[:, :-1]) & valid[:, 1:]
+        redo = merged.any(axis=1)
+        if redo.any():
+            order[redo] = np.argsort(values[redo], axis=1, kind='stable')
+            ranked[redo] = np.take_along_axis(values[redo], order[redo], axis=1)
+        return order, ranked, valid
+    order = np.argsort(values, axis=1, kind='stable')
+    ranked = np.take_along_axis(values, order, axis=1)
+    return order, ranked, ~np.isnan(ranked)
+
+
+def _rank_block(values):
+    """rank_pct 的單一區塊：排序後以同值區段的頭尾位置求平均名次，再放回原欄位"""
+    n_rows, n_cols = values.shape
+    order, ranked, valid = _sorted_order(values)
+    count = valid.sum(axis=1, keepdims=True)
+    pos = np.arange(n_cols)
+
+    # 名次 (1 起算)；有同值的區段取 [start, end] 的平均
+    tie = np.zeros(ranked.shape, dtype=bool)
+    tie[:, 1:] = (ranked[:, 1:] == ranked[:, :-1]) & valid[:, 1:]
+    if tie.any():
+        new_group = ~tie
+        group_end = np.ones(ranked.shape, dtype=bool)
+        group_end[:, :-1] = new_group[:, 1:]
+        start = np.maximum.accumulate(np.where(new_group, pos, 0), axis=1)
+        end = np.minimum.accumulate(np.where(group_end, pos, n_cols - 1)[:, ::-1], axis=1)[:, ::-1]
+        rank = (start + end) / 2.0 + 1.0
+    else:
+        rank = np.broadcast_to(pos + 1.0, ranked.shape)
+
+    # 名次與筆數皆為整數，相除結果與 pandas 逐位元相同
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = np.where(valid, rank / count, np.nan)
+
+    out = np.empty(ranked.shape)
+    out[np.arange(n_rows)[:, None], order] = pct
+    return out
+
+
+def rank_pct(values, last_n=None, block_rows=64, workers=None):
+    """
+    橫截面百分位排名 (與 DataFrame.rank(axis=1, pct=True) 相同)
+
+    每列 (日期) 獨立排名：NaN 不參與排名且輸出 NaN，同值取平均名次，
+    百分位 = 名次 / 該列有效筆數。輸入維持原 dtype 排序 (float32 不先轉 float64)，
+    依 block_rows 分塊，workers > 1 時以執行緒平行處理 (NumPy 排序會釋放 GIL)。
+
+    Args:
+        values: 2D 陣列 (日期 × 股票)
+        last_n: 只排名最後 last_n 列 (增量模式；None 表示全部)
+        block_rows: 每塊列數 (控制暫存陣列大小)
+        workers: 執行緒數 (None 為 CPU 數)
+
+    Returns:
+        np.ndarray，float64；last_n 為 None 時形狀與 values 相同，否則為 (last_n, 股票)
+    """
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    n_rows = values.shape[0]
+    if last_n is not None:
+        values = values[n_rows - min(last_n, n_rows):]
+        n_rows = values.shape[0]
+
+    out = np.empty(values.shape)
+    blocks = [(lo, min(lo + block_rows, n_rows)) for lo in range(0, n_rows, block_rows)]
+
+    def run(block):
+        lo, hi = block
+        out[lo:hi] = _rank_block(values[lo:hi])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(blocks))) as pool:
+            list(pool.map(run, blocks))
+    else:
+        for block in blocks:
+            run(block)
+    return out
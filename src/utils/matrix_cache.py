@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+全市場指標矩陣快取 (取代單一 market_matrix.pkl)
+
+每個指標一個 .npy (日期 × 股票)，共用同一份日期 / 股票索引 (index.json)。
+讀取時回傳 MarketMatrix，行為類似 dict，但只有在第一次取用某個 key 時
+才 memory-map 對應的檔案，策略用到幾個指標就只付幾個指標的成本。
+
+用法：
+    from utils.matrix_cache import load_matrix_cache
+    data = load_matrix_cache()
+    df_close = data['close']          # 第一次取用才載入
+    df_rsi = data.get('rsi')
+
+寫入使用 generation 資料夾 + 原子替換 index.json (見 columnar_io)，
+讀取中的程序不會讀到寫一半的資料。
+
+index.json 另記錄 manifest (來源 CSV 簽章、指標定義指紋，見 cache_manifest)，
+讀取端可用 data.validate() 檢查快取是否與目前的 CSV 一致。
+"""
+
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    from .columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path, write_json, INDEX_FILE
+    )
+    from .cache_manifest import validate as validate_manifest
+except ImportError:
+    from columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path, write_json, INDEX_FILE
+    )
+    from cache_manifest import validate as validate_manifest
+
+# 路徑設定
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MATRIX_DIR = os.path.join(SRC_ROOT, "cache", "market_matrix")
+
+MATRIX_VERSION = 1
+
+
+class MarketMatrix:
+    """
+    延遲載入的指標矩陣集合 (唯讀)
+
+    - data[key] / data.get(key)：回傳 DataFrame (index=日期, columns=股票)
+    - 值為 None 的指標 (例如缺 TAIEX 時的 mansfield_pr) 仍可取用，回傳 None
+    - data['timestamp']：建立時間 (time.time())
+    - data['state']：增量更新用的延續狀態 (dict of Series)
+    - data.manifest / data.validate()：來源紀錄與新鮮度檢查
+    """
+
+    def __init__(self, root=MATRIX_DIR):
+        index = read_index(root)
+        if index is None or index.get('version') != MATRIX_VERSION:
+            raise FileNotFoundError(f"找不到指標矩陣快取: {root}")
+
+        self.root = root
+        self.index = index
+        self.timestamp = index.get('timestamp')
+        self.dates = pd.DatetimeIndex(pd.to_datetime(index['dates']), name=index.get('index_name'))
+        self.codes = pd.Index(index['codes'], dtype=object)
+        self._gen_dir = generation_path(root, index)
+        self._matrices = index['matrices']
+        self._loaded = {}
+
+    # ---- dict 介面 ----
+    def keys(self):
+        return ['timestamp'] + list(self._matrices) + (['state'] if self.index.get('state') else [])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key == 'timestamp' or key in self._matrices or (key == 'state' and bool(self.index.get('state')))
+
+    def __getitem__(self, key):
+        if key == 'timestamp':
+            return self.timestamp
+        if key == 'state':
+            return self._load_state()
+        if key not in self._matrices:
+            raise KeyError(key)
+        if key not in self._loaded:
+            self._loaded[key] = self._load_matrix(key)
+        return self._loaded[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return ((key, self[key]) for key in self.keys())
+
+    @property
+    def loaded_keys(self):
+        """目前已載入 (已 memory-map) 的指標"""
+        return list(self._loaded)
+
+    @property
+    def manifest(self):
+        """建置時的來源紀錄 (舊版快取為 None)"""
+        return self.index.get('manifest')
+
+    def validate(self, keys=None, codes=None, **kwargs):
+        """
+        檢查快取是否與目前的 CSV / 指標定義一致 (參數見 cache_manifest.validate)
+
+        Returns:
+            CacheStatus (可當 bool 使用)
+        """
+        return validate_manifest(self.manifest, keys=keys, codes=codes, **kwargs)
+
+    def release(self, key=None):
+        """釋放已載入的矩陣 (解除 memory-map，讓頁面不再計入 RSS)；key=None 表示全部"""
+        if key is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(key, None)
+
+    # ---- 內部 ----
+    def _load_matrix(self, key):
+        if self._matrices[key] is None:
+            return None
+        arr = load_array(os.path.join(self._gen_dir, f"{key}.npy"))
+        return pd.DataFrame(arr, index=self.dates, columns=self.codes, copy=False)
+
+    def _load_state(self):
+        if 'state' not in self._loaded:
+            self._loaded['state'] = {
+                name: pd.Series(np.array(load_array(os.path.join(self._gen_dir, f"state.{name}.npy"))), index=self.codes)
+                for name in self.index.get('state', [])
+            }
+        return self._loaded['state']
+
+
+class MatrixCacheWriter:
+    """
+    逐一寫入指標矩陣 (串流建置用)
+
+    每個指標 add() 後立即寫成 .npy，呼叫端即可釋放該矩陣，記憶體只需容納一個指標；
+    commit() 才原子替換 index.json，中途失敗 (或呼叫 abort()) 舊版快取不受影響。
+
+    用法：
+        writer = MatrixCacheWriter(root, df_close.index, df_close.columns)
+        writer.add('close', df_close)
+        writer.add('rsi', df_rsi)
+        writer.add_state('last_close', s_last)
+        gen_dir = writer.commit()
+    """
+
+    def __init__(self, root, dates, codes):
+        self.root = root
+        self.dates = dates
+        self.codes = codes
+        self.gen_name, self.gen_dir = new_generation(root)
+        self.matrices = {}
+        self.state = []
+
+    def add(self, key, val):
+        """寫入一個指標 (DataFrame 會對齊到共用的日期 / 股票軸；None 表示該指標無資料)"""
+        if val is None:
+            self.matrices[key] = None
+            return
+        if not (val.index.equals(self.dates) and val.columns.equals(self.codes)):
+            val = val.reindex(index=self.dates, columns=self.codes)
+        arr = val.to_numpy()
+        save_array(os.path.join(self.gen_dir, f"{key}.npy"), arr)
+        self.matrices[key] = str(arr.dtype)
+
+    def add_state(self, name, series):
+        """寫入增量更新用的延續狀態 (每檔一個值)"""
+        save_array(os.path.join(self.gen_dir, f"state.{name}.npy"), series.reindex(self.codes).to_numpy())
+        self.state.append(name)
+
+    def commit(self, timestamp=None, keep=2, manifest=None):
+        """生效本次寫入的 generation，回傳資料夾路徑 (manifest 見 cache_manifest.build_manifest)"""
+        index = {
+            'version': MATRIX_VERSION,
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': time.time() if timestamp is None else timestamp,
+            'index_name': self.dates.name,
+            'dates': [d.strftime('%Y-%m-%d') for d in self.dates],
+            'codes': [str(c) for c in self.codes],
+            'matrices': self.matrices,
+            'state': self.state,
+        }
+        if manifest is not None:
+            index['manifest'] = manifest
+        commit_generation(self.root, self.gen_name, index, keep=keep)
+        return self.gen_dir
+
+    def abort(self):
+        """放棄本次寫入 (刪除未生效的 generation 資料夾)"""
+        shutil.rmtree(self.gen_dir, ignore_errors=True)
+
+
+def save_matrix_cache(cache_data, root=MATRIX_DIR, keep=2, manifest=None):
+    """
+    寫入指標矩陣快取
+
+    Args:
+        cache_data: dict，與舊版 market_matrix.pkl 相同結構
+            (所有 DataFrame 需共用 close 的 index / columns；'state' 為 dict of Series)
+        root: 快取資料夾
+        keep: 保留幾版 generation
+        manifest: 來源紀錄 (見 cache_manifest.build_manifest)
+
+    Returns:
+        本次寫入的 generation 資料夾路徑
+    """
+    base = cache_data['close']
+    writer = MatrixCacheWriter(root, base.index, base.columns)
+    for key, val in cache_data.items():
+        if key not in ('timestamp', 'state'):
+            writer.add(key, val)
+    for name, series in (cache_data.get('state') or {}).items():
+        writer.add_state(name, series)
+    return writer.commit(cache_data.get('timestamp'), keep=keep, manifest=manifest)
+
+
+def update_manifest(root, manifest):
+    """只更新目前版本的 manifest (資料沒有變動，例如 CSV 只被重新 checkout)"""
+    index = read_index(root)
+    if index is None:
+        return False
+    index['manifest'] = manifest
+    write_json(os.path.join(root, INDEX_FILE), index)
+    return True
+
+
+def load_matrix_cache(root=MATRIX_DIR):
+    """開啟指標矩陣快取，不存在或損壞時回傳 None"""
+    try:
+        return MarketMatrix(root)
+    except Exception:
+        return None
+
+
+def cache_mtime(root=MATRIX_DIR):
+    """快取最後更新時間 (index.json 的 mtime)，不存在回傳 None"""
+    path = os.path.join(root, INDEX_FILE)
+    return os.path.getmtime(path) if os.path.exists(path) else None
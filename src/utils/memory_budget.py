@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+建置流程的記憶體監控 (RSS 峰值 / 記憶體上限)
+
+optimize_matrix 在 CI (GitHub Actions) 上執行，記憶體有限；
+MemoryBudget 記錄每個階段的 RSS 峰值，並在超過上限時中止建置 (舊版快取不受影響)。
+
+峰值來源：
+- Linux：/proc/self/status 的 VmHWM，每個階段開始時寫入 /proc/self/clear_refs 歸零
+- 其他平台：在 check() 時取樣目前 RSS (psutil 可用時)
+
+用法：
+    budget = MemoryBudget(limit_mb=2048)
+    budget.start_phase('讀取')
+    ...
+    budget.check('rsi')          # 超過上限時拋出 MemoryError
+    budget.finish()
+    budget.report()
+"""
+
+import gc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _read_status_mb(field):
+    """讀取 /proc/self/status 的記憶體欄位 (MB)，不支援時回傳 None"""
+    try:
+        with open(_PROC_STATUS, 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    """目前 RSS (MB)，無法取得時回傳 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    return _read_status_mb('VmRSS')
+
+
+def _reset_peak():
+    """把 VmHWM 歸零為目前 RSS (Linux 4.0+)，成功回傳 True"""
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class MemoryBudget:
+    """
+    分階段記錄 RSS 峰值，並檢查記憶體上限
+
+    Args:
+        limit_mb: 記憶體上限 (MB)；None 表示只記錄不限制
+    """
+
+    def __init__(self, limit_mb=None):
+        self.limit_mb = limit_mb
+        self.peaks = {}
+        self._phase = None
+        self._peak = 0.0
+        self._hwm = False
+
+    def start_phase(self, name):
+        """開始新的階段 (自動結束上一個階段)"""
+        self.finish()
+        self._phase = name
+        self._hwm = _reset_peak()
+        self._peak = current_rss_mb() or 0.0
+
+    def finish(self):
+        """結束目前階段並記錄峰值"""
+        if self._phase is None:
+            return
+        self._sample()
+        self.peaks[self._phase] = self._peak
+        self._phase = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self._peak = max(self._peak, rss)
+        if self._hwm:
+            hwm = _read_status_mb('VmHWM')
+            if hwm is not None:
+                self._peak = max(self._peak, hwm)
+        return rss
+
+    def check(self, label=""):
+        """
+        取樣目前 RSS；超過上限時先 gc 再檢查一次，仍超過則拋出 MemoryError
+
+        Returns:
+            目前 RSS (MB) 或 None
+        """
+        rss = self._sample()
+        if self.limit_mb is None or rss is None or rss <= self.limit_mb:
+            return rss
+        gc.collect()
+        rss = current_rss_mb()
+        if rss is not None and rss > self.limit_mb:
+            where = f"{self._phase} / {label}" if label else self._phase
+            raise MemoryError(f"記憶體 {rss:.0f} MB 超過上限 {self.limit_mb:.0f} MB ({where})")
+        return rss
+
+    def report(self):
+        """印出各階段 RSS 峰值"""
+        self.finish()
+        if not self.peaks:
+            return
+        limit = f" (上限 {self.limit_mb:.0f} MB)" if self.limit_mb is not None else ""
+        print("🧠 各階段 RSS 峰值: " + " / ".join(f"{k} {v:.0f}MB" for k, v in self.peaks.items()) + limit)
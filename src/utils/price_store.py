@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+"""
+欄式價量資料庫 (Columnar Price Store)
+
+src/data_core/history/*.csv 仍是原始資料 (可被 git 追蹤、人工檢視)，
+本模組把它轉成「日期 × 股票」的 NumPy 欄式檔，每個欄位一個 .npy：
+    open / high / low / close / volume / amount (float64) + present (bool)
+
+present 記錄該股票在該日是否真的有 CSV 列，用來還原單一股票的原始列。
+
+用法：
+    from utils.price_store import open_store
+    store = open_store()                      # 自動同步有變動的 CSV
+    frames = store.load(['close', 'volume'], codes=['2330', '2317'], start='2025-01-01')
+    df_2330 = store.load_stock('2330')        # 與 pd.read_csv 相同欄位 (Date 為 index)
+    snap = store.snapshot('2026-01-27')       # 全市場單日快照 (前一列、5 日均量、漲跌幅...)
+
+同步只會重新解析 mtime/size 有變動的 CSV，其餘欄位直接從上一版搬移；
+只在檔尾追加的 CSV (每日寫入) 沿用舊欄位、只解析追加的列；
+需要解析的檔案很多時 (例如首次建立) 以多個程序並行解析。
+"""
+
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from .columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path
+    )
+except ImportError:
+    # 直接以腳本執行時 (python src/utils/price_store.py)
+    from columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path
+    )
+
+# 路徑設定
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_DIR = os.path.join(SRC_ROOT, "data_core", "history")
+STORE_DIR = os.path.join(SRC_ROOT, "cache", "price_store")
+
+STORE_VERSION = 1
+FIELDS = ['open', 'high', 'low', 'close', 'volume', 'amount']
+CSV_COLUMNS = {
+    'open': 'Open', 'high': 'High', 'low': 'Low',
+    'close': 'Close', 'volume': 'Volume', 'amount': 'Amount'
+}
+
+# 並行解析：變動檔數達到門檻才啟用程序池 (少量檔案時啟動成本反而較高)
+PARALLEL_MIN_FILES = 200
+# 程序數 (可用環境變數 PRICE_STORE_WORKERS 調整，1 表示停用)
+PARSE_WORKERS = int(os.getenv("PRICE_STORE_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+# 只在檔尾追加的檔案：往回讀取多少位元組找接縫列 (需大於一列的長度)
+APPEND_JOIN_BYTES = 1024
+
+
+# ================= 讀取介面 =================
+
+class PriceStore:
+    """
+    唯讀的欄式價量資料 (memory-map)
+
+    Attributes:
+        dates: pd.DatetimeIndex，全市場日期軸 (已排序)
+        codes: list[str]，股票代碼 (已排序)
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        index = read_index(store_dir)
+        if index is None or index.get('version') != STORE_VERSION:
+            raise FileNotFoundError(f"找不到價量資料庫: {store_dir}")
+
+        self.store_dir = store_dir
+        self.index = index
+        self.dates = pd.DatetimeIndex(pd.to_datetime(index['dates']))
+        self.codes = list(index['codes'])
+        self._col_pos = {c: i for i, c in enumerate(self.codes)}
+        self._gen_dir = generation_path(store_dir, index)
+        self._arrays = {}
+
+    def __contains__(self, code):
+        return code in self._col_pos
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def array(self, field):
+        """取得單一欄位的原始陣列 (dates × codes, memory-map)"""
+        if field not in self._arrays:
+            self._arrays[field] = load_array(os.path.join(self._gen_dir, f"{field}.npy"))
+        return self._arrays[field]
+
+    def row_slice(self, start=None, end=None):
+        """將日期區間 (含頭含尾) 轉成列切片"""
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return slice(lo, hi)
+
+    def column_positions(self, codes=None):
+        """股票代碼 → 欄位位置 (不存在的代碼略過)，回傳 (positions, codes)"""
+        if codes is None:
+            return np.arange(len(self.codes)), list(self.codes)
+        kept = [c for c in codes if c in self._col_pos]
+        return np.array([self._col_pos[c] for c in kept], dtype=np.intp), kept
+
+    def load(self, fields=('close',), codes=None, start=None, end=None, dropna_dates=True):
+        """
+        讀取多檔股票的欄位矩陣
+
+        Args:
+            fields: 欄位清單 (見 FIELDS)
+            codes: 股票代碼清單，None 表示全部
+            start, end: 日期區間 (含頭含尾)
+            dropna_dates: 去掉所選股票全部沒有資料的日期 (等同逐檔 concat 的日期聯集)
+
+        Returns:
+            dict: {field: pd.DataFrame(index=Date, columns=codes)}
+        """
+        rows = self.row_slice(start, end)
+        cols, kept = self.column_positions(codes)
+        dates = self.dates[rows]
+
+        row_keep = None
+        if dropna_dates and len(kept):
+            present = self.array('present')[rows][:, cols]
+            row_keep = present.any(axis=1)
+            dates = dates[row_keep]
+
+        result = {}
+        for field in fields:
+            block = self.array(field)[rows][:, cols]
+            if row_keep is not None:
+                block = block[row_keep]
+            df = pd.DataFrame(block, index=dates, columns=kept)
+            df.index.name = 'Date'
+            result[field] = df
+        return result
+
+    def load_block(self, fields=('close',), codes=None, start=None, end=None, dtype=np.float32):
+        """
+        讀取多個欄位到單一陣列 (一次配置，所有欄位共用同一個日期軸)
+
+        日期處理與 load(dropna_dates=True) 相同。
+
+        Returns:
+            (block, dates, codes)：block 形狀為 (欄位數, 日期數, 股票數)
+        """
+        rows = self.row_slice(start, end)
+        cols, kept = self.column_positions(codes)
+        dates = self.dates[rows]
+
+        row_idx = np.arange(rows.start, rows.stop)
+        if len(kept):
+            present = self.array('present')[rows][:, cols]
+            keep = present.any(axis=1)
+            row_idx = row_idx[keep]
+            dates = dates[keep]
+        dates = dates.copy()
+        dates.name = 'Date'
+
+        block = np.empty((len(fields), len(dates), len(kept)), dtype=dtype)
+        ix = np.ix_(row_idx, cols)
+        for i, field in enumerate(fields):
+            block[i] = self.array(field)[ix]
+        return block, dates, kept
+
+    def load_stock(self, code, start=None, end=None):
+        """
+        讀取單一股票，欄位與 history CSV 相同 (Open/High/Low/Close/Volume/Amount)，
+        index 為 Date，只保留 CSV 中實際存在的列。不存在回傳 None。
+        """
+        if code not in self._col_pos:
+            return None
+        rows = self.row_slice(start, end)
+        j = self._col_pos[code]
+        present = np.asarray(self.array('present')[rows, j])
+        data = {CSV_COLUMNS[f]: np.asarray(self.array(f)[rows, j])[present] for f in FIELDS}
+        df = pd.DataFrame(data, index=self.dates[rows][present])
+        df.index.name = 'Date'
+        return df
+
+    def snapshot(self, date, codes=None, avg_window=5, lookback=64):
+        """
+        單一交易日的全市場快照 (一次向量化切片，不逐檔讀取)
+
+        每檔依自己實際存在的列計算 (停牌日不算)：前一列為 date 之前最後一個有資料的列，
+        均量為 date 之前最近 avg_window 列的成交量平均 (不足時有幾列算幾列)。
+
+        Args:
+            date: 交易日期 (str / datetime)，任何歷史日期皆可 (回放用)
+            codes: 股票代碼清單，None 表示全部
+            avg_window: 均量列數
+            lookback: 先在最近 lookback 列內找前幾列，停牌較久的股票才擴大到整段歷史
+
+        Returns:
+            pd.DataFrame (index=code)：open / high / low / close / volume / prev_close /
+            avg_volume / change (%) / volume_ratio / close_strength；
+            當日沒有資料或沒有前一列的股票不列入
+        """
+        columns = ['open', 'high', 'low', 'close', 'volume', 'prev_close',
+                   'avg_volume', 'change', 'volume_ratio', 'close_strength']
+        date = pd.Timestamp(date)
+        t = self.dates.searchsorted(date)
+        cols, kept = self.column_positions(codes)
+        if t >= len(self.dates) or self.dates[t] != date or not len(kept):
+            return pd.DataFrame(columns=columns, index=pd.Index([], name='code'))
+
+        today = np.asarray(self.array('present')[t, cols])
+        cols = cols[today]
+        kept = [c for c, ok in zip(kept, today) if ok]
+        prev_row, avg_volume = self._prior_rows(t, cols, avg_window, lookback)
+        has_prev = prev_row >= 0
+
+        cols, prev_row, avg_volume = cols[has_prev], prev_row[has_prev], avg_volume[has_prev]
+        out = {f: np.asarray(self.array(f)[t, cols]) for f in ('open', 'high', 'low', 'close', 'volume')}
+        out['prev_close'] = np.asarray(self.array('close')[prev_row, cols])
+        out['avg_volume'] = avg_volume
+        close, high, volume, prev_close = out['close'], out['high'], out['volume'], out['prev_close']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out['change'] = np.where(prev_close > 0, (close - prev_close) / prev_close * 100, 0.0)
+            out['volume_ratio'] = np.where(avg_volume > 0, volume / avg_volume, 1.0)
+            out['close_strength'] = np.where(high > 0, close / high, 0.0)
+        index = pd.Index([c for c, ok in zip(kept, has_prev) if ok], name='code')
+        return pd.DataFrame(out, index=index, columns=columns)
+
+    def _prior_rows(self, t, cols, avg_window, lookback):
+        """
+        第 t 列之前，各股票最後一個有資料的列 (沒有則為 -1) 與最近 avg_window 列的平均成交量
+
+        先只讀最近 lookback 列；有資料的列不足 avg_window 且還沒看到開頭的股票，
+        再以整段歷史重算 (只有長期停牌或新上市的股票會走到這裡)。
+        """
+        if t == 0:
+            return np.full(len(cols), -1, dtype=np.intp), np.full(len(cols), np.nan)
+        start = max(0, t - lookback)
+        present = np.asarray(self.array('present')[start:t][:, cols])
+        volume = np.asarray(self.array('volume')[start:t][:, cols])
+
+        # 由近到遠第幾個有資料的列 (1 = 前一列)
+        order = np.cumsum(present[::-1], axis=0)[::-1]
+        n_prior = order[0]
+        last = start + len(present) - 1 - np.argmax(present[::-1], axis=0)
+        prev_row = np.where(n_prior > 0, last, -1)
+
+        use = present & (order <= avg_window) & ~np.isnan(volume)
+        count = use.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_volume = np.where(use, volume, 0.0).sum(axis=0) / count
+        avg_volume[count == 0] = np.nan
+
+        retry = (n_prior < avg_window) & (start > 0)
+        if retry.any():
+            sub_prev, sub_avg = self._prior_rows(t, cols[retry], avg_window, t)
+            prev_row[retry], avg_volume[retry] = sub_prev, sub_avg
+        return prev_row, avg_volume
+
+    def is_stale(self):
+        """索引是否已被其他程序更新 (長駐程式可據此重新開啟)"""
+        index = read_index(self.store_dir)
+        return index is None or index.get('generation') != self.index.get('generation')
+
+
+# ================= 同步 (CSV → Store) =================
+
+def _scan_history(history_dir):
+    """列出 history 資料夾的 CSV 及其 (mtime_ns, size)"""
+    files = {}
+    for entry in os.scandir(history_dir):
+        if entry.is_file() and entry.name.endswith('.csv'):
+            st = entry.stat()
+            files[entry.name[:-4]] = [st.st_mtime_ns, st.st_size]
+    return files
+
+
+def _frame_values(df):
+    """history CSV 的 DataFrame → (DatetimeIndex, {field: ndarray})；沒有資料回傳 None"""
+    if 'Date' not in df.columns or df.empty:
+        return None
+    dates = pd.to_datetime(df['Date'], errors='coerce').to_numpy()
+    # 去除無效日期、同日重複 (保留最後一筆)，再依日期排序
+    order = np.argsort(dates, kind='stable')
+    sorted_dates = dates[order]
+    is_last = np.ones(len(order), dtype=bool)
+    is_last[:-1] = sorted_dates[1:] != sorted_dates[:-1]
+    keep = order[is_last & ~np.isnat(sorted_dates)]
+
+    values = {}
+    for field in FIELDS:
+        col = CSV_COLUMNS[field]
+        if col in df.columns:
+            values[field] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)[keep]
+        else:
+            values[field] = np.full(len(keep), np.nan)
+    return pd.DatetimeIndex(dates[keep]), values
+
+
+def _read_history_csv(file_path):
+    """解析單一 history CSV，回傳 (DatetimeIndex, {field: ndarray})；失敗回傳 None"""
+    try:
+        return _frame_values(pd.read_csv(file_path))
+    except Exception:
+        return None
+
+
+def _read_appended_lines(file_path, old_size):
+    """
+    讀取 header、old_size 之前的最後一列 (接縫列) 與之後追加的列 (只讀檔尾，不讀整個 CSV)
+
+    Returns:
+        (header, 接縫列, [追加列])，皆為 bytes；old_size 不在列尾 (檔案被改寫) 時回傳 None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+            start = max(len(header), old_size - APPEND_JOIN_BYTES)
+            f.seek(start)
+            before = f.read(old_size - start)
+            tail = f.read()
+    except OSError:
+        return None
+    if not before.endswith(b"\n"):
+        return None
+    body = before[:-1].rstrip(b"\r")
+    if b"\n" in body:
+        join_line = body.rsplit(b"\n", 1)[1]
+    elif start == len(header):
+        join_line = body
+    else:
+        return None
+    lines = [line for line in tail.splitlines() if line.strip()]
+    return header.rstrip(b"\r\n"), join_line, lines
+
+
+def _parse_appended(history_dir, old_store, old_files, files, codes):
+    """
+    changed 中「只在檔尾追加」的檔案，回傳 {代碼: (DatetimeIndex, {field: ndarray})} (只含追加的列)
+
+    接縫檢查：old_size 之前的最後一列須與舊版該股最後一個有資料的列相同 (日期與各欄位)，
+    且追加列的日期都晚於它、皆可解析；不符 (檔案被改寫、重新排序或補舊資料) 的改為整檔解析。
+    所有檔案的追加列依 header 合併後一次解析 (每日只追加一列，逐檔 read_csv 反而是主要成本)。
+    """
+    grown = [c for c in codes if c in old_store and c in old_files and files[c][1] > old_files[c][1]]
+    if not grown:
+        return {}
+    cols, grown = old_store.column_positions(grown)
+    present = np.asarray(old_store.array('present'))[:, cols]
+    last_rows = len(present) - 1 - np.argmax(present[::-1], axis=0)
+    last_dates = old_store.dates.values[last_rows]
+    last_values = {f: np.asarray(old_store.array(f))[last_rows, cols] for f in FIELDS}
+    bad = ~present.any(axis=0)
+
+    # 1. 讀檔尾，依 header 分組 (每列前面加上 股票序號, 是否為接縫列)
+    groups = {}
+    for j, code in enumerate(grown):
+        raw = None if bad[j] else _read_appended_lines(os.path.join(history_dir, f"{code}.csv"),
+                                                       old_files[code][1])
+        if raw is None:
+            bad[j] = True
+            continue
+        header, join_line, lines = raw
+        prefix = f"{j},".encode()
+        buf = groups.setdefault(header, [])
+        buf.append(prefix + b"1," + join_line)
+        buf.extend(prefix + b"0," + line for line in lines)
+
+    # 2. 每組一次解析，逐欄轉型與 _frame_values 相同
+    parts = []
+    for header, buf in groups.items():
+        try:
+            df = pd.read_csv(io.BytesIO(b"_col,_join," + header + b"\n" + b"\n".join(buf)))
+        except Exception:
+            df = None
+        if df is None or 'Date' not in df.columns:
+            for line in buf:
+                bad[int(line.split(b",", 1)[0])] = True
+            continue
+        col = df['_col'].to_numpy(dtype=np.intp)
+        is_join = df['_join'].to_numpy() == 1
+        dates = pd.to_datetime(df['Date'], errors='coerce').to_numpy()
+        values = {}
+        for field in FIELDS:
+            name = CSV_COLUMNS[field]
+            if name in df.columns:
+                values[field] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+            else:
+                values[field] = np.full(len(df), np.nan)
+
+        # 接縫列與舊版最後一列相同；追加列日期可解析且晚於接縫列
+        bad[col[np.isnat(dates)]] = True
+        jc = col[is_join]
+        same = dates[is_join] == last_dates[jc]
+        for field in FIELDS:
+            v, old = values[field][is_join], last_values[field][jc]
+            same &= (v == old) | (np.isnan(v) & np.isnan(old))
+        bad[jc[~same]] = True
+        tail = ~is_join
+        bad[col[tail & ~(dates > last_dates[col])]] = True
+        has_tail = np.zeros(len(grown), dtype=bool)
+        has_tail[col[tail]] = True
+        bad[jc[~has_tail[jc]]] = True
+        parts.append((col[tail], dates[tail], {f: v[tail] for f, v in values.items()}))
+
+    # 3. 依 (股票, 日期) 排序，同日保留最後一筆，再切回各檔
+    appended = {}
+    for col, dates, values in parts:
+        keep = ~bad[col]
+        if not keep.any():
+            continue
+        col, dates = col[keep], dates[keep]
+        order = np.lexsort((dates, col))
+        col, dates = col[order], dates[order]
+        is_last = np.ones(len(col), dtype=bool)
+        is_last[:-1] = (col[1:] != col[:-1]) | (dates[1:] != dates[:-1])
+        rows = np.flatnonzero(keep)[order[is_last]]
+        col, dates = col[is_last], dates[is_last]
+        bounds = np.flatnonzero(np.r_[True, col[1:] != col[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            appended[grown[col[lo]]] = (pd.DatetimeIndex(dates[lo:hi]),
+                                        {f: v[rows[lo:hi]] for f, v in values.items()})
+    return appended
+
+
+def _parse_chunk(file_paths):
+    """程序池工作：解析一批 CSV，回傳 [(代碼, 日期 datetime64, 欄位值 (欄位數 × 列數)), ...]"""
+    out = []
+    for path in file_paths:
+        res = _read_history_csv(path)
+        if res is not None:
+            idx, values = res
+            out.append((os.path.basename(path)[:-4], idx.values, np.vstack([values[f] for f in FIELDS])))
+    return out
+
+
+def _parse_files(history_dir, codes, workers=None):
+    """
+    解析多個 CSV，回傳 {代碼: (DatetimeIndex, {field: ndarray})}
+
+    檔數達 PARALLEL_MIN_FILES 時分批交給程序池；程序池無法使用時改回單一程序。
+    """
+    paths = [os.path.join(history_dir, f"{code}.csv") for code in codes]
+    workers = PARSE_WORKERS if workers is None else workers
+    chunks = None
+    if workers > 1 and len(paths) >= PARALLEL_MIN_FILES:
+        size = max(16, len(paths) // (workers * 4))
+        batches = [paths[i:i + size] for i in range(0, len(paths), size)]
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = list(pool.map(_parse_chunk, batches))
+        except Exception as e:
+            print(f"⚠️ 並行解析失敗，改為單一程序: {e}")
+            chunks = None
+    if chunks is None:
+        chunks = [_parse_chunk(paths)]
+
+    parsed = {}
+    for chunk in chunks:
+        for code, dates, values in chunk:
+            parsed[code] = (pd.DatetimeIndex(dates), dict(zip(FIELDS, values)))
+    return parsed
+
+
+def sync_store(history_dir=HISTORY_DIR, store_dir=STORE_DIR, verbose=True, workers=None):
+    """
+    將 history CSV 同步到欄式資料庫 (只重新解析有變動的檔案)
+
+    只在檔尾追加的檔案沿用舊版欄位，只解析追加的列；其餘變動檔案整檔重新解析。
+
+    Args:
+        workers: 解析用的程序數 (預設 PARSE_WORKERS)
+
+    Returns:
+        dict: {'changed': n, 'appended': n, 'removed': n, 'total': n, 'rebuilt': bool,
+               'timings': {階段: 秒}}
+    """
+    t0 = time.time()
+    timings = {}
+    files = _scan_history(history_dir)
+    old_index = read_index(store_dir)
+    if old_index is not None and old_index.get('version') != STORE_VERSION:
+        old_index = None
+
+    old_files = old_index.get('files', {}) if old_index else {}
+    unchanged = sorted(c for c, st in files.items() if old_files.get(c) == st)
+    unchanged_set = set(unchanged)
+    changed = sorted(c for c in files if c not in unchanged_set)
+    removed = [c for c in old_files if c not in files]
+
+    stats = {'changed': len(changed), 'appended': 0, 'removed': len(removed), 'total': len(files),
+             'rebuilt': False, 'timings': timings}
+    if old_index is not None and not changed and not removed:
+        return stats
+
+    if verbose:
+        print(f"🗄️ 同步價量資料庫: 變動 {len(changed)} 檔 / 移除 {len(removed)} 檔 / 共 {len(files)} 檔")
+
+    # 1. 舊版中仍有效的欄位
+    old_store = None
+    if old_index is not None:
+        try:
+            old_store = PriceStore(store_dir)
+        except Exception:
+            old_store = None
+    to_parse = changed
+    appended = {}
+    if old_store is None:
+        # 無可沿用的舊版：未變動的也要重新解析
+        to_parse = sorted(changed + unchanged)
+        unchanged = []
+        stats['rebuilt'] = True
+    else:
+        # 只在檔尾追加的檔案：舊欄位照搬，只解析追加的列
+        t_phase = time.time()
+        appended = _parse_appended(history_dir, old_store, old_files, files, changed)
+        to_parse = [c for c in changed if c not in appended]
+        stats['appended'] = len(appended)
+        timings['append'] = time.time() - t_phase
+
+    # 2. 解析 CSV (檔案多時並行)
+    t_phase = time.time()
+    parsed = _parse_files(history_dir, to_parse, workers=workers)
+    timings['parse'] = time.time() - t_phase
+
+    # 3. 建立新的日期軸 (舊欄位實際有資料的日期 ∪ 新解析的日期)
+    t_phase = time.time()
+    old_cols = np.array([], dtype=np.intp)
+    reused = []
+    if old_store is not None:
+        old_cols, reused = old_store.column_positions(sorted(unchanged + list(appended)))
+    date_parts = []
+    if old_store is not None and len(old_cols):
+        old_present = np.asarray(old_store.array('present'))[:, old_cols]
+        date_parts.append(old_store.dates[old_present.any(axis=1)])
+    for idx, _ in list(parsed.values()) + list(appended.values()):
+        date_parts.append(idx)
+    if date_parts:
+        dates = pd.DatetimeIndex(np.unique(np.concatenate([d.values for d in date_parts])))
+    else:
+        dates = pd.DatetimeIndex([])
+
+    codes = sorted(set(reused) | set(parsed))
+    col_pos = {c: i for i, c in enumerate(codes)}
+    shape = (len(dates), len(codes))
+
+    # 4. 填入資料 (所有欄位一次配置，每個欄位是其中一個連續的切片)
+    block = np.full((len(FIELDS),) + shape, np.nan, dtype=np.float64)
+    arrays = {f: block[i] for i, f in enumerate(FIELDS)}
+    present = np.zeros(shape, dtype=bool)
+
+    if old_store is not None and len(old_cols):
+        row_map = dates.get_indexer(old_store.dates)
+        valid_rows = np.where(row_map >= 0)[0]
+        new_rows = row_map[valid_rows]
+        new_cols = np.array([col_pos[c] for c in reused], dtype=np.intp)
+        ix_new = np.ix_(new_rows, new_cols)
+        ix_old = np.ix_(valid_rows, old_cols)
+        for f in FIELDS:
+            arrays[f][ix_new] = np.asarray(old_store.array(f))[ix_old]
+        present[ix_new] = np.asarray(old_store.array('present'))[ix_old]
+
+    # 整檔解析的填入新欄；追加的列接在沿用的舊欄位之後
+    for code, (idx, values) in list(parsed.items()) + list(appended.items()):
+        j = col_pos[code]
+        rows = dates.get_indexer(idx)
+        for f in FIELDS:
+            arrays[f][rows, j] = values[f]
+        present[rows, j] = True
+    timings['align'] = time.time() - t_phase
+
+    # 5. 寫入新版本
+    t_phase = time.time()
+    gen_name, gen_dir = new_generation(store_dir)
+    for f in FIELDS:
+        save_array(os.path.join(gen_dir, f"{f}.npy"), arrays[f])
+    save_array(os.path.join(gen_dir, "present.npy"), present)
+
+    kept_files = {c: files[c] for c in codes}
+    commit_generation(store_dir, gen_name, {
+        'version': STORE_VERSION,
+        'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'dates': [d.strftime('%Y-%m-%d') for d in dates],
+        'codes': codes,
+        'files': kept_files,
+    })
+    timings['write'] = time.time() - t_phase
+
+    if verbose:
+        phases = " / ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+        print(f"   ✅ 資料庫已更新: {shape[0]} 日 × {shape[1]} 檔 ({time.time() - t0:.1f}s：{phases})")
+    return stats
+
+
+def open_store(sync=True, history_dir=HISTORY_DIR, store_dir=STORE_DIR, verbose=True):
+    """
+    開啟價量資料庫 (預設先同步有變動的 CSV)
+
+    Returns:
+        PriceStore | None: 失敗回傳 None (呼叫端可改回讀 CSV)
+    """
+    try:
+        if sync and os.path.exists(history_dir):
+            sync_store(history_dir, store_dir, verbose=verbose)
+        return PriceStore(store_dir)
+    except Exception as e:
+        if verbose:
+            print(f"⚠️ 價量資料庫開啟失敗: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    import sys
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    t0 = time.time()
+    sync_store(verbose=True)
+    t1 = time.time()
+    store = PriceStore()
+    frames = store.load(FIELDS)
+    t2 = time.time()
+    print(f"同步: {t1 - t0:.2f}s | 全市場 OHLCV 讀取: {t2 - t1:.3f}s "
+          f"({len(store.dates)} 日 × {len(store.codes)} 檔)")
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+全市場篩選條件 (宣告式運算式)
+
+把篩選條件寫成一行運算式，編譯後以 NumPy 對整個「日期 × 股票」矩陣一次計算：
+
+    close > ma50 > ma150 > ma200 and turnover20 > 5e7
+
+- 名稱：矩陣快取的 key (close / ma50 / vol_ma20 ...) 或 MACROS 中的別名
+- 運算：+ - * /、比較 (可串接，a > b > c 等同 a > b and b > c)、and / or / not
+- 函式 (n 為整數常數)：
+    sma(x, n)      n 日簡單平均 (需 n 筆有效值，與 pandas rolling(n).mean() 相同)
+    highest(x, n)  n 日最高 / lowest(x, n) n 日最低
+    slope(x, n)    n 日線性回歸斜率
+    shift(x, n)    n 日前的值
+    abs(x)
+- NaN 參與的比較一律為 False
+
+只讀取需要的列：最後一天只會切出「回看長度 + 1」列，歷史區間則一次算完整段，
+適合對數百個交易日重播同一個篩選。
+
+用法：
+    from utils.screen_dsl import Screen
+    screen = Screen("close > ma50 > ma150 > ma200 and turnover20 > 5e7")
+    screen.last(data)                                # 最後一天：bool Series (index=股票)
+    screen.select(data)                              # 最後一天通過的股票代碼 list
+    screen.evaluate(data, "2025-01-01", "2025-12-31")  # 區間：bool DataFrame (日期 × 股票)
+"""
+
+import ast
+import operator
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .indicators import rolling_tail, rolling_slope
+except ImportError:
+    from indicators import rolling_tail, rolling_slope
+
+# 常用別名 (可在 Screen(..., macros=...) 覆寫或擴充)
+MACROS = {
+    'turnover20': 'close * vol_ma20',     # 20 日均量成交額
+    'turnover5': 'close * vol_ma5',
+}
+
+_BIN_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub,
+    ast.Mult: operator.mul, ast.Div: operator.truediv,
+}
+_CMP_OPS = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Lt: np.less, ast.LtE: np.less_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+
+
+def _as_bool(x):
+    """數值視為真假：非 0 且非 NaN"""
+    x = np.asarray(x)
+    if x.dtype == bool:
+        return x
+    return (x != 0) & ~np.isnan(x)
+
+
+def _pad_front(seg, rows):
+    """不足 rows 列時前面補 NaN (回看超出資料起點)"""
+    if seg.shape[0] >= rows:
+        return seg
+    pad = np.full((rows - seg.shape[0],) + seg.shape[1:], np.nan)
+    return np.concatenate([pad, seg.astype(np.float64)])
+
+
+# ============================================================
+# 🔧 運算節點
+# ============================================================
+
+class _Node:
+    lookback = 0    # 計算 [lo, hi) 需要往前多讀的列數
+
+    def eval(self, env, lo, hi):
+        raise NotImplementedError
+
+
+class _Const(_Node):
+    def __init__(self, value):
+        self.value = value
+
+    def eval(self, env, lo, hi):
+        return self.value
+
+
+class _Name(_Node):
+    def __init__(self, name):
+        self.name = name
+
+    def eval(self, env, lo, hi):
+        return env.rows(self.name, lo, hi)
+
+
+class _BinOp(_Node):
+    def __init__(self, op, left, right):
+        self.op, self.left, self.right = op, left, right
+        self.lookback = max(left.lookback, right.lookback)
+
+    def eval(self, env, lo, hi):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.op(self.left.eval(env, lo, hi), self.right.eval(env, lo, hi))
+
+
+class _Neg(_Node):
+    def __init__(self, operand):
+        self.operand = operand
+        self.lookback = operand.lookback
+
+    def eval(self, env, lo, hi):
+        return -self.operand.eval(env, lo, hi)
+
+
+class _Not(_Node):
+    def __init__(self, operand):
+        self.operand = operand
+        self.lookback = operand.lookback
+
+    def eval(self, env, lo, hi):
+        return ~_as_bool(self.operand.eval(env, lo, hi))
+
+
+class _BoolOp(_Node):
+    def __init__(self, func, values):
+        self.func, self.values = func, values
+        self.lookback = max(v.lookback for v in values)
+
+    def eval(self, env, lo, hi):
+        result = _as_bool(self.values[0].eval(env, lo, hi))
+        for node in self.values[1:]:
+            result = self.func(result, _as_bool(node.eval(env, lo, hi)))
+        return result
+
+
+class _Compare(_Node):
+    """串接比較：a > b > c 等同 (a > b) and (b > c)，每個運算元只算一次"""
+
+    def __init__(self, ops, operands):
+        self.ops, self.operands = ops, operands
+        self.lookback = max(v.lookback for v in operands)
+
+    def eval(self, env, lo, hi):
+        values = [node.eval(env, lo, hi) for node in self.operands]
+        result = None
+        with np.errstate(invalid='ignore'):
+            for op, a, b in zip(self.ops, values[:-1], values[1:]):
+                part = op(a, b)
+                result = part if result is None else result & part
+        return result
+
+
+class _Window(_Node):
+    """滾動視窗函式：先算子運算式的 [lo - n + 1, hi)，再取最後 hi - lo 列"""
+
+    def __init__(self, func, operand, n):
+        self.func, self.operand, self.n = func, operand, n
+        self.lookback = operand.lookback + n - 1
+
+    def eval(self, env, lo, hi):
+        start = max(0, lo - self.n + 1)
+        seg = np.asarray(self.operand.eval(env, start, hi), dtype=np.float64)
+        seg = np.broadcast_to(seg, (hi - start, env.n_cols)) if seg.ndim < 2 else seg
+        seg = _pad_front(seg, hi - lo + self.n - 1)
+        last_n = hi - lo
+        if self.func == 'slope':
+            return rolling_slope(seg, self.n, last_n=last_n)
+        how = {'sma': 'mean', 'highest': 'max', 'lowest': 'min'}[self.func]
+        if last_n * self.n <= _TAIL_CELLS:
+            # 只算最後幾列：直接展開視窗 (一次處理所有股票)
+            return rolling_tail(seg, self.n, how=how, last_n=last_n)
+        # 區間很長 (歷史重播)：pandas rolling 為 O(列數)，不必展開每個視窗
+        rolling = pd.DataFrame(seg).rolling(self.n)
+        return getattr(rolling, how)().values[-last_n:]
+
+
+class _Shift(_Node):
+    def __init__(self, operand, n):
+        self.operand, self.n = operand, n
+        self.lookback = operand.lookback + n
+
+    def eval(self, env, lo, hi):
+        start, end = lo - self.n, hi - self.n
+        if end <= 0:
+            return np.full((hi - lo, env.n_cols), np.nan)
+        seg = np.asarray(self.operand.eval(env, max(0, start), end), dtype=np.float64)
+        return _pad_front(seg, hi - lo)
+
+
+class _Abs(_Node):
+    def __init__(self, operand):
+        self.operand = operand
+        self.lookback = operand.lookback
+
+    def eval(self, env, lo, hi):
+        return np.abs(self.operand.eval(env, lo, hi))
+
+
+_WINDOW_FUNCS = ('sma', 'highest', 'lowest', 'slope')
+
+# 視窗展開的上限 (輸出列數 × 視窗長度)，超過改用 pandas rolling
+_TAIL_CELLS = 2048
+
+
+# ============================================================
+# 🛠️ 編譯
+# ============================================================
+
+class _Compiler:
+    def __init__(self, macros):
+        self.macros = macros
+        self.names = set()
+        self._expanding = []
+
+    def compile(self, expr):
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"篩選條件語法錯誤: {expr!r} ({e.msg})") from None
+        return self.visit(tree.body)
+
+    def visit(self, node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+            return _Const(node.value)
+        if isinstance(node, ast.Name):
+            return self._name(node.id)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            return _BinOp(_BIN_OPS[type(node.op)], self.visit(node.left), self.visit(node.right))
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            func = np.logical_and if isinstance(node.op, ast.BitAnd) else np.logical_or
+            return _BoolOp(func, [self.visit(node.left), self.visit(node.right)])
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return _Neg(self.visit(node.operand))
+            if isinstance(node.op, ast.UAdd):
+                return self.visit(node.operand)
+            if isinstance(node.op, (ast.Not, ast.Invert)):
+                return _Not(self.visit(node.operand))
+        if isinstance(node, ast.BoolOp):
+            func = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return _BoolOp(func, [self.visit(v) for v in node.values])
+        if isinstance(node, ast.Compare) and all(type(op) in _CMP_OPS for op in node.ops):
+            operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+            return _Compare([_CMP_OPS[type(op)] for op in node.ops], operands)
+        if isinstance(node, ast.Call):
+            return self._call(node)
+        raise ValueError(f"篩選條件不支援的語法: {ast.unparse(node)}")
+
+    def _name(self, name):
+        if name in self.macros:
+            if name in self._expanding:
+                raise ValueError(f"別名循環定義: {' -> '.join(self._expanding + [name])}")
+            self._expanding.append(name)
+            try:
+                return self.compile(self.macros[name])
+            finally:
+                self._expanding.pop()
+        self.names.add(name)
+        return _Name(name)
+
+    def _call(self, node):
+        func = node.func.id if isinstance(node.func, ast.Name) else None
+        if node.keywords:
+            raise ValueError(f"函式不支援關鍵字參數: {ast.unparse(node)}")
+        if func == 'abs' and len(node.args) == 1:
+            return _Abs(self.visit(node.args[0]))
+        if func in _WINDOW_FUNCS + ('shift',) and len(node.args) == 2:
+            n = node.args[1]
+            if not (isinstance(n, ast.Constant) and isinstance(n.value, int) and n.value >= 1):
+                raise ValueError(f"{func}() 的視窗需為正整數常數: {ast.unparse(node)}")
+            operand = self.visit(node.args[0])
+            if func == 'shift':
+                return _Shift(operand, n.value)
+            return _Window(func, operand, n.value)
+        raise ValueError(f"篩選條件不支援的函式: {ast.unparse(node)}")
+
+
+class _Env:
+    """運算時的資料來源：名稱 -> 日期 × 股票矩陣 (只切需要的列)"""
+
+    def __init__(self, data, names):
+        self.data = data
+        self._values = {}
+        base = None
+        for name in sorted(names):
+            if name not in data:
+                raise KeyError(f"資料中沒有 {name!r}")
+            df = data[name]
+            if df is None:
+                raise KeyError(f"資料中的 {name!r} 為空 (None)")
+            if base is None:
+                base = df
+            elif not (df.index.equals(base.index) and df.columns.equals(base.columns)):
+                df = df.reindex(index=base.index, columns=base.columns)
+            self._values[name] = df.values
+        if base is None:
+            base = data['close']
+        self.index = base.index
+        self.columns = base.columns
+        self.n_cols = len(base.columns)
+
+    def rows(self, name, lo, hi):
+        return self._values[name][lo:hi]
+
+
+class Screen:
+    """
+    編譯後的篩選條件
+
+    Args:
+        expr: 運算式字串
+        macros: 額外 / 覆寫的別名 {名稱: 運算式}
+
+    Attributes:
+        names: 用到的資料名稱 (別名展開後)
+        lookback: 計算一天需要往前讀的列數
+    """
+
+    def __init__(self, expr, macros=None):
+        self.expr = expr
+        compiler = _Compiler({**MACROS, **(macros or {})})
+        self._root = compiler.compile(expr)
+        self.names = sorted(compiler.names)
+        self.lookback = self._root.lookback
+
+    def __repr__(self):
+        return f"Screen({self.expr!r})"
+
+    def _run(self, data, lo, hi):
+        env = _Env(data, self.names)
+        out = _as_bool(self._root.eval(env, lo, hi))
+        return np.broadcast_to(out, (hi - lo, env.n_cols)), env
+
+    def evaluate(self, data, start=None, end=None):
+        """
+        區間內每一天的篩選結果
+
+        Args:
+            data: MarketMatrix 或 {名稱: DataFrame} (共用日期 / 股票軸)
+            start / end: 日期 (含)；省略時為資料頭 / 尾
+
+        Returns:
+            bool DataFrame (日期 × 股票)
+        """
+        index = data['close'].index if 'close' in data else data[self.names[0]].index
+        lo = 0 if start is None else index.searchsorted(pd.Timestamp(start))
+        hi = len(index) if end is None else index.searchsorted(pd.Timestamp(end), side='right')
+        if hi <= lo:
+            return pd.DataFrame(np.zeros((0, len(data[self.names[0]].columns)), dtype=bool),
+                                columns=data[self.names[0]].columns)
+        out, env = self._run(data, lo, hi)
+        return pd.DataFrame(out, index=env.index[lo:hi], columns=env.columns)
+
+    def last(self, data, row=-1):
+        """單一天 (預設最後一天) 的篩選結果：bool Series (index=股票)"""
+        n_rows = len(data['close'].index if 'close' in data else data[self.names[0]].index)
+        pos = row % n_rows
+        out, env = self._run(data, pos, pos + 1)
+        return pd.Series(out[0], index=env.columns, name=env.index[pos])
+
+    def select(self, data, row=-1):
+        """單一天通過的股票代碼 list"""
+        mask = self.last(data, row)
+        return mask.index[mask.values].tolist()
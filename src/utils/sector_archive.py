@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+CMoney 族群資金動能歷史庫 (Sector Momentum Archive)
+
+src/data_core/market_meta/sector_momentum_YYYYMMDD.csv 仍是爬蟲的原始輸出，
+本模組把所有日期併成一張「依日期分段」的欄式表，每個欄位一個 .npy：
+    sector (int32，對應 index.json 的 sectors) + FundFlow / PriceChange / ... (float64)
+    day_ptr (int64)：第 i 個日期的列為 [day_ptr[i], day_ptr[i+1])
+
+每日的列順序與 CSV 相同 (重複的族群也保留)，index.json 另記錄每日 CSV 實際有哪些欄位，
+load_day() 可還原成與 pd.read_csv 相同的欄位；日期區間查詢只需切一段連續的列。
+
+用法：
+    from utils.sector_archive import open_archive
+    archive = open_archive()                              # 自動同步有變動的 CSV
+    df = archive.load_day('2026-04-10')                   # 單日 (同 CSV 欄位)
+    df = archive.load(start='2026-03-01', fields=['FundFlow', 'PriceChange'])
+    flow = archive.panel('FundFlow', start='2026-03-01')  # 日期 × 族群
+
+同步只會重新解析 mtime/size 有變動的 CSV，其餘日期直接從上一版搬移。
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    from .columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path
+    )
+except ImportError:
+    from columnar_io import (
+        load_array, save_array, read_index, new_generation,
+        commit_generation, generation_path
+    )
+
+# 路徑設定
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKET_META_DIR = os.path.join(SRC_ROOT, "data_core", "market_meta")
+ARCHIVE_DIR = os.path.join(SRC_ROOT, "cache", "sector_archive")
+
+ARCHIVE_VERSION = 1
+FILE_PREFIX = "sector_momentum_"
+KEY_COLUMNS = ['Date', 'SectorName']
+# 爬蟲輸出的數值欄位 (其他新增的欄位會依出現順序排在後面)
+FIELDS = [
+    'PriceChange', 'TurnoverChange', 'FundFlow',
+    'MarginBalance', 'MarginChange', 'ShortBalance', 'ShortChange', 'ShortMarginRatio',
+    'inst_total_amount', 'foreign_amount', 'trust_amount', 'dealer_amount',
+]
+
+
+# ================= 讀取介面 =================
+
+class SectorArchive:
+    """
+    唯讀的族群資金動能歷史表 (memory-map)
+
+    Attributes:
+        dates: pd.DatetimeIndex，有 CSV 的日期 (已排序；空白 CSV 的日期也在內，當日沒有列)
+        sectors: list[str]，出現過的族群名稱
+        fields: list[str]，數值欄位
+    """
+
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        index = read_index(archive_dir)
+        if index is None or index.get('version') != ARCHIVE_VERSION:
+            raise FileNotFoundError(f"找不到族群資金動能歷史庫: {archive_dir}")
+
+        self.archive_dir = archive_dir
+        self.index = index
+        self.dates = pd.DatetimeIndex(pd.to_datetime(index['dates']))
+        self.sectors = list(index['sectors'])
+        self.fields = list(index['fields'])
+        self._columns = index['columns']
+        self._gen_dir = generation_path(archive_dir, index)
+        self._arrays = {}
+
+    def __contains__(self, date):
+        return pd.Timestamp(date) in self.dates
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def array(self, name):
+        """取得單一欄位的原始陣列 (sector / day_ptr / 數值欄位，memory-map)"""
+        if name not in self._arrays:
+            self._arrays[name] = load_array(os.path.join(self._gen_dir, f"{name}.npy"))
+        return self._arrays[name]
+
+    def row_slice(self, start=None, end=None):
+        """將日期區間 (含頭含尾) 轉成列切片，回傳 (列切片, 日期切片)"""
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        ptr = self.array('day_ptr')
+        return slice(int(ptr[lo]), int(ptr[hi])), slice(lo, hi)
+
+    def columns_on(self, date):
+        """該日 CSV 的數值欄位 (沒有該日回傳 None)"""
+        return self._columns.get(pd.Timestamp(date).strftime('%Y-%m-%d'))
+
+    def load_day(self, date):
+        """
+        讀取單日，欄位與 sector_momentum CSV 相同 (Date 為字串)；沒有該日回傳 None
+        """
+        date = pd.Timestamp(date)
+        columns = self.columns_on(date)
+        if columns is None:
+            return None
+        rows, _ = self.row_slice(date, date)
+        if rows.start == rows.stop and not columns:
+            return pd.DataFrame()
+        names = np.asarray(self.sectors, dtype=object)
+        data = {
+            'Date': date.strftime('%Y-%m-%d'),
+            'SectorName': names[np.asarray(self.array('sector')[rows])],
+        }
+        for field in columns:
+            data[field] = np.array(self.array(field)[rows])
+        return pd.DataFrame(data, columns=KEY_COLUMNS + columns)
+
+    def load(self, start=None, end=None, fields=None, sectors=None):
+        """
+        讀取日期區間 (長表格式，一列為一個族群的一日)
+
+        Args:
+            start, end: 日期區間 (含頭含尾)
+            fields: 數值欄位清單，None 表示全部
+            sectors: 族群名稱清單，None 表示全部
+
+        Returns:
+            pd.DataFrame: Date (Timestamp) / SectorName / 各欄位；該日 CSV 沒有的欄位為 NaN
+        """
+        fields = self.fields if fields is None else [f for f in fields if f in self.fields]
+        rows, days = self.row_slice(start, end)
+        ptr = np.asarray(self.array('day_ptr')[days.start:days.stop + 1])
+        day = np.repeat(np.arange(days.start, days.stop), np.diff(ptr))
+        sector = np.asarray(self.array('sector')[rows])
+
+        keep = None
+        if sectors is not None:
+            wanted = np.zeros(len(self.sectors), dtype=bool)
+            pos = {s: i for i, s in enumerate(self.sectors)}
+            wanted[[pos[s] for s in sectors if s in pos]] = True
+            keep = wanted[sector]
+            day, sector = day[keep], sector[keep]
+
+        data = {
+            'Date': self.dates[day],
+            'SectorName': np.asarray(self.sectors, dtype=object)[sector],
+        }
+        for field in fields:
+            values = np.asarray(self.array(field)[rows])
+            data[field] = values[keep] if keep is not None else values.copy()
+        return pd.DataFrame(data, columns=KEY_COLUMNS + fields)
+
+    def panel(self, field, start=None, end=None, sectors=None):
+        """
+        單一欄位的「日期 × 族群」矩陣 (跨日趨勢特徵用)
+
+        同一日重複的族群取 CSV 中最後一列；當日沒有的族群為 NaN。
+
+        Returns:
+            pd.DataFrame (index=Date, columns=族群名稱)
+        """
+        rows, days = self.row_slice(start, end)
+        ptr = np.asarray(self.array('day_ptr')[days.start:days.stop + 1])
+        day = np.repeat(np.arange(days.stop - days.start), np.diff(ptr))
+        sector = np.asarray(self.array('sector')[rows])
+        values = np.asarray(self.array(field)[rows])
+
+        if sectors is None:
+            cols = np.unique(sector)
+        else:
+            pos = {s: i for i, s in enumerate(self.sectors)}
+            cols = np.array([pos[s] for s in sectors if s in pos], dtype=np.intp)
+        col_pos = np.full(len(self.sectors), -1, dtype=np.intp)
+        col_pos[cols] = np.arange(len(cols))
+
+        # 由後往前取第一次出現 = 每個 (日期, 族群) 的最後一列
+        j = col_pos[sector]
+        ok = np.where(j >= 0)[0][::-1]
+        key = day[ok] * len(cols) + j[ok]
+        _, first = np.unique(key, return_index=True)
+        last = ok[first]
+
+        mat = np.full((days.stop - days.start, len(cols)), np.nan)
+        mat[day[last], j[last]] = values[last]
+        df = pd.DataFrame(mat, index=self.dates[days], columns=[self.sectors[c] for c in cols])
+        df.index.name = 'Date'
+        return df
+
+    def is_stale(self):
+        """索引是否已被其他程序更新 (長駐程式可據此重新開啟)"""
+        index = read_index(self.archive_dir)
+        return index is None or index.get('generation') != self.index.get('generation')
+
+
+# ================= 同步 (CSV → Archive) =================
+
+def _scan_meta(meta_dir):
+    """列出 sector_momentum CSV，回傳 {YYYY-MM-DD: [mtime_ns, size]}"""
+    files = {}
+    for entry in os.scandir(meta_dir):
+        name = entry.name
+        key = name[len(FILE_PREFIX):-4]
+        if entry.is_file() and name.startswith(FILE_PREFIX) and name.endswith('.csv') \
+                and len(key) == 8 and key.isdigit():
+            st = entry.stat()
+            files[f"{key[:4]}-{key[4:6]}-{key[6:]}"] = [st.st_mtime_ns, st.st_size]
+    return files
+
+
+def csv_path(date, meta_dir=MARKET_META_DIR):
+    """日期對應的 sector_momentum CSV 路徑"""
+    return os.path.join(meta_dir, f"{FILE_PREFIX}{pd.Timestamp(date).strftime('%Y%m%d')}.csv")
+
+
+def _to_number(col):
+    """數值欄位轉 float (爬蟲原樣寫入的字串可能帶千分位或 %)"""
+    if col.dtype == object or pd.api.types.is_string_dtype(col):
+        col = col.astype(str).str.replace(',', '', regex=False).str.replace('%', '', regex=False)
+    return pd.to_numeric(col, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _read_momentum_csv(file_path):
+    """解析單日 CSV，回傳 (族群名稱 list, {欄位: ndarray})；空白檔回傳 ([], {})"""
+    try:
+        df = pd.read_csv(file_path, encoding='utf-8-sig')
+    except pd.errors.EmptyDataError:
+        return [], {}
+    if 'SectorName' not in df.columns:
+        return [], {}
+    names = df['SectorName'].astype(str).tolist()
+    values = {c: _to_number(df[c]) for c in df.columns if c not in KEY_COLUMNS}
+    return names, values
+
+
+def sync_archive(meta_dir=MARKET_META_DIR, archive_dir=ARCHIVE_DIR, verbose=True):
+    """
+    將 sector_momentum CSV 同步到歷史庫 (只重新解析有變動的檔案)
+
+    Returns:
+        dict: {'changed': n, 'removed': n, 'total': n, 'rebuilt': bool}
+    """
+    t0 = time.time()
+    files = _scan_meta(meta_dir)
+    old_index = read_index(archive_dir)
+    if old_index is not None and old_index.get('version') != ARCHIVE_VERSION:
+        old_index = None
+
+    old_files = old_index.get('files', {}) if old_index else {}
+    changed = sorted(d for d, st in files.items() if old_files.get(d) != st)
+    removed = [d for d in old_files if d not in files]
+
+    stats = {'changed': len(changed), 'removed': len(removed), 'total': len(files), 'rebuilt': False}
+    if old_index is not None and not changed and not removed:
+        return stats
+
+    if verbose:
+        print(f"🗄️ 同步族群資金動能歷史庫: 變動 {len(changed)} 日 / 移除 {len(removed)} 日 / 共 {len(files)} 日")
+
+    # 1. 未變動的日期沿用舊版
+    old_archive = None
+    if old_index is not None:
+        try:
+            old_archive = SectorArchive(archive_dir)
+        except Exception:
+            old_archive = None
+    if old_archive is None:
+        changed = sorted(files)
+        stats['rebuilt'] = True
+
+    days = {}
+    changed_set = set(changed)
+    for date in files:
+        if date in changed_set:
+            days[date] = _read_momentum_csv(csv_path(date, meta_dir))
+        else:
+            df = old_archive.load_day(date)
+            columns = old_archive.columns_on(date)
+            days[date] = (df['SectorName'].tolist() if columns else [],
+                          {c: df[c].to_numpy() for c in columns})
+
+    # 2. 組成欄式表 (依日期排序，每日維持 CSV 的列順序)
+    dates = sorted(days)
+    fields = list(FIELDS)
+    for date in dates:
+        fields += [c for c in days[date][1] if c not in fields]
+    fields = [f for f in fields if any(f in days[d][1] for d in dates)]
+
+    sectors = sorted({name for d in dates for name in days[d][0]})
+    sector_pos = {s: i for i, s in enumerate(sectors)}
+    counts = [len(days[d][0]) for d in dates]
+    day_ptr = np.zeros(len(dates) + 1, dtype=np.int64)
+    day_ptr[1:] = np.cumsum(counts)
+    n_rows = int(day_ptr[-1])
+
+    sector = np.fromiter((sector_pos[name] for d in dates for name in days[d][0]), dtype=np.int32, count=n_rows)
+    block = np.full((len(fields), n_rows), np.nan, dtype=np.float64)
+    for i, date in enumerate(dates):
+        lo, hi = day_ptr[i], day_ptr[i + 1]
+        for k, field in enumerate(fields):
+            if field in days[date][1]:
+                block[k, lo:hi] = days[date][1][field]
+
+    # 3. 寫入新版本
+    gen_name, gen_dir = new_generation(archive_dir)
+    save_array(os.path.join(gen_dir, "day_ptr.npy"), day_ptr)
+    save_array(os.path.join(gen_dir, "sector.npy"), sector)
+    for k, field in enumerate(fields):
+        save_array(os.path.join(gen_dir, f"{field}.npy"), block[k])
+
+    commit_generation(archive_dir, gen_name, {
+        'version': ARCHIVE_VERSION,
+        'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'dates': dates,
+        'sectors': sectors,
+        'fields': fields,
+        'columns': {d: list(days[d][1]) for d in dates},
+        'files': files,
+    })
+
+    if verbose:
+        print(f"   ✅ 歷史庫已更新: {len(dates)} 日 × {len(sectors)} 族群 / {n_rows} 列 ({time.time() - t0:.2f}s)")
+    return stats
+
+
+def open_archive(sync=True, meta_dir=MARKET_META_DIR, archive_dir=ARCHIVE_DIR, verbose=True):
+    """
+    開啟族群資金動能歷史庫 (預設先同步有變動的 CSV)
+
+    Returns:
+        SectorArchive | None: 失敗回傳 None
+    """
+    try:
+        if sync and os.path.exists(meta_dir):
+            sync_archive(meta_dir, archive_dir, verbose=verbose)
+        return SectorArchive(archive_dir)
+    except Exception as e:
+        if verbose:
+            print(f"⚠️ 族群資金動能歷史庫開啟失敗: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    import sys
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    t0 = time.time()
+    sync_archive(verbose=True)
+    t1 = time.time()
+    archive = SectorArchive()
+    df = archive.load()
+    t2 = time.time()
+    print(f"同步: {t1 - t0:.2f}s | 全部讀取: {t2 - t1:.3f}s "
+          f"({len(archive.dates)} 日 × {len(archive.sectors)} 族群, {len(df)} 列)")
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+本地交易日曆 (取代每次啟動都呼叫 FinMind 交易日 API)
+
+交易日來源：
+1. data_core/TAIEX.csv 的日期 (大盤有收盤資料的日子就是交易日)
+2. 超出 TAIEX 範圍的日期 (今天、下週...) 由 trading_day_utils 查詢 API 後回填
+
+日曆保存在 cache/trading_calendar.json；TAIEX.csv 大小改變時才重新讀取日期欄並合併。
+查詢為 O(1) (set)，前後交易日以 bisect 搜尋。
+
+用法：
+    from utils.trading_calendar import get_calendar
+    cal = get_calendar()
+    cal.lookup("2026-04-13")              # True / False / None (超出已知範圍)
+    cal.previous_trading_day("2026-04-13")
+    cal.next_trading_day("2026-04-10")
+"""
+
+import os
+import json
+import bisect
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# 路徑設定
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAIEX_FILE = os.path.join(SRC_ROOT, "data_core", "TAIEX.csv")
+CALENDAR_FILE = os.path.join(SRC_ROOT, "cache", "trading_calendar.json")
+
+
+def _to_str(date):
+    """datetime / Timestamp / 字串 -> 'YYYY-MM-DD'"""
+    if isinstance(date, str):
+        return date[:10]
+    return date.strftime('%Y-%m-%d')
+
+
+def _shift(date_str, days):
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class TradingCalendar:
+    """
+    交易日曆
+
+    - known_until：此日期 (含) 之前的平日都已確認 (不在日曆中即為假日)
+    - 超出 known_until 的日期 lookup() 回傳 None，由呼叫端查詢 API 後以 record() 回填
+    """
+
+    def __init__(self, taiex_file=TAIEX_FILE, cache_file=CALENDAR_FILE):
+        self.taiex_file = taiex_file
+        self.cache_file = cache_file
+        self._dates = set()
+        self._sorted = []
+        self._first = None
+        self.known_until = None
+        self._session_ranges = []    # 本次執行中查過 API 的範圍 (未來日期不寫入檔案)
+        self._session_dates = set()  # 本次執行中 API 回報的今天 / 未來交易日 (不寫入檔案)
+        self._source = None
+        self._dirty = False
+        self._load()
+        self.refresh()
+
+    # ---- 持久化 ----
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.known_until = data.get('known_until')
+        self._source = data.get('source')
+        # 舊版曾把 API 回報的今天 / 未來日期寫入檔案：一律捨棄，並重新讀取 TAIEX.csv
+        # (今天若已有大盤收盤資料會再合併回來)
+        today = datetime.now().strftime('%Y-%m-%d')
+        dates = data.get('dates', [])
+        kept = [d for d in dates if d < today]
+        if len(kept) != len(dates):
+            self._source = None
+            self._dirty = True
+        self._set_dates(kept)
+
+    def save(self):
+        """有變動時原子寫回日曆檔"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'known_until': self.known_until,
+                'source': self._source,
+                'dates': self._sorted,
+            }, f)
+        os.replace(tmp_path, self.cache_file)
+        self._dirty = False
+
+    def _set_dates(self, dates):
+        self._dates = set(dates)
+        self._sorted = sorted(self._dates)
+        self._first = self._sorted[0] if self._sorted else None
+
+    def _merge(self, dates):
+        new = set(dates) - self._dates
+        if new:
+            self._set_dates(self._dates | new)
+            self._dirty = True
+        return len(new)
+
+    # ---- 更新 ----
+    def refresh(self):
+        """
+        TAIEX.csv 有變動 (大小不同) 時讀取日期欄並合併，回傳新增的交易日數
+        """
+        try:
+            st = os.stat(self.taiex_file)
+        except OSError:
+            return 0
+        source = {'size': st.st_size}
+        if source == self._source:
+            return 0
+
+        dates = pd.read_csv(self.taiex_file, usecols=['Date'], dtype=str)['Date'].str[:10].dropna()
+        added = self._merge(dates)
+        if len(dates):
+            last = dates.max()
+            if self.known_until is None or last > self.known_until:
+                self.known_until = last
+        self._source = source
+        self._dirty = True
+        self.save()
+        return added
+
+    def record(self, dates, start, end):
+        """
+        回填 API 查詢結果：start ~ end 之間的交易日為 dates
+
+        今天以前的結果寫入日曆檔；今天及未來的只在本次執行中有效
+        (避免資料尚未產出時把今天誤記為假日)。
+        """
+        start, end = _to_str(start), _to_str(end)
+        today = datetime.now().strftime('%Y-%m-%d')
+        dates = [d for d in dates if start <= d <= end]
+        self._merge(d for d in dates if d < today)
+        self._session_dates.update(d for d in dates if d >= today)
+
+        final_end = min(end, _shift(today, -1))
+        if self.covers(_shift(start, -1)) and final_end >= start:
+            if self.known_until is None or final_end > self.known_until:
+                self.known_until = final_end
+                self._dirty = True
+        self._session_ranges.append((start, end))
+        self.save()
+
+    # ---- 查詢 ----
+    def covers(self, date):
+        """日期是否在已確認範圍內"""
+        date = _to_str(date)
+        if self.known_until is not None and self._first is not None and self._first <= date <= self.known_until:
+            return True
+        return any(start <= date <= end for start, end in self._session_ranges)
+
+    def lookup(self, date):
+        """是否為交易日：True / False；超出已確認範圍回傳 None"""
+        date = _to_str(date)
+        if date in self._dates or date in self._session_dates:
+            return True
+        if datetime.strptime(date, '%Y-%m-%d').weekday() >= 5:
+            return False
+        return False if self.covers(date) else None
+
+    def is_trading_day(self, date):
+        return self.lookup(date) is True
+
+    def trading_days(self, start, end):
+        """start ~ end (含) 之間的已知交易日 (含本次執行中 API 回報的今天 / 未來交易日)"""
+        start, end = _to_str(start), _to_str(end)
+        lo = bisect.bisect_left(self._sorted, start)
+        hi = bisect.bisect_right(self._sorted, end)
+        days = self._sorted[lo:hi]
+        session = [d for d in self._session_dates if start <= d <= end and d not in self._dates]
+        return sorted(days + session) if session else days
+
+    def previous_trading_day(self, date):
+        """date 之前 (不含) 最近的交易日，沒有回傳 None"""
+        i = bisect.bisect_left(self._sorted, _to_str(date))
+        return self._sorted[i - 1] if i > 0 else None
+
+    def next_trading_day(self, date):
+        """date 之後 (不含) 最近的已知交易日，沒有回傳 None"""
+        i = bisect.bisect_right(self._sorted, _to_str(date))
+        return self._sorted[i] if i < len(self._sorted) else None
+
+    @property
+    def last_date(self):
+        return self._sorted[-1] if self._sorted else None
+
+    def __contains__(self, date):
+        date = _to_str(date)
+        return date in self._dates or date in self._session_dates
+
+    def __len__(self):
+        return len(self._sorted)
+
+
+_CALENDAR = None
+
+
+def get_calendar(refresh=True):
+    """取得共用的交易日曆 (同一程序只建立一次；refresh=True 時檢查 TAIEX.csv 是否有新資料)"""
+    global _CALENDAR
+    if _CALENDAR is None:
+        _CALENDAR = TradingCalendar()
+    elif refresh:
+        _CALENDAR.refresh()
+    return _CALENDAR
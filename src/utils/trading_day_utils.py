@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 """
-交易日判斷共用模組 (FinMind API)
+交易日判斷共用模組 (本地交易日曆 + FinMind API 備援)
 
 提供三個函數：
 1. is_trading_day(date_str, force)   - 指定日期是否為交易日
 2. is_yesterday_trading_day()        - 昨天是否為交易日（給隔天早上8點的任務用）
 3. get_last_trading_day_of_week()    - 取得該週最後一個交易日
+
+先查本地交易日曆 (utils.trading_calendar，由 TAIEX.csv 建立)，
+只有超出日曆範圍的日期才呼叫 FinMind API，查詢結果會回填到日曆。
 """
 
 import os
@@ -14,6 +17,11 @@ import time
 import requests
 from datetime import datetime, timedelta
 
+try:
+    from .trading_calendar import get_calendar
+except ImportError:
+    from trading_calendar import get_calendar
+
 
 def _query_trading_dates(start_date, end_date, max_retries=3):
     """
@@ -55,6 +63,28 @@ def _query_trading_dates(start_date, end_date, max_retries=3):
     return None
 
 
+def _ensure_calendar(start_date, end_date):
+    """
+    確保交易日曆涵蓋 start_date ~ end_date (不足的部分查詢 API 並回填)
+
+    Returns:
+        TradingCalendar 或 None (API 失敗，無法確認)
+    """
+    cal = get_calendar()
+    if cal.covers(start_date) and cal.covers(end_date):
+        return cal
+
+    # 接在日曆已確認範圍之後的查詢，從範圍的下一天開始查 (順便補齊中間的空檔)
+    query_start = start_date
+    if cal.known_until and cal.known_until < end_date and (cal.covers(start_date) or start_date > cal.known_until):
+        query_start = (datetime.strptime(cal.known_until, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    dates = _query_trading_dates(query_start, end_date)
+    if dates is None:
+        return None
+    cal.record(dates, query_start, end_date)
+    return cal
+
+
 def is_trading_day(date_str=None, force=False):
     """
     檢查指定日期是否為交易日
@@ -83,11 +113,11 @@ def is_trading_day(date_str=None, force=False):
         print(f"💤 {date_str} 是週{day_name}，非交易日。")
         return False
     
-    # 2. FinMind API 查詢
-    dates = _query_trading_dates(date_str, date_str)
-    if dates is not None:
-        if date_str in dates:
-            print(f"✅ {date_str} 確認為交易日 (FinMind API)。")
+    # 2. 本地交易日曆 (超出範圍時查詢 FinMind API)
+    cal = _ensure_calendar(date_str, date_str)
+    if cal is not None:
+        if cal.is_trading_day(date_str):
+            print(f"✅ {date_str} 確認為交易日 (交易日曆)。")
             return True
         else:
             print(f"💤 {date_str} 非交易日（可能是國定假日）。")
@@ -111,9 +141,9 @@ def is_yesterday_trading_day():
     yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
     print(f"📅 確認昨天 ({yesterday}) 是否為交易日...")
     
-    dates = _query_trading_dates(yesterday, yesterday)
-    if dates is not None:
-        if yesterday in dates:
+    cal = _ensure_calendar(yesterday, yesterday)
+    if cal is not None:
+        if cal.is_trading_day(yesterday):
             print(f"✅ 昨天 ({yesterday}) 是交易日。")
             return True
         else:
@@ -147,21 +177,22 @@ def get_last_trading_day_of_week(target_date=None):
     monday = target_dt - timedelta(days=target_dt.weekday())
     sunday = monday + timedelta(days=6)
     
-    dates = _query_trading_dates(
+    cal = _ensure_calendar(
         monday.strftime('%Y-%m-%d'),
         sunday.strftime('%Y-%m-%d')
     )
     
-    if dates is None:
+    if cal is None:
         # Fallback: 若 API 掛，用週五判斷
         print("⚠️ 無法查詢交易日清單，改用週五判斷")
         friday = monday + timedelta(days=4)
         return friday.strftime('%Y-%m-%d')
     
+    dates = cal.trading_days(monday, sunday)
     if not dates:
         return None
     
-    return sorted(dates)[-1]
+    return dates[-1]
 
 
 def is_last_trading_day_of_week(target_date=None):